@@ -1,605 +1,974 @@
-import os
-import json
-import importlib
-import traceback
-import threading
-import time
-from datetime import datetime, date
-from typing import Dict, Any, Optional, List
-
-from flask import Flask, request, jsonify
-from dotenv import load_dotenv
-
-# WAHA client (o seu wrapper)
-from services.waha import Waha
-
-load_dotenv()
-
-app = Flask(__name__)
-
-# -------------------------------------------------
-# Blueprints/Extensões
-# -------------------------------------------------
-# Mercado Pago (mantém sob try/except)
-try:
-    from services.pagamentos import pagamentos_bp
-    app.register_blueprint(pagamentos_bp, url_prefix="/mp")
-    print("[MP] Blueprint de pagamentos registrado em /mp")
-except Exception as e:
-    print("[MP] Pagamentos desativado ou falhou no registro:", e)
-
-# -------------------------------------------------
-# Configurações / Estado
-# -------------------------------------------------
-BASE_DIR = os.path.dirname(__file__)
-CONFIG_DIR = os.path.join(BASE_DIR, "config")
-
-with open(os.path.join(CONFIG_DIR, "empresas_config.json"), "r", encoding="utf-8") as f:
-    config_empresas: Dict[str, Dict[str, Any]] = json.load(f)
-
-with open(os.path.join(CONFIG_DIR, "admins_config.json"), "r", encoding="utf-8") as f:
-    admins_por_empresa: Dict[str, list] = json.load(f)
-
-
-def _normalize_chat_id(identifier: Optional[str]) -> str:
-    """Converte identificadores do WhatsApp para o formato @c.us."""
-    if identifier is None:
-        return ""
-
-    raw = str(identifier).strip()
-    if not raw:
-        return ""
-
-    if raw.startswith("+"):
-        raw = raw[1:]
-
-    if raw.endswith("@s.whatsapp.net"):
-        raw = raw.replace("@s.whatsapp.net", "@c.us")
-
-    if raw.endswith("@c.us") or raw.endswith("@g.us"):
-        return raw
-
-    digits = "".join(ch for ch in raw if ch.isdigit())
-    if digits:
-        return f"{digits}@c.us"
-
-    return raw
-
-
-# Um cliente WAHA por empresa
-waha_clients: Dict[str, Waha] = {}
-empresa_por_session: Dict[str, List[str]] = {}
-empresa_por_numero_bot: Dict[str, str] = {}
-
-for empresa, cfg in config_empresas.items():
-    base_url = cfg.get("base_url")
-    if base_url:
-        try:
-            session_cfg = cfg.get("waha_session")
-            session = session_cfg.strip() if isinstance(session_cfg, str) else None
-            if not session:
-                session = "default"
-            api_key = cfg.get("waha_api_key") or os.getenv("WAHA_API_KEY")
-            waha_clients[empresa] = Waha(base_url, session=session, api_key=api_key)
-            empresa_por_session.setdefault(session, []).append(empresa)
-            print(
-                f"[WAHA] Cliente inicializado para '{empresa}' -> {base_url} (sessão: {session})"
-            )
-        except Exception as e:
-            print(f"[WAHA] Falha ao iniciar cliente da empresa '{empresa}': {e}")
-
-    numeros_cfg: List[str] = []
-    if isinstance(cfg.get("waha_numbers"), list):
-        numeros_cfg.extend(cfg["waha_numbers"])
-    elif cfg.get("waha_numbers"):
-        numeros_cfg.append(cfg["waha_numbers"])
-
-    numero_unico = cfg.get("waha_number")
-    if numero_unico:
-        numeros_cfg.append(numero_unico)
-
-    for numero in numeros_cfg:
-        normalizado = _normalize_chat_id(numero)
-        if normalizado:
-            empresa_por_numero_bot[normalizado] = empresa
-
-# Estado de fluxo em memória, separado por empresa
-fluxo_usuario: Dict[str, Dict[str, Any]] = {empresa: {} for empresa in config_empresas.keys()}
-
-# -------------------------------------------------
-# Helpers de payload / empresa / envio
-# -------------------------------------------------
-def _extract_message_fields(payload: dict) -> Dict[str, Any]:
-    """
-    Extrai campos mesmo que o WAHA mande em formatos diferentes.
-    Suporta:
-      - { "event":"message", "data": {...} }
-      - { "event":"message", "payload": {...} }
-      - { "data": {"messages": [ {...} ]} }
-      - { "messages": [ {...} ] }
-      - flat { "from","chatId","body","text","timestamp","id" ... }
-    """
-    data = (payload.get("data")
-            or payload.get("payload")
-            or payload
-            or {})
-
-    # Alguns eventos do WAHA chegam como lista dentro de "data"
-    if isinstance(data, list) and data:
-        data = data[0]
-
-    msg_obj = None
-
-    # 1) Objeto simples (payload "flat" do WAHA ou legacy)
-    if isinstance(data, dict) and any(k in data for k in ("body", "text", "from", "chatId", "sender", "to", "fromMe", "timestamp", "t", "id", "messages", "message")):
-        msg_obj = data
-
-    # 2) Lista messages dentro de data/payload
-    if isinstance(data, dict) and isinstance(data.get("messages"), list) and data["messages"]:
-        msg_obj = data["messages"][0]
-
-    # 3) Lista messages na raiz
-    if msg_obj is None and isinstance(payload.get("messages"), list) and payload["messages"]:
-        msg_obj = payload["messages"][0]
-
-    msg_obj = msg_obj or {}
-
-    text = msg_obj.get("body") or msg_obj.get("text") or ""
-    if not isinstance(text, str):
-        text = str(text)
-    text = text.strip()
-    chat_id = msg_obj.get("from") or msg_obj.get("chatId") or msg_obj.get("chat_id") or msg_obj.get("sender") or ""
-    to = msg_obj.get("to") or ""
-    from_me = bool(msg_obj.get("fromMe") or data.get("fromMe"))
-
-    # Eventos recentes do WAHA usam a estrutura messages.upsert com "message" aninhado
-    if not text and isinstance(msg_obj.get("message"), dict):
-        message_node = msg_obj["message"]
-        text = (
-            message_node.get("conversation")
-            or message_node.get("extendedTextMessage", {}).get("text")
-            or message_node.get("ephemeralMessage", {}).get("message", {}).get("extendedTextMessage", {}).get("text")
-            or message_node.get("buttonsResponseMessage", {}).get("selectedDisplayText")
-            or ""
-        ).strip()
-
-        key_data = msg_obj.get("key", {}) if isinstance(msg_obj.get("key"), dict) else {}
-        if not chat_id:
-            chat_id = (
-                key_data.get("remoteJid")
-                or msg_obj.get("chatId")
-                or msg_obj.get("chat_id")
-                or ""
-            )
-        if not to:
-            to = key_data.get("participant") or key_data.get("from") or ""
-        if "fromMe" not in msg_obj and key_data:
-            from_me = bool(key_data.get("fromMe"))
-
-    if not chat_id and isinstance(msg_obj.get("key"), dict):
-        chat_id = msg_obj["key"].get("remoteJid", "")
-
-    chat_id = str(chat_id or "").strip()
-    if chat_id.endswith("@s.whatsapp.net"):
-        chat_id = chat_id.replace("@s.whatsapp.net", "@c.us")
-    to = str(to or "").strip()
-    from_me = bool(from_me)
-
-    ts = (
-        msg_obj.get("timestamp")
-        or msg_obj.get("t")
-        or msg_obj.get("messageTimestamp")
-        or data.get("timestamp")
-        or data.get("t")
-    )
-    try:
-        ts = int(ts)
-        if ts > 10**12:  # se vier em ms, converte para s
-            ts = ts // 1000
-    except Exception:
-        ts = None
-
-    msg_id = None
-    mid = msg_obj.get("id") or data.get("id")
-    if isinstance(mid, dict):
-        msg_id = mid.get("_serialized") or mid.get("id")
-    elif isinstance(mid, str):
-        msg_id = mid
-
-    # Empresa/sessão que às vezes vem no webhook
-    empresa_hint = payload.get("empresa") or data.get("empresa")
-    session = (
-        payload.get("session")
-        or data.get("session")
-        or payload.get("sessionId")
-        or data.get("sessionId")
-        or payload.get("session_id")
-        or data.get("session_id")
-        or payload.get("instanceId")
-        or data.get("instanceId")
-        or payload.get("instance_id")
-        or data.get("instance_id")
-    )
-
-    owner = None
-    owner_node = None
-    if isinstance(data.get("owner"), dict):
-        owner_node = data.get("owner")
-    elif isinstance(msg_obj.get("owner"), dict):
-        owner_node = msg_obj.get("owner")
-
-    if owner_node:
-        owner = owner_node.get("id") or owner_node.get("wid") or owner_node.get("number")
-
-    if not owner:
-        possible_owner = msg_obj.get("from") if from_me else msg_obj.get("to")
-        owner = possible_owner
-
-    owner = _normalize_chat_id(owner)
-
-    return {
-        "data": data,
-        "msg": text,
-        "chat_id": chat_id,
-        "to": to,
-        "owner": owner,
-        "from_me": from_me,
-        "ts": ts,
-        "msg_id": msg_id,
-        "empresa_hint": empresa_hint,
-        "session": session,
-    }
-
-def _is_group(chat_id: str) -> bool:
-    return "@g.us" in (chat_id or "")
-
-def _resolve_empresa(payload_fields: Dict[str, Any]) -> Optional[str]:
-    """
-    Determina a 'empresa' da mensagem:
-    1) query string ?empresa=...
-    2) header X-Empresa
-    3) payload['empresa'] (ou data/payload interno)
-    4) session configurada no WAHA (waha_session em config)
-    5) se houver UMA única empresa no config, usa ela
-    6) fallback para 'empresa1'
-    """
-    q = request.args.get("empresa")
-    if q and q in config_empresas:
-        return q
-
-    h = request.headers.get("X-Empresa")
-    if h and h in config_empresas:
-        return h
-
-    hint = payload_fields.get("empresa_hint")
-    if hint and hint in config_empresas:
-        return hint
-
-    session = payload_fields.get("session")
-    if isinstance(session, dict):
-        session = (
-            session.get("name")
-            or session.get("id")
-            or session.get("session")
-            or session.get("sessionId")
-        )
-
-    if session:
-        session = str(session)
-        candidatos = empresa_por_session.get(session)
-        if candidatos and len(candidatos) == 1:
-            return candidatos[0]
-
-    owner = _normalize_chat_id(payload_fields.get("owner"))
-    if owner and owner in empresa_por_numero_bot:
-        return empresa_por_numero_bot[owner]
-
-    to = _normalize_chat_id(payload_fields.get("to"))
-    if to and to in empresa_por_numero_bot:
-        return empresa_por_numero_bot[to]
-
-    # se só tem uma empresa configurada, retorna ela
-    if len(config_empresas) == 1:
-        return next(iter(config_empresas.keys()))
-    
-    # fallback comum ao seu compose
-
-    return "empresa1" if "empresa1" in config_empresas else None
-
-def _get_waha_for(empresa: str) -> Optional[Waha]:
-    return waha_clients.get(empresa)
-
-def _dispatch_to_flow(empresa: str, chat_id: str, msg: str):
-    """
-    Carrega o módulo de fluxo da empresa e delega a mensagem.
-    Tenta:
-      - scripts_empresas.<empresa>  (compat)
-      - <empresa>.fluxo             (seu layout atual com pacote 'empresa1')
-    Faz roteamento admin/cliente conforme admins_config.
-    """
-    # cliente WAHA
-    waha = _get_waha_for(empresa)
-    if not waha:
-        return jsonify({"status": "error", "message": f"WAHA não configurado para '{empresa}'"}), 500
-
-    # importa o módulo
-    modulo = None
-    try:
-        modulo = importlib.import_module(f"scripts_empresas.{empresa}")
-    except ModuleNotFoundError:
-        # tenta layout do seu 'empresa1.fluxo'
-        try:
-            modulo = importlib.import_module(f"{empresa}.fluxo")
-        except ModuleNotFoundError:
-            return jsonify({"status": "error", "message": f"Módulo de fluxo para '{empresa}' não encontrado."}), 500
-        except Exception as e:
-            traceback.print_exc()
-            return jsonify({"status": "error", "message": f"Falha importando {empresa}.fluxo: {e}"}), 500
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"status": "error", "message": f"Falha importando scripts_empresas.{empresa}: {e}"}), 500
-
-    # estado da empresa
-    if empresa not in fluxo_usuario:
-        fluxo_usuario[empresa] = {}
-
-    # escolhe rota admin x normal
-    try:
-        if chat_id in set(admins_por_empresa.get(empresa, [])):
-            if hasattr(modulo, "processar_admin"):
-                return modulo.processar_admin(chat_id, msg, empresa, waha)
-            else:
-                return jsonify({"status": "error", "message": "Função processar_admin não encontrada."}), 500
-
-        if hasattr(modulo, "processar"):
-            return modulo.processar(chat_id, msg, empresa, waha, fluxo_usuario[empresa])
-
-        return jsonify({"status": "error", "message": "Função processar não encontrada."}), 500
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"status": "error", "message": str(e)}), 500
-
-# -------------------------------------------------
-# Rotas básicas / saúde
-# -------------------------------------------------
-@app.get("/")
-def index():
-    return jsonify({
-        "ok": True,
-        "ts": datetime.utcnow().isoformat(),
-        "empresas": list(config_empresas.keys())
-    }), 200
-
-@app.get("/health")
-def health():
-    return jsonify({"status": "ok"}), 200
-
-# -------------------------------------------------
-# Webhooks
-# -------------------------------------------------
-@app.post("/waha/webhook")
-def waha_webhook():
-    """
-    Endpoint para os containers WAHA chamarem.
-    No seu docker-compose: WEBHOOK_URL=http://api:8000/waha/webhook
-    Você pode opcionalmente passar ?empresa=empresa1.
-    """
-    payload = request.get_json(silent=True, force=True) or {}
-    fields = _extract_message_fields(payload)
-
-    # Logs brutos úteis
-    try:
-        app.logger.info({"waha_webhook_raw": payload})
-        app.logger.info({"waha_webhook_norm": {
-            "from": fields["chat_id"], "text": fields["msg"],
-            "fromMe": fields["from_me"], "ts": fields["ts"], "id": fields["msg_id"],
-            "owner": fields["owner"], "to": fields["to"],
-        }})
-    except Exception:
-        pass
-
-    # Filtros básicos
-    if fields["from_me"]:
-        return jsonify({"status": "ignored", "reason": "fromMe"}), 200
-    if not fields["chat_id"] or not fields["msg"]:
-        return jsonify({"status": "ignored", "reason": "empty"}), 200
-    if _is_group(fields["chat_id"]):
-        return jsonify({"status": "ignored", "reason": "group"}), 200
-
-    empresa = _resolve_empresa(fields)
-    if not empresa:
-        return jsonify({"status": "error", "message": "Não foi possível resolver a empresa."}), 400
-
-    try:
-        app.logger.info({
-            "empresa_resolvida": empresa,
-            "chat_id": fields.get("chat_id"),
-            "session": fields.get("session"),
-            "owner": fields.get("owner"),
-            "to": fields.get("to"),
-        })
-    except Exception:
-        pass
-
-    return _dispatch_to_flow(empresa, fields["chat_id"], fields["msg"])
-
-# Compatibilidade com sua rota antiga dinâmica
-@app.post("/webhook/<empresa>")
-def webhook_dinamico(empresa: str):
-    payload = request.get_json(force=True, silent=True) or {}
-
-    # tenta extrair de forma mais simples também
-    chat_id = None
-    texto = ""
-
-    # formato legado
-    if isinstance(payload.get("payload"), dict):
-        p = payload["payload"]
-        chat_id = p.get("from") or p.get("chatId") or p.get("chat_id")
-        texto = p.get("body") or p.get("text") or p.get("message") or ""
-
-    # *** CORREÇÃO DE INDENTAÇÃO AQUI ***
-    # Estas linhas estavam indentadas errado
-    chat_id = _normalize_chat_id(chat_id or payload.get("chat_id") or payload.get("chatId"))
-    texto = (texto or payload.get("text") or payload.get("message") or payload.get("body") or "").strip()
-
-    # se não conseguiu, usa o extrator robusto
-    if not chat_id or not texto:
-        fields = _extract_message_fields(payload)
-        chat_id = fields["chat_id"]
-        texto = fields["msg"]
-
-        # filtros
-        if fields["from_me"]:
-            return jsonify({"status": "ignored", "reason": "fromMe"}), 200
-
-    if not chat_id or not texto:
-        return jsonify({"status": "ignored"}), 200
-
-    if _is_group(chat_id):
-        return jsonify({"status": "ignored", "reason": "group"}), 200
-
-    if empresa not in config_empresas:
-        return jsonify({"status": "error", "message": f"Empresa '{empresa}' não encontrada."}), 404
-
-    return _dispatch_to_flow(empresa, chat_id, texto)
-
-print("[WAHA] Webhook registrado em /waha/webhook")
-
-# -------------------------------------------------
-# Agendador (opcional) — mantido do seu código
-# -------------------------------------------------
-ENABLE_SCHEDULER = False
-SCHEDULER_INTERVAL_SEC = int(os.getenv("SCHEDULER_INTERVAL_SEC", "60"))
-PIX_REMINDER_WINDOW_MIN = int(os.getenv("PIX_REMINDER_WINDOW_MIN", "5"))
-
-_reminded_expiring = {empresa: set() for empresa in config_empresas.keys()}
-_notified_expired = {empresa: set() for empresa in config_empresas.keys()}
-
-def _send_whatsapp(waha: Waha, chat_id: str, text: str):
-    try:
-        waha.send_message(chat_id, text)
-    except Exception as e:
-        print(f"[SCHED] Falha ao enviar mensagem WhatsApp: {e}")
-
-def _fmt_date(d) -> str:
-    if isinstance(d, date):
-        return d.strftime("%d/%m/%Y")
-    try:
-        return datetime.fromisoformat(str(d)).strftime("%d/%m/%Y")
-    except Exception:
-        return str(d)
-
-def _scheduler_loop():
-    while True:
-        try:
-            for empresa in list(config_empresas.keys()):
-                waha = _get_waha_for(empresa)
-                if not waha:
-                    continue
-
-                try:
-                    agenda = importlib.import_module(f"scripts_empresas.{empresa}.agenda")
-                except Exception as e:
-                    print(f"[SCHED] Não consegui importar agenda de {empresa}: {e}")
-                    continue
-
-                # 1) Lembretes — prestes a expirar
-                candidatos = []
-                try:
-                    if hasattr(agenda, "listar_pendentes_prestes_a_expirar"):
-                        candidatos = agenda.listar_pendentes_prestes_a_expirar(janela_min=PIX_REMINDER_WINDOW_MIN)
-                except Exception as e:
-                    print(f"[SCHED] erro listar_pendentes_prestes_a_expirar({empresa}): {e}")
-
-                now = datetime.now()
-                for c in candidatos or []:
-                    ag_id = str(c.get("AgendamentoID") or "")
-                    if not ag_id or ag_id in _reminded_expiring[empresa]:
-                        continue
-                    chat_id = str(c.get("ChatID") or "")
-                    if not chat_id:
-                        continue
-
-                    exp_str = str(c.get("Expira_em") or "")
-                    try:
-                        exp_dt = datetime.strptime(exp_str, "%d/%m/%Y %H:%M:%S")
-                        mins_left = max(1, int((exp_dt - now).total_seconds() // 60))
-                    except Exception:
-                        mins_left = PIX_REMINDER_WINDOW_MIN
-
-                    data_txt = _fmt_date(c.get("Data"))
-                    horario_txt = str(c.get("Horário") or "")
-                    servico = str(c.get("Serviço") or "seu horário")
-                    msg = (
-                        "⏳ *Falta pouco para sua reserva expirar!*\n\n"
-                        f"💈 {servico}\n"
-                        f"📅 {data_txt}  🕒 {horario_txt}\n"
-                        f"⏱️ Expira em ~{mins_left} min.\n\n"
-                        "Se quiser garantir, finalize o pagamento agora. "
-                        "Envie *reenviar pix* para receber o código de novo."
-                    )
-                    _send_whatsapp(waha, chat_id, msg)
-                    _reminded_expiring[empresa].add(ag_id)
-
-                # 2) Expirados — detectar quem virou "Expirado" agora
-                try:
-                    df_before = agenda.carregar_agendamentos()
-                    pend_before = set(
-                        df_before[df_before["Status"] == "Pendente"]["AgendamentoID"].astype(str).tolist()
-                    )
-                except Exception as e:
-                    print(f"[SCHED] erro carregar_agendamentos(before) {empresa}: {e}")
-                    pend_before = set()
-
-                try:
-                    agenda.limpar_expirados()
-                except Exception as e:
-                    print(f"[SCHED] erro limpar_expirados {empresa}: {e}")
-
-                try:
-                    df_after = agenda.carregar_agendamentos()
-                except Exception as e:
-                    print(f"[SCHED] erro carregar_agendamentos(after) {empresa}: {e}")
-                    df_after = None
-
-                if df_after is not None:
-                    try:
-                        expired_rows = df_after[df_after["Status"] == "Expirado"]
-                        for _, row in expired_rows.iterrows():
-                            ag_id = str(row.get("AgendamentoID") or "")
-                            if not ag_id or ag_id not in pend_before:
-                                continue
-                            if ag_id in _notified_expired[empresa]:
-                                continue
-
-                            chat_id = str(row.get("ChatID") or "")
-                            if not chat_id:
-                                continue
-
-                            servico = str(row.get("Serviço") or "seu horário")
-                            data_txt = _fmt_date(row.get("Data"))
-                            horario_txt = str(row.get("Horário") or "")
-                            msg = (
-                                "⏰ *Sua reserva expirou por falta de pagamento.*\n\n"
-                                f"💈 {servico}\n"
-                                f"📅 {data_txt}  🕒 {horario_txt}\n\n"
-                                "Quer tentar de novo? Digite *agendar* para escolher outro horário."
-                            )
-                            _send_whatsapp(waha, chat_id, msg)
-                            _notified_expired[empresa].add(ag_id)
-                    except Exception as e:
-                        print(f"[SCHED] erro processando expirados {empresa}: {e}")
-
-        except Exception as loop_e:
-            print(f"[SCHED] erro no loop: {loop_e}")
-
-        time.sleep(SCHEDULER_INTERVAL_SEC)
-
-# Execução local (em produção use gunicorn: app:app)
-if __name__ == "__main__":
-    if ENABLE_SCHEDULER:
-        t = threading.Thread(target=_scheduler_loop, name="scheduler", daemon=True)
-        t.start()
-        print(f"[SCHED] Agendador iniciado (intervalo {SCHEDULER_INTERVAL_SEC}s, janela {PIX_REMINDER_WINDOW_MIN}min)")
-    app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
+import os
+import re
+import logging
+import pathlib
+import importlib
+import functools
+import collections
+import collections.abc
+import traceback
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, date
+from typing import Dict, Any, Optional, List, Mapping
+
+import orjson
+from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+from dotenv import load_dotenv
+
+# WAHA client (o seu wrapper)
+from services.waha import Waha
+
+load_dotenv()
+
+class _OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON do Flask via orjson: request.get_json() e jsonify() dos blueprints
+    (webhooks do MP inclusive) passam a decodificar/serializar em C.
+    Saída indentada (debug) e o que o orjson não aceita caem no provider padrão.
+    """
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def dumps(self, obj, **kwargs):
+        if kwargs.get("indent") is None:
+            opt = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME  # datas no formato do Flask (default)
+            if self.sort_keys:
+                opt |= orjson.OPT_SORT_KEYS
+            try:
+                return orjson.dumps(obj, default=self.default, option=opt).decode("utf-8")
+            except orjson.JSONEncodeError:
+                pass
+        return super().dumps(obj, **kwargs)
+
+app = Flask(__name__)
+app.json = _OrjsonProvider(app)
+
+# -------------------------------------------------
+# Blueprints/Extensões
+# -------------------------------------------------
+# Mercado Pago (mantém sob try/except)
+try:
+    from services.pagamentos import pagamentos_bp
+    app.register_blueprint(pagamentos_bp, url_prefix="/mp")
+    print("[MP] Blueprint de pagamentos registrado em /mp")
+except Exception as e:
+    print("[MP] Pagamentos desativado ou falhou no registro:", e)
+
+# -------------------------------------------------
+# Configurações / Estado
+# -------------------------------------------------
+BASE_DIR = os.path.dirname(__file__)
+CONFIG_DIR = os.path.join(BASE_DIR, "config")
+
+config_empresas: Dict[str, Dict[str, Any]] = orjson.loads(
+    pathlib.Path(CONFIG_DIR, "empresas_config.json").read_bytes()
+)
+admins_por_empresa: Dict[str, list] = orjson.loads(
+    pathlib.Path(CONFIG_DIR, "admins_config.json").read_bytes()
+)
+# Conjunto de admins pronto para lookup O(1) a cada mensagem
+admins_set_por_empresa: Dict[str, frozenset] = {
+    empresa: frozenset(admins) for empresa, admins in admins_por_empresa.items()
+}
+
+_WA_NET_SUFFIX = "@s.whatsapp.net"
+_WA_NET_SUFFIX_LEN = len(_WA_NET_SUFFIX)
+
+# Caso comum num único match: [+]dígitos[@s.whatsapp.net|@c.us|@g.us]
+_CHAT_ID_RE = re.compile(r"\+?([0-9]+)(@s\.whatsapp\.net|@c\.us|@g\.us)?")
+
+# Tabela de deleção: tudo que não for dígito ASCII (usada com bytes.translate)
+_NON_DIGITS = bytes(b for b in range(256) if not 0x30 <= b <= 0x39)
+
+def _normalize_chat_id(identifier: Optional[str]) -> str:
+    """Converte identificadores do WhatsApp para o formato @c.us."""
+    if identifier is None:
+        return ""
+
+    raw = str(identifier).strip()
+    if not raw:
+        return ""
+
+    m = _CHAT_ID_RE.fullmatch(raw)
+    if m:
+        digits, suffix = m.groups()
+        return digits + ("@g.us" if suffix == "@g.us" else "@c.us")
+
+    # formatos irregulares (espaços, hífens, ids não numéricos)
+    if raw.startswith("+"):
+        raw = raw[1:]
+
+    if raw.endswith(_WA_NET_SUFFIX):
+        raw = raw[:-_WA_NET_SUFFIX_LEN] + "@c.us"
+
+    if raw.endswith(("@c.us", "@g.us")):
+        return raw
+
+    digits = raw.encode("ascii", "ignore").translate(None, _NON_DIGITS).decode("ascii")
+    if digits:
+        return f"{digits}@c.us"
+
+    return raw
+
+
+# Um cliente WAHA por empresa
+waha_clients: Dict[str, Waha] = {}
+empresa_por_session: Dict[str, List[str]] = {}
+empresa_por_numero_bot: Dict[str, str] = {}
+
+for empresa, cfg in config_empresas.items():
+    base_url = cfg.get("base_url")
+    if base_url:
+        try:
+            session_cfg = cfg.get("waha_session")
+            session = session_cfg.strip() if isinstance(session_cfg, str) else None
+            if not session:
+                session = "default"
+            api_key = cfg.get("waha_api_key") or os.getenv("WAHA_API_KEY")
+            waha_clients[empresa] = Waha(base_url, session=session, api_key=api_key)
+            empresa_por_session.setdefault(session, []).append(empresa)
+            print(
+                f"[WAHA] Cliente inicializado para '{empresa}' -> {base_url} (sessão: {session})"
+            )
+        except Exception as e:
+            print(f"[WAHA] Falha ao iniciar cliente da empresa '{empresa}': {e}")
+
+    numeros_cfg: List[str] = []
+    if isinstance(cfg.get("waha_numbers"), list):
+        numeros_cfg.extend(cfg["waha_numbers"])
+    elif cfg.get("waha_numbers"):
+        numeros_cfg.append(cfg["waha_numbers"])
+
+    numero_unico = cfg.get("waha_number")
+    if numero_unico:
+        numeros_cfg.append(numero_unico)
+
+    for numero in numeros_cfg:
+        normalizado = _normalize_chat_id(numero)
+        if normalizado:
+            empresa_por_numero_bot[normalizado] = empresa
+
+# Tabelas de roteamento prontas no boot:
+# - deploy com uma única empresa dispensa qualquer resolução por mensagem
+# - sessões que apontam para exatamente uma empresa viram lookup direto
+_single_empresa: Optional[str] = next(iter(config_empresas)) if len(config_empresas) == 1 else None
+_session_to_empresa: Dict[str, str] = {
+    session: candidatos[0]
+    for session, candidatos in empresa_por_session.items()
+    if len(candidatos) == 1
+}
+
+# Limites do estado por chat: quem fica FLUXO_TTL_SEC sem mandar mensagem é descartado
+# (volta ao menu na próxima) e nunca passam de FLUXO_MAX_CHATS por empresa (sai o menos recente)
+FLUXO_MAX_CHATS = int(os.getenv("FLUXO_MAX_CHATS", "10000"))
+FLUXO_TTL_SEC = float(os.getenv("FLUXO_TTL_SEC", str(24 * 3600)))
+
+class _EstadosPorChat(collections.abc.MutableMapping):
+    """
+    chat_id -> estado do fluxo, com LRU + expiração por inatividade.
+    Ler um chat renova o prazo dele. Thread-safe: chats diferentes rodam em paralelo no pool.
+    Os fluxos recebem o mesmo objeto de estado enquanto ele estiver aqui (mutam no lugar).
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self._maxsize = maxsize
+        self._ttl = ttl
+        self._dados: "collections.OrderedDict[str, tuple]" = collections.OrderedDict()  # chat -> (último uso, estado)
+        self._lock = threading.Lock()
+
+    def _expirar(self, agora: float):
+        # ordem = último uso: os vencidos estão sempre no começo
+        dados = self._dados
+        while dados:
+            chave, (ts, _) = next(iter(dados.items()))
+            if agora - ts < self._ttl:
+                break
+            del dados[chave]
+
+    def __getitem__(self, chat_id):
+        agora = time.monotonic()
+        with self._lock:
+            self._expirar(agora)
+            _, estado = self._dados[chat_id]
+            self._dados[chat_id] = (agora, estado)
+            self._dados.move_to_end(chat_id)
+            return estado
+
+    def __setitem__(self, chat_id, estado):
+        agora = time.monotonic()
+        with self._lock:
+            self._dados[chat_id] = (agora, estado)
+            self._dados.move_to_end(chat_id)
+            self._expirar(agora)
+            while len(self._dados) > self._maxsize:
+                self._dados.popitem(last=False)
+
+    def __delitem__(self, chat_id):
+        with self._lock:
+            del self._dados[chat_id]
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._dados))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._dados)
+
+# Estado de fluxo em memória, separado por empresa
+# (o dict externo é congelado: empresas não mudam depois do boot; só o estado por chat é mutável)
+fluxo_usuario: Mapping[str, _EstadosPorChat] = types.MappingProxyType(
+    {empresa: _EstadosPorChat(FLUXO_MAX_CHATS, FLUXO_TTL_SEC) for empresa in config_empresas.keys()}
+)
+
+# -------------------------------------------------
+# Helpers de payload / empresa / envio
+# -------------------------------------------------
+WEBHOOK_MAX_BYTES = int(os.getenv("WEBHOOK_MAX_BYTES", str(256 * 1024)))
+
+# Eventos do WAHA que nunca viram mensagem para o fluxo (status de sessão, recibos de entrega...)
+_IGNORED_EVENTS = frozenset({"session.status", "message.ack", "message.revoked", "message.reaction", "presence.update"})
+
+def _reject_early():
+    """
+    Descarta o webhook antes de ler/parsear o corpo quando dá para decidir pelos headers.
+    Devolve a resposta pronta ou None para seguir o processamento normal.
+    """
+    size = request.content_length
+    if size and size > WEBHOOK_MAX_BYTES:
+        print(f"[WAHA] Payload de {size} bytes recusado (limite {WEBHOOK_MAX_BYTES})")
+        return _ojsonify({"status": "error", "message": "payload muito grande"}), 413
+
+    event = request.headers.get("X-Webhook-Event")
+    if event and event in _IGNORED_EVENTS:
+        return _ojsonify({"status": "ignored", "reason": "event"}), 200
+    return None
+
+def _is_ignored_event(payload: dict) -> bool:
+    """Eventos que não são de mensagem saem com um único lookup, antes do extrator."""
+    event = payload.get("event")
+    if not event or type(event) is not str:
+        return False
+    return event in _IGNORED_EVENTS or not event.startswith("message")
+
+def _parse_json() -> Dict[str, Any]:
+    """Lê o corpo cru com orjson (equivale a get_json(force=True, silent=True))."""
+    data = request.get_data(cache=False)
+    if not data:
+        return {}
+    try:
+        payload = orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+def _ojsonify(obj: Any):
+    """jsonify via orjson para as respostas dos webhooks."""
+    return app.response_class(orjson.dumps(obj), mimetype="application/json")
+
+# Chaves que indicam um objeto de mensagem e candidatas de cada campo,
+# em ordem de prioridade
+_MSG_KEYS = frozenset((
+    "body", "text", "from", "chatId", "sender", "to", "fromMe",
+    "timestamp", "t", "id", "messages", "message",
+))
+_TEXT_KEYS = ("body", "text")
+_CHAT_ID_KEYS = ("from", "chatId", "chat_id", "sender")
+_MSG_TS_KEYS = ("timestamp", "t", "messageTimestamp")
+_DATA_TS_KEYS = ("timestamp", "t")
+_SESSION_KEYS = ("session", "sessionId", "session_id", "instanceId", "instance_id")
+
+def _first(keys: tuple, *nodes: dict) -> Any:
+    """Primeiro valor não vazio de `keys`, testando cada chave em todos os `nodes`."""
+    for k in keys:
+        for node in nodes:
+            v = node.get(k)
+            if v:
+                return v
+    return None
+
+def _jlog(obj: Any):
+    """Loga um dict em INFO já serializado como JSON (orjson)."""
+    if not app.logger.isEnabledFor(logging.INFO):
+        return
+    try:
+        app.logger.info(orjson.dumps(obj).decode("utf-8"))
+    except Exception:
+        pass
+
+def _extract_message_fields(payload: dict) -> Dict[str, Any]:
+    """
+    Extrai campos mesmo que o WAHA mande em formatos diferentes.
+    Suporta:
+      - { "event":"message", "data": {...} }
+      - { "event":"message", "payload": {...} }
+      - { "data": {"messages": [ {...} ]} }
+      - { "messages": [ {...} ] }
+      - flat { "from","chatId","body","text","timestamp","id" ... }
+    """
+    data = (payload.get("data")
+            or payload.get("payload")
+            or payload
+            or {})
+
+    # Alguns eventos do WAHA chegam como lista dentro de "data"
+    if isinstance(data, list) and data:
+        data = data[0]
+
+    msg_obj = None
+    data_is_dict = isinstance(data, dict)
+
+    # 1) Objeto simples (payload "flat" do WAHA ou legacy)
+    if data_is_dict and not _MSG_KEYS.isdisjoint(data):
+        msg_obj = data
+
+    # 2) Lista messages dentro de data/payload
+    if data_is_dict and isinstance(data.get("messages"), list) and data["messages"]:
+        msg_obj = data["messages"][0]
+
+    # 3) Lista messages na raiz
+    if msg_obj is None and isinstance(payload.get("messages"), list) and payload["messages"]:
+        msg_obj = payload["messages"][0]
+
+    msg_obj = msg_obj or {}
+
+    text = _first(_TEXT_KEYS, msg_obj) or ""
+    if not isinstance(text, str):
+        text = str(text)
+    text = text.strip()
+    chat_id = _first(_CHAT_ID_KEYS, msg_obj) or ""
+    to = msg_obj.get("to") or ""
+    # só é usado por truthiness; dispensa o bool()
+    from_me = msg_obj.get("fromMe") or data.get("fromMe") or False
+
+    # Eventos recentes do WAHA usam a estrutura messages.upsert com "message" aninhado
+    if not text and isinstance(msg_obj.get("message"), dict):
+        message_node = msg_obj["message"]
+        text = (
+            message_node.get("conversation")
+            or message_node.get("extendedTextMessage", {}).get("text")
+            or message_node.get("ephemeralMessage", {}).get("message", {}).get("extendedTextMessage", {}).get("text")
+            or message_node.get("buttonsResponseMessage", {}).get("selectedDisplayText")
+            or ""
+        ).strip()
+
+        key_data = msg_obj.get("key", {}) if isinstance(msg_obj.get("key"), dict) else {}
+        if not chat_id:
+            chat_id = (
+                key_data.get("remoteJid")
+                or msg_obj.get("chatId")
+                or msg_obj.get("chat_id")
+                or ""
+            )
+        if not to:
+            to = key_data.get("participant") or key_data.get("from") or ""
+        if "fromMe" not in msg_obj and key_data:
+            from_me = key_data.get("fromMe") or False
+
+    if not chat_id and isinstance(msg_obj.get("key"), dict):
+        chat_id = msg_obj["key"].get("remoteJid", "")
+
+    chat_id = str(chat_id or "").strip()
+    if chat_id.endswith(_WA_NET_SUFFIX):
+        chat_id = chat_id[:-_WA_NET_SUFFIX_LEN] + "@c.us"
+    to = str(to or "").strip()
+
+    ts = _first(_MSG_TS_KEYS, msg_obj) or _first(_DATA_TS_KEYS, data)
+    try:
+        ts = int(ts)
+        if ts > 10**12:  # se vier em ms, converte para s
+            ts = ts // 1000
+    except Exception:
+        ts = None
+
+    mid = msg_obj.get("id") or data.get("id")
+    mid_t = type(mid)
+    if mid_t is dict:
+        msg_id = mid.get("_serialized") or mid.get("id")
+    else:
+        msg_id = mid if mid_t is str else None
+
+    # Empresa/sessão que às vezes vem no webhook
+    empresa_hint = payload.get("empresa") or data.get("empresa")
+    session = _first(_SESSION_KEYS, payload, data)
+
+    # payloads são JSON puro: `type(x) is dict` basta e evita o isinstance
+    owner_node = data.get("owner")
+    if type(owner_node) is not dict:
+        owner_node = msg_obj.get("owner")
+        if type(owner_node) is not dict:
+            owner_node = None
+
+    owner = owner_node and (owner_node.get("id") or owner_node.get("wid") or owner_node.get("number"))
+    if not owner:
+        owner = msg_obj.get("from") if from_me else msg_obj.get("to")
+
+    owner = _normalize_chat_id(owner) if owner else ""
+
+    return {
+        "data": data,
+        "msg": text,
+        "chat_id": chat_id,
+        "to": to,
+        "owner": owner,
+        "from_me": from_me,
+        "ts": ts,
+        "msg_id": msg_id,
+        "empresa_hint": empresa_hint,
+        "session": session,
+    }
+
+def _is_group(chat_id: str) -> bool:
+    return bool(chat_id) and chat_id.endswith("@g.us")
+
+def _resolve_empresa(payload_fields: Dict[str, Any]) -> Optional[str]:
+    """
+    Determina a 'empresa' da mensagem (se houver UMA única empresa no
+    config, usa ela direto):
+    1) query string ?empresa=...
+    2) header X-Empresa
+    3) payload['empresa'] (ou data/payload interno)
+    4) session configurada no WAHA (waha_session em config)
+    5) fallback para 'empresa1'
+    """
+    if _single_empresa is not None:
+        return _single_empresa
+
+    q = request.args.get("empresa")
+    if q and q in config_empresas:
+        return q
+
+    h = request.headers.get("X-Empresa")
+    if h and h in config_empresas:
+        return h
+
+    hint = payload_fields.get("empresa_hint")
+    if hint and hint in config_empresas:
+        return hint
+
+    session = payload_fields.get("session")
+    if isinstance(session, dict):
+        session = (
+            session.get("name")
+            or session.get("id")
+            or session.get("session")
+            or session.get("sessionId")
+        )
+
+    if session:
+        empresa = _session_to_empresa.get(str(session))
+        if empresa:
+            return empresa
+
+    owner = _normalize_chat_id(payload_fields.get("owner"))
+    if owner and owner in empresa_por_numero_bot:
+        return empresa_por_numero_bot[owner]
+
+    to = _normalize_chat_id(payload_fields.get("to"))
+    if to and to in empresa_por_numero_bot:
+        return empresa_por_numero_bot[to]
+
+    # fallback comum ao seu compose
+
+    return "empresa1" if "empresa1" in config_empresas else None
+
+# Módulos de fluxo já resolvidos (evita import_module a cada webhook)
+_FLOW_NOT_FOUND = object()
+# empresa -> {"user": processar, "admin": processar_admin}, resolvido no primeiro uso
+_flow_descriptors: Dict[str, Any] = {}
+
+def _get_waha_for(empresa: str) -> Optional[Waha]:
+    return waha_clients.get(empresa)
+
+def _build_flow_descriptor(empresa: str):
+    """
+    Importa o módulo de fluxo da empresa uma única vez e guarda os callables já resolvidos.
+    Tenta:
+      - scripts_empresas.<empresa>  (compat)
+      - <empresa>.fluxo             (seu layout atual com pacote 'empresa1')
+    Falhas de import levantam RuntimeError e não ficam em cache (nova tentativa na próxima mensagem).
+    """
+    try:
+        modulo = importlib.import_module(f"scripts_empresas.{empresa}")
+    except ModuleNotFoundError:
+        # tenta layout do seu 'empresa1.fluxo'
+        try:
+            modulo = importlib.import_module(f"{empresa}.fluxo")
+        except ModuleNotFoundError:
+            modulo = None
+        except Exception as e:
+            raise RuntimeError(f"Falha importando {empresa}.fluxo: {e}") from e
+    except Exception as e:
+        raise RuntimeError(f"Falha importando scripts_empresas.{empresa}: {e}") from e
+
+    if modulo is None:
+        desc = _FLOW_NOT_FOUND
+    else:
+        desc = {
+            "user": getattr(modulo, "processar", None),
+            "admin": getattr(modulo, "processar_admin", None),
+        }
+    _flow_descriptors[empresa] = desc
+    return desc
+
+def _dispatch_to_flow(empresa: str, chat_id: str, msg: str):
+    """
+    Delega a mensagem ao fluxo da empresa.
+    Faz roteamento admin/cliente conforme admins_config.
+    """
+    # cliente WAHA
+    waha = _get_waha_for(empresa)
+    if not waha:
+        return _ojsonify({"status": "error", "message": f"WAHA não configurado para '{empresa}'"}), 500
+
+    desc = _flow_descriptors.get(empresa)
+    if desc is None:
+        try:
+            desc = _build_flow_descriptor(empresa)
+        except Exception as e:
+            traceback.print_exc()
+            return _ojsonify({"status": "error", "message": str(e)}), 500
+
+    if desc is _FLOW_NOT_FOUND:
+        return _ojsonify({"status": "error", "message": f"Módulo de fluxo para '{empresa}' não encontrado."}), 500
+
+    # escolhe rota admin x normal (serializado por chat pela fila de _enqueue_dispatch:
+    # o estado em fluxo_usuario não tem lock próprio)
+    try:
+        if chat_id in admins_set_por_empresa.get(empresa, frozenset()):
+            processar_admin = desc["admin"]
+            if processar_admin is not None:
+                return processar_admin(chat_id, msg, empresa, waha)
+            else:
+                return _ojsonify({"status": "error", "message": "Função processar_admin não encontrada."}), 500
+
+        processar = desc["user"]
+        if processar is not None:
+            return processar(chat_id, msg, empresa, waha, fluxo_usuario[empresa])
+
+        return _ojsonify({"status": "error", "message": "Função processar não encontrada."}), 500
+    except Exception as e:
+        traceback.print_exc()
+        return _ojsonify({"status": "error", "message": str(e)}), 500
+
+# -------------------------------------------------
+# Despacho em segundo plano
+# -------------------------------------------------
+# O webhook só valida/roteia e responde; o fluxo (leituras de agenda, envios
+# no WhatsApp) roda no pool.
+# Cada (empresa, chat) tem uma fila FIFO e no máximo um "drenador" por vez: as
+# mensagens do chat rodam uma a uma, na ordem de chegada. O drenador processa
+# uma mensagem e, se sobrou outra, se reagenda no fim do pool, então um chat
+# com rajada ocupa uma thread por vez e não trava os demais.
+# FLOW_QUEUE_MAX limita quantas mensagens podem estar enfileiradas; acima disso,
+# chat sem fila é processado na própria requisição (backpressure), e chat com
+# fila em andamento entra atrás das anteriores mesmo assim (a ordem vale mais).
+FLOW_WORKERS = int(os.getenv("FLOW_WORKERS", "8"))
+FLOW_QUEUE_MAX = int(os.getenv("FLOW_QUEUE_MAX", "1000"))
+
+_dispatch_pool = ThreadPoolExecutor(max_workers=FLOW_WORKERS, thread_name_prefix="flow") if FLOW_WORKERS > 0 else None
+_dispatch_slots = threading.BoundedSemaphore(FLOW_QUEUE_MAX)
+
+# (empresa, chat_id) -> deque de (msg, ocupa_slot); a chave existir = há um drenador ativo
+_chat_filas: Dict[tuple, collections.deque] = {}
+_chat_filas_lock = threading.Lock()
+
+def _status_http(rv) -> int:
+    """Status de um retorno de view: (resp, status), Response ou outro (200)."""
+    if isinstance(rv, tuple) and len(rv) > 1 and isinstance(rv[1], int):
+        return rv[1]
+    return getattr(rv, "status_code", 200)
+
+def _dispatch_in_background(empresa: str, chat_id: str, msg: str):
+    try:
+        # os fluxos usam jsonify, que precisa de app context fora da requisição
+        with app.app_context():
+            rv = _dispatch_to_flow(empresa, chat_id, msg)
+            status = _status_http(rv)
+            if status >= 400:
+                resp = rv[0] if isinstance(rv, tuple) else rv
+                corpo = resp.get_data(as_text=True) if hasattr(resp, "get_data") else resp
+                app.logger.error(f"[FLOW] {empresa}/{chat_id}: fluxo respondeu {status}: {corpo}")
+    except Exception:
+        app.logger.exception(f"[FLOW] falha processando mensagem de {chat_id} ({empresa})")
+
+def _agendar_fila(key: tuple):
+    """Põe o drenador do chat no pool (sem pool, ou pool encerrado, drena aqui mesmo)."""
+    if _dispatch_pool is not None:
+        try:
+            _dispatch_pool.submit(_drenar_fila, key)
+            return
+        except RuntimeError:
+            pass  # pool encerrado (shutdown do processo)
+    _drenar_fila(key, sincrono=True)
+
+def _drenar_fila(key: tuple, sincrono: bool = False):
+    empresa, chat_id = key
+    while True:
+        with _chat_filas_lock:
+            msg, ocupa_slot = _chat_filas[key].popleft()
+        try:
+            _dispatch_in_background(empresa, chat_id, msg)
+        finally:
+            if ocupa_slot:
+                _dispatch_slots.release()
+        with _chat_filas_lock:
+            if not _chat_filas[key]:
+                del _chat_filas[key]
+                return
+        if not sincrono:
+            _agendar_fila(key)  # volta pro fim do pool: os outros chats também andam
+            return
+
+def _enqueue_dispatch(empresa: str, chat_id: str, msg: str):
+    """Enfileira a mensagem na fila do chat e responde 202 imediatamente."""
+    key = (empresa, chat_id)
+    ocupa_slot = _dispatch_pool is not None and _dispatch_slots.acquire(blocking=False)
+    with _chat_filas_lock:
+        fila = _chat_filas.get(key)
+        if fila is not None:
+            # já há drenador para o chat: entra atrás das mensagens anteriores
+            fila.append((msg, ocupa_slot))
+            return _ojsonify({"status": "queued"}), 202
+        _chat_filas[key] = collections.deque([(msg, True)] if ocupa_slot else ())
+
+    if ocupa_slot:
+        _agendar_fila(key)
+        return _ojsonify({"status": "queued"}), 202
+
+    # sem pool ou fila cheia: esta requisição vira o drenador do chat e processa a própria
+    # mensagem; o que chegar do mesmo chat enquanto isso é drenado depois, na ordem
+    try:
+        return _dispatch_to_flow(empresa, chat_id, msg)
+    finally:
+        with _chat_filas_lock:
+            pendentes = bool(_chat_filas[key])
+            if not pendentes:
+                del _chat_filas[key]
+        if pendentes:
+            _agendar_fila(key)
+
+# -------------------------------------------------
+# Rotas básicas / saúde
+# -------------------------------------------------
+@app.get("/")
+def index():
+    return jsonify({
+        "ok": True,
+        "ts": datetime.utcnow().isoformat(),
+        "empresas": list(config_empresas.keys())
+    }), 200
+
+@app.get("/health")
+def health():
+    return jsonify({"status": "ok"}), 200
+
+# -------------------------------------------------
+# Webhooks
+# -------------------------------------------------
+@app.post("/waha/webhook")
+def waha_webhook():
+    """
+    Endpoint para os containers WAHA chamarem.
+    No seu docker-compose: WEBHOOK_URL=http://api:8000/waha/webhook
+    Você pode opcionalmente passar ?empresa=empresa1.
+    """
+    early = _reject_early()
+    if early is not None:
+        return early
+
+    payload = _parse_json()
+    if _is_ignored_event(payload):
+        return _ojsonify({"status": "ignored", "reason": "event"}), 200
+
+    fields = _extract_message_fields(payload)
+
+    # Logs brutos úteis (o dict só é montado se INFO estiver ativo)
+    if app.logger.isEnabledFor(logging.INFO):
+        _jlog({"waha_webhook_raw": payload})
+        _jlog({"waha_webhook_norm": {
+            "from": fields["chat_id"], "text": fields["msg"],
+            "fromMe": fields["from_me"], "ts": fields["ts"], "id": fields["msg_id"],
+            "owner": fields["owner"], "to": fields["to"],
+        }})
+
+    # Filtros básicos
+    if fields["from_me"]:
+        return _ojsonify({"status": "ignored", "reason": "fromMe"}), 200
+    if not fields["chat_id"] or not fields["msg"]:
+        return _ojsonify({"status": "ignored", "reason": "empty"}), 200
+    if _is_group(fields["chat_id"]):
+        return _ojsonify({"status": "ignored", "reason": "group"}), 200
+
+    empresa = _resolve_empresa(fields)
+    if not empresa:
+        return _ojsonify({"status": "error", "message": "Não foi possível resolver a empresa."}), 400
+
+    if app.logger.isEnabledFor(logging.INFO):
+        _jlog({
+            "empresa_resolvida": empresa,
+            "chat_id": fields.get("chat_id"),
+            "session": fields.get("session"),
+            "owner": fields.get("owner"),
+            "to": fields.get("to"),
+        })
+
+    return _enqueue_dispatch(empresa, fields["chat_id"], fields["msg"])
+
+# Compatibilidade com sua rota antiga dinâmica
+@app.post("/webhook/<empresa>")
+def webhook_dinamico(empresa: str):
+    early = _reject_early()
+    if early is not None:
+        return early
+
+    payload = _parse_json()
+    if _is_ignored_event(payload):
+        return _ojsonify({"status": "ignored", "reason": "event"}), 200
+
+    # tenta extrair de forma mais simples também
+    chat_id = None
+    texto = ""
+
+    # formato legado
+    if isinstance(payload.get("payload"), dict):
+        p = payload["payload"]
+        chat_id = p.get("from") or p.get("chatId") or p.get("chat_id")
+        texto = p.get("body") or p.get("text") or p.get("message") or ""
+
+    # *** CORREÇÃO DE INDENTAÇÃO AQUI ***
+    # Estas linhas estavam indentadas errado
+    chat_id = _normalize_chat_id(chat_id or payload.get("chat_id") or payload.get("chatId"))
+    texto = (texto or payload.get("text") or payload.get("message") or payload.get("body") or "").strip()
+
+    # se não conseguiu, usa o extrator robusto
+    if not chat_id or not texto:
+        fields = _extract_message_fields(payload)
+        chat_id = fields["chat_id"]
+        texto = fields["msg"]
+
+        # filtros
+        if fields["from_me"]:
+            return _ojsonify({"status": "ignored", "reason": "fromMe"}), 200
+
+    if not chat_id or not texto:
+        return _ojsonify({"status": "ignored"}), 200
+
+    if _is_group(chat_id):
+        return _ojsonify({"status": "ignored", "reason": "group"}), 200
+
+    if empresa not in config_empresas:
+        return _ojsonify({"status": "error", "message": f"Empresa '{empresa}' não encontrada."}), 404
+
+    return _enqueue_dispatch(empresa, chat_id, texto)
+
+print("[WAHA] Webhook registrado em /waha/webhook")
+
+# -------------------------------------------------
+# Agendador (opcional) — mantido do seu código
+# -------------------------------------------------
+ENABLE_SCHEDULER = False
+SCHEDULER_INTERVAL_SEC = int(os.getenv("SCHEDULER_INTERVAL_SEC", "60"))
+PIX_REMINDER_WINDOW_MIN = int(os.getenv("PIX_REMINDER_WINDOW_MIN", "5"))
+
+SCHED_DEDUP_MAXLEN = int(os.getenv("SCHED_DEDUP_MAXLEN", "10000"))
+SCHED_SEND_WORKERS = int(os.getenv("SCHED_SEND_WORKERS", "4"))
+
+# pool pequeno só para sobrepor o I/O de rede dos envios do agendador
+_sched_send_pool = ThreadPoolExecutor(max_workers=max(1, SCHED_SEND_WORKERS), thread_name_prefix="sched-send")
+
+class _LRUSet(collections.OrderedDict):
+    """Conjunto com tamanho máximo: ao passar do limite descarta os IDs mais antigos."""
+
+    def __init__(self, maxlen: int = SCHED_DEDUP_MAXLEN):
+        super().__init__()
+        self.maxlen = maxlen
+
+    def add(self, key) -> None:
+        self[key] = None
+        self.move_to_end(key)
+        while len(self) > self.maxlen:
+            self.popitem(last=False)
+
+_reminded_expiring = {empresa: _LRUSet() for empresa in config_empresas.keys()}
+_notified_expired = {empresa: _LRUSet() for empresa in config_empresas.keys()}
+# pendentes vistos na passada anterior: a agenda também expira sozinha em background,
+# então "virou Expirado" é medido entre uma passada e a seguinte
+# (None = ainda não lido; a primeira passada lê antes de expirar, como a seguinte faria)
+_pendentes_anteriores: dict[str, Optional[set]] = {empresa: None for empresa in config_empresas.keys()}
+
+# Lista fixa de empresas (config só é lida no boot)
+_EMPRESAS = tuple(config_empresas.keys())
+
+@functools.lru_cache(maxsize=None)
+def _get_agenda(empresa: str):
+    return importlib.import_module(f"scripts_empresas.{empresa}.agenda")
+
+def _send_whatsapp(send, chat_id: str, text: str) -> bool:
+    try:
+        send(chat_id, text)
+        return True
+    except Exception as e:
+        print(f"[SCHED] Falha ao enviar mensagem WhatsApp: {e}")
+        return False
+
+def _send_many(send, to_send: list) -> None:
+    """Envia [(chat_id, texto, ag_id)] em paralelo; devolve só quando todos terminaram."""
+    if len(to_send) == 1:
+        chat_id, text, _ = to_send[0]
+        _send_whatsapp(send, chat_id, text)
+        return
+    for _ in _sched_send_pool.map(lambda t: _send_whatsapp(send, t[0], t[1]), to_send):
+        pass
+
+def _parse_exp(s: str) -> datetime:
+    """Parse direto de 'dd/mm/YYYY HH:MM:SS' (formato fixo da agenda), sem strptime."""
+    if len(s) != 19:
+        raise ValueError(f"Expira_em inválido: {s!r}")
+    return datetime(
+        int(s[6:10]), int(s[3:5]), int(s[0:2]),
+        int(s[11:13]), int(s[14:16]), int(s[17:19]),
+    )
+
+def _fmt_date(d) -> str:
+    if isinstance(d, date):  # cobre datetime e pd.Timestamp
+        return d.strftime("%d/%m/%Y")
+    try:
+        return datetime.fromisoformat(d if isinstance(d, str) else str(d)).strftime("%d/%m/%Y")
+    except Exception:
+        return str(d)
+
+def _scheduler_loop():
+    while True:
+        try:
+            for empresa in _EMPRESAS:
+                waha = _get_waha_for(empresa)
+                if not waha:
+                    continue
+
+                try:
+                    agenda = _get_agenda(empresa)
+                except Exception as e:
+                    print(f"[SCHED] Não consegui importar agenda de {empresa}: {e}")
+                    continue
+
+                # primeira passada após o boot: sem isso, reservas pendentes no boot que expiram
+                # já nesta passada nunca receberiam o aviso de expiração
+                if _pendentes_anteriores.get(empresa) is None:
+                    try:
+                        _pendentes_anteriores[empresa] = agenda.listar_ids_por_status("Pendente")
+                    except Exception as e:
+                        print(f"[SCHED] erro listar_ids_por_status(Pendente) {empresa}: {e}")
+
+                # 1) Lembretes — prestes a expirar
+                candidatos = []
+                try:
+                    if hasattr(agenda, "listar_pendentes_prestes_a_expirar"):
+                        candidatos = agenda.listar_pendentes_prestes_a_expirar(janela_min=PIX_REMINDER_WINDOW_MIN)
+                except Exception as e:
+                    print(f"[SCHED] erro listar_pendentes_prestes_a_expirar({empresa}): {e}")
+
+                send = waha.send_message
+                now = datetime.now()
+                to_send = []
+                for c in candidatos or []:
+                    ag_id = str(c.get("AgendamentoID") or "")
+                    if not ag_id or ag_id in _reminded_expiring[empresa]:
+                        continue
+                    chat_id = str(c.get("ChatID") or "")
+                    if not chat_id:
+                        continue
+
+                    exp_str = str(c.get("Expira_em") or "")
+                    try:
+                        exp_dt = _parse_exp(exp_str)
+                        mins_left = max(1, int((exp_dt - now).total_seconds() // 60))
+                    except Exception:
+                        mins_left = PIX_REMINDER_WINDOW_MIN
+
+                    data_txt = _fmt_date(c.get("Data"))
+                    horario_txt = str(c.get("Horário") or "")
+                    servico = str(c.get("Serviço") or "seu horário")
+                    msg = (
+                        "⏳ *Falta pouco para sua reserva expirar!*\n\n"
+                        f"💈 {servico}\n"
+                        f"📅 {data_txt}  🕒 {horario_txt}\n"
+                        f"⏱️ Expira em ~{mins_left} min.\n\n"
+                        "Se quiser garantir, finalize o pagamento agora. "
+                        "Envie *reenviar pix* para receber o código de novo."
+                    )
+                    to_send.append((chat_id, msg, ag_id))
+
+                if to_send:
+                    _send_many(send, to_send)
+                    for _, _, ag_id in to_send:
+                        _reminded_expiring[empresa].add(ag_id)
+
+                # 2) Expirados — detectar quem era "Pendente" na passada anterior e virou "Expirado"
+                pend_before = _pendentes_anteriores.get(empresa) or set()
+
+                try:
+                    agenda.limpar_expirados()
+                except Exception as e:
+                    print(f"[SCHED] erro limpar_expirados {empresa}: {e}")
+
+                try:
+                    expired_after = agenda.listar_ids_por_status("Expirado")
+                except Exception as e:
+                    print(f"[SCHED] erro listar_ids_por_status(Expirado) {empresa}: {e}")
+                    expired_after = set()
+
+                try:
+                    _pendentes_anteriores[empresa] = agenda.listar_ids_por_status("Pendente")
+                except Exception as e:
+                    print(f"[SCHED] erro listar_ids_por_status(Pendente) {empresa}: {e}")
+
+                newly_expired = (expired_after & pend_before).difference(_notified_expired[empresa])
+                if newly_expired:
+                    to_send = []
+                    try:
+                        # só agora carrega as linhas completas, e apenas as afetadas
+                        for row in agenda.carregar_por_ids(newly_expired):
+                            ag_id = str(row.get("AgendamentoID") or "")
+                            if not ag_id:
+                                continue
+
+                            chat_id = str(row.get("ChatID") or "")
+                            if not chat_id:
+                                continue
+
+                            servico = str(row.get("Serviço") or "seu horário")
+                            data_txt = _fmt_date(row.get("Data"))
+                            horario_txt = str(row.get("Horário") or "")
+                            msg = (
+                                "⏰ *Sua reserva expirou por falta de pagamento.*\n\n"
+                                f"💈 {servico}\n"
+                                f"📅 {data_txt}  🕒 {horario_txt}\n\n"
+                                "Quer tentar de novo? Digite *agendar* para escolher outro horário."
+                            )
+                            to_send.append((chat_id, msg, ag_id))
+                    except Exception as e:
+                        print(f"[SCHED] erro processando expirados {empresa}: {e}")
+
+                    if to_send:
+                        _send_many(send, to_send)
+                        for _, _, ag_id in to_send:
+                            _notified_expired[empresa].add(ag_id)
+
+        except Exception as loop_e:
+            print(f"[SCHED] erro no loop: {loop_e}")
+
+        time.sleep(SCHEDULER_INTERVAL_SEC)
+
+# Execução local (em produção use gunicorn: gunicorn -c gunicorn_conf.py app:app)
+if __name__ == "__main__":
+    if ENABLE_SCHEDULER:
+        t = threading.Thread(target=_scheduler_loop, name="scheduler", daemon=True)
+        t.start()
+        print(f"[SCHED] Agendador iniciado (intervalo {SCHEDULER_INTERVAL_SEC}s, janela {PIX_REMINDER_WINDOW_MIN}min)")
+    app.run(host="0.0.0.0", port=5000, debug=os.getenv("FLASK_DEBUG") == "1", threaded=True)
\ No newline at end of file
@@ -0,0 +1,17 @@
+# gunicorn_conf.py — uso: gunicorn -c gunicorn_conf.py app:app
+import os
+
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+
+# O estado das conversas (fluxo_usuario) fica em memória no processo, então o
+# padrão é 1 worker com várias threads: os webhooks do WAHA são atendidos em
+# paralelo sem espalhar a conversa de um mesmo cliente entre processos.
+# Só aumente WEB_CONCURRENCY se o estado for movido para fora do processo.
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = os.getenv("GUNICORN_WORKER_CLASS", "gthread")
+threads = int(os.getenv("GUNICORN_THREADS", "16"))
+# usado apenas por workers assíncronos (gevent/eventlet)
+worker_connections = int(os.getenv("GUNICORN_WORKER_CONNECTIONS", "1000"))
+
+keepalive = 5
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
@@ -1,39 +1,47 @@
-import os
-from decouple import config
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.document_loaders import PyPDFLoader 
-
-# Define a chave da API
-os.environ['OPENAI_API_KEY'] = config('OPENAI_API_KEY')
-
-if __name__ == '__main__':
-    file_path = '/app/rag/data/teste.pdf'
-    if not os.path.exists(file_path):
-        raise FileNotFoundError(f"Arquivo PDF não encontrado: {file_path}")
-
-    loader = PyPDFLoader(file_path)
-    docs = loader.load()
-    print(f"{len(docs)} páginas carregadas do PDF.")
-
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    chunks = text_splitter.split_documents(documents=docs)
-    print(f"{len(chunks)} chunks gerados.")
-
-    persist_directory = '/app/chroma_data'
-
-    # Corrige erro de criação de diretório já existente
-    if os.path.exists(persist_directory) and not os.path.isdir(persist_directory):
-        os.remove(persist_directory)
-    os.makedirs(persist_directory, exist_ok=True)
-
-    embedding = OpenAIEmbeddings()
-
-    vector_store = Chroma(
-        embedding_function=embedding,
-        persist_directory=persist_directory,
-    )
-    vector_store.add_documents(documents=chunks)
-
-    print("Base vetorial criada com sucesso!")
+import os
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_chroma import Chroma
+from langchain_openai import OpenAIEmbeddings
+from langchain_community.document_loaders import PyMuPDFLoader
+
+# Define a chave da API
+os.environ['OPENAI_API_KEY'] = config('OPENAI_API_KEY')
+
+# Ingestão em lotes: cada lote vira poucas chamadas de embedding e uma escrita no Chroma
+BATCH_SIZE = int(config('RAG_BATCH_SIZE', default=256))
+MAX_WORKERS = int(config('RAG_EMBED_WORKERS', default=4))  # lotes em paralelo (respeite o rate limit)
+
+if __name__ == '__main__':
+    file_path = '/app/rag/data/teste.pdf'
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"Arquivo PDF não encontrado: {file_path}")
+
+    loader = PyMuPDFLoader(file_path)  # PyMuPDF (C++), bem mais rápido que pypdf
+    docs = loader.load()
+    print(f"{len(docs)} páginas carregadas do PDF.")
+
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunks = text_splitter.split_documents(documents=docs)
+    print(f"{len(chunks)} chunks gerados.")
+
+    persist_directory = '/app/chroma_data'
+
+    # Corrige erro de criação de diretório já existente
+    if os.path.exists(persist_directory) and not os.path.isdir(persist_directory):
+        os.remove(persist_directory)
+    os.makedirs(persist_directory, exist_ok=True)
+
+    embedding = OpenAIEmbeddings(chunk_size=BATCH_SIZE, max_retries=6, request_timeout=60)
+
+    vector_store = Chroma(
+        embedding_function=embedding,
+        persist_directory=persist_directory,
+    )
+    batches = [chunks[i:i + BATCH_SIZE] for i in range(0, len(chunks), BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        for n, _ in enumerate(executor.map(lambda b: vector_store.add_documents(documents=b), batches), 1):
+            print(f"Lote {n}/{len(batches)} indexado.")
+
+    print("Base vetorial criada com sucesso!")
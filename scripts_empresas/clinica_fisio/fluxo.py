@@ -14,41 +14,58 @@ facilitar a apresentação inicial do protótipo.
 """
 from __future__ import annotations
 
+import atexit
 import json
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from dataclasses import dataclass, field
 from datetime import datetime
+from functools import lru_cache
 import re
-from typing import Dict
-from uuid import uuid4
+from typing import Dict, TypedDict
+from secrets import token_hex
 
-from flask import jsonify
+import orjson
+
+from services.configs import load_admins, load_empresas
+from services.respostas import BODY_IGNORED, BODY_SUCCESS, resposta_json
+from services.waha import encode_text, normalizar_texto
 
 CONFIG_EMPRESAS: Dict[str, dict] = {}
 ADMINS_EMPRESAS: Dict[str, list] = {}
 try:
-    CONFIG_EMPRESAS = json.loads(
-        (Path(__file__).resolve().parents[2] / "config" / "empresas_config.json").read_text(encoding="utf-8")
-    )
+    CONFIG_EMPRESAS = load_empresas()
 except FileNotFoundError:
     CONFIG_EMPRESAS = {}
 except json.JSONDecodeError:
     CONFIG_EMPRESAS = {}
 
 try:
-    ADMINS_EMPRESAS = json.loads(
-        (Path(__file__).resolve().parents[2] / "config" / "admins_config.json").read_text(encoding="utf-8")
-    )
+    ADMINS_EMPRESAS = load_admins()
 except FileNotFoundError:
     ADMINS_EMPRESAS = {}
 except json.JSONDecodeError:
     ADMINS_EMPRESAS = {}
 
-DATA_DIR = Path(__file__).resolve().parents[2] / "data"
+_BASE = Path(__file__).resolve().parents[2]
+DATA_DIR = _BASE / "data"
 LEADS_FILE = DATA_DIR / "clinica_fisio_leads.jsonl"
 
+# garantido uma vez no import; o writer de leads não precisa repetir o mkdir
+try:
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+except OSError as exc:  # pragma: no cover - ex.: FS somente leitura
+    print(f"[clinica_fisio] Não foi possível criar {DATA_DIR}: {exc}")
+
 VALOR_PADRAO_LINK = 120.0
 
+
+# Recursos opcionais por empresa: empresas_config.json -> "<empresa>": {"features": {...}}
+FEATURES_PADRAO = {"pagamento_link": True, "lead_registry": True}
+_RE_VALOR = re.compile(r"\d+[.,]?\d*")
+
 # ---------------------------------------------------------------------------
 # Mensagens fixas utilizadas no protótipo
 # ---------------------------------------------------------------------------
@@ -86,15 +103,21 @@ MENSAGEM_FAQ = (
     "Ficou com outra dúvida? Digite e respondemos por aqui!"
 )
 
+# Versões já serializadas para o corpo do WAHA (encode uma vez por processo)
+MENU_PRINCIPAL_BYTES = encode_text(MENU_PRINCIPAL)
+MENSAGEM_COMERCIAL_BYTES = encode_text(MENSAGEM_COMERCIAL)
+MENSAGEM_PAGAMENTO_BYTES = encode_text(MENSAGEM_PAGAMENTO)
+MENSAGEM_FAQ_BYTES = encode_text(MENSAGEM_FAQ)
+
 # ---------------------------------------------------------------------------
 # Estado do fluxo
 # ---------------------------------------------------------------------------
 
 
-@dataclass
-class EstadoConversa:
-    etapa: str = "menu"
-    contexto: Dict[str, str] = field(default_factory=dict)
+class EstadoConversa(TypedDict):
+    """Estado de um chat, guardado direto em fluxo_usuario e alterado no lugar."""
+    etapa: str
+    contexto: Dict[str, str]
 
 
 # ---------------------------------------------------------------------------
@@ -103,24 +126,31 @@ class EstadoConversa:
 
 
 def _reset_estado(fluxo_usuario: Dict[str, dict], chat_id: str) -> EstadoConversa:
-    fluxo_usuario[chat_id] = {"etapa": "menu", "contexto": {}}
-    return EstadoConversa()
+    estado = fluxo_usuario[chat_id] = {"etapa": "menu", "contexto": {}}
+    return estado
 
 
 def _obter_estado(fluxo_usuario: Dict[str, dict], chat_id: str) -> EstadoConversa:
-    estado_bruto = fluxo_usuario.setdefault(chat_id, {"etapa": "menu", "contexto": {}})
-    return EstadoConversa(
-        etapa=estado_bruto.get("etapa", "menu"),
-        contexto=dict(estado_bruto.get("contexto") or {}),
-    )
+    # devolve o próprio dict guardado: alterações já ficam salvas, sem cópia por mensagem
+    return fluxo_usuario.setdefault(chat_id, {"etapa": "menu", "contexto": {}})
+
+
+def _feature(empresa: str, nome: str) -> bool:
+    features = CONFIG_EMPRESAS.get(empresa, {}).get("features") or {}
+    return bool(features.get(nome, FEATURES_PADRAO[nome]))
 
 
-def _salvar_estado(fluxo_usuario: Dict[str, dict], chat_id: str, estado: EstadoConversa) -> None:
-    fluxo_usuario[chat_id] = {"etapa": estado.etapa, "contexto": estado.contexto}
+_FMT_MINUTO = "%d/%m/%Y %H:%M"
 
 
-def _normalizar(msg: str) -> str:
-    return (msg or "").strip().lower()
+@lru_cache(maxsize=1)
+def _fmt_minuto(minuto_epoch: int) -> str:
+    return datetime.fromtimestamp(minuto_epoch * 60).strftime(_FMT_MINUTO)
+
+
+def _agora_minuto() -> str:
+    """'dd/mm/YYYY HH:MM' de agora; o strftime roda no máximo uma vez por minuto."""
+    return _fmt_minuto(int(time.time()) // 60)
 
 
 # ---------------------------------------------------------------------------
@@ -129,12 +159,12 @@ def _normalizar(msg: str) -> str:
 
 
 def _handle_menu(waha, chat_id: str) -> None:
-    waha.send_message(chat_id, MENU_PRINCIPAL)
+    waha.send_message(chat_id, MENU_PRINCIPAL_BYTES)
 
 
 def _entrar_agendamento(waha, chat_id: str, estado: EstadoConversa) -> None:
-    estado.etapa = "agendamento_nome"
-    estado.contexto = {}
+    estado["etapa"] = "agendamento_nome"
+    estado["contexto"] = {}
     waha.send_message(
         chat_id,
         "Ótimo! Para reservar um horário, me conta primeiro o seu *nome completo*."
@@ -148,32 +178,33 @@ def _continuar_agendamento(
     mensagem: str,
     empresa: str,
 ) -> None:
-    if estado.etapa == "agendamento_nome":
-        estado.contexto["nome"] = mensagem.strip()
-        estado.etapa = "agendamento_preferencia"
+    if estado["etapa"] == "agendamento_nome":
+        estado["contexto"]["nome"] = mensagem.strip()
+        estado["etapa"] = "agendamento_preferencia"
         waha.send_message(
             chat_id,
             (
                 "Perfeito, {nome}! Qual dia/horário você prefere?\n"
                 "Ex.: terça-feira à tarde ou 12/09 às 8h."
-            ).format(nome=estado.contexto["nome"])
+            ).format(nome=estado["contexto"]["nome"])
         )
         return
 
-    if estado.etapa == "agendamento_preferencia":
-        estado.contexto["preferencia"] = mensagem.strip()
-        estado.etapa = "agendamento_observacoes"
+    if estado["etapa"] == "agendamento_preferencia":
+        estado["contexto"]["preferencia"] = mensagem.strip()
+        estado["etapa"] = "agendamento_observacoes"
         waha.send_message(
             chat_id,
             "Quer deixar alguma observação (lesão, objetivo, convênio)? Se não precisar, digite *não*."
         )
         return
 
-    if estado.etapa == "agendamento_observacoes":
+    if estado["etapa"] == "agendamento_observacoes":
         observacao = mensagem.strip()
-        if observacao.lower() in {"nao", "não", "nenhuma", "nada"}:
+        if normalizar_texto(observacao) in {"nao", "nenhuma", "nada"}:
             observacao = "Sem observações adicionais."
-        estado.contexto["observacoes"] = observacao
+        contexto = estado["contexto"]
+        contexto["observacoes"] = observacao
 
         waha.send_message(
             chat_id,
@@ -184,43 +215,58 @@ def _continuar_agendamento(
                 "• Observações: {obs}\n\n"
                 "Nossa equipe confirma a disponibilidade e retorna por aqui em instantes."
             ).format(
-                nome=estado.contexto.get("nome", "-"),
-                pref=estado.contexto.get("preferencia", "-"),
-                obs=estado.contexto.get("observacoes", "Sem observações."),
+                nome=contexto.get("nome", "-"),
+                pref=contexto.get("preferencia", "-"),
+                obs=contexto.get("observacoes", "Sem observações."),
             )
         )
 
         resumo_admin = (
             "🗓️ *Novo pedido de agendamento*\n"
-            f"• Nome: {estado.contexto.get('nome', '-')}\n"
-            f"• Preferência: {estado.contexto.get('preferencia', '-')}\n"
-            f"• Observações: {estado.contexto.get('observacoes', 'Sem observações.')}\n"
-            f"• Recebido em: {datetime.now().strftime('%d/%m/%Y %H:%M')}"
+            f"• Nome: {contexto.get('nome', '-')}\n"
+            f"• Preferência: {contexto.get('preferencia', '-')}\n"
+            f"• Observações: {contexto.get('observacoes', 'Sem observações.')}\n"
+            f"• Recebido em: {_agora_minuto()}"
         )
-        _registrar_lead(empresa, dict(estado.contexto))
+        # o contexto sai do estado logo abaixo, então vai para o lead sem cópia
+        estado["etapa"] = "menu"
+        estado["contexto"] = {}
+        if _feature(empresa, "lead_registry"):
+            _registrar_lead(empresa, contexto)
         _notificar_time(waha, empresa, resumo_admin)
 
-        estado.etapa = "menu"
-        estado.contexto = {}
         waha.send_message(chat_id, "Se precisar de mais algo, é só digitar *menu* para recomeçar. 😊")
         return
 
 
-def _responder_pagamentos(waha, chat_id: str, empresa: str) -> None:
-    mensagem = MENSAGEM_PAGAMENTO
+@lru_cache(maxsize=None)
+def _mensagem_pagamento_bytes(empresa: str) -> bytes:
     cfg = CONFIG_EMPRESAS.get(empresa, {})
     instrucoes = cfg.get("pagamento_instrucoes")
     if instrucoes:
-        mensagem = f"{mensagem}\n\n📌 {instrucoes}"
-    waha.send_message(chat_id, mensagem)
+        return encode_text(f"{MENSAGEM_PAGAMENTO}\n\n📌 {instrucoes}")
+    return MENSAGEM_PAGAMENTO_BYTES
+
+
+def _responder_pagamentos(waha, chat_id: str, empresa: str) -> None:
+    waha.send_message(chat_id, _mensagem_pagamento_bytes(empresa))
+
+
+@lru_cache(maxsize=None)
+def _prefixo_link(empresa: str) -> str:
+    base = CONFIG_EMPRESAS.get(empresa, {}).get(
+        "pagamento_link_base",
+        "https://pagamentos.movimenta.exemplo/checkout",
+    )
+    return f"{base}?empresa={empresa}&token="
 
 
 def _gerar_link_pagamento(mensagem: str, empresa: str) -> str:
     texto = mensagem.lower().replace("r$", "").strip()
-    numeros = re.findall(r"\d+[\.,]?\d*", texto)
     valor = None
-    for bruto in numeros:
-        normalizado = bruto.replace(".", "").replace(",", ".")
+    # finditer é preguiçoso: para no primeiro valor positivo, sem montar a lista toda
+    for m in _RE_VALOR.finditer(texto):
+        normalizado = m.group().replace(".", "").replace(",", ".")
         try:
             candidato = float(normalizado)
         except ValueError:
@@ -232,12 +278,7 @@ def _gerar_link_pagamento(mensagem: str, empresa: str) -> str:
     if valor is None:
         valor = VALOR_PADRAO_LINK
 
-    base = CONFIG_EMPRESAS.get(empresa, {}).get(
-        "pagamento_link_base",
-        "https://pagamentos.movimenta.exemplo/checkout",
-    )
-    token = uuid4().hex[:10]
-    link = f"{base}?empresa={empresa}&token={token}&valor={valor:.2f}"
+    link = f"{_prefixo_link(empresa)}{token_hex(5)}&valor={valor:.2f}"
 
     return (
         "✅ Aqui está o seu link de pagamento seguro:\n"
@@ -247,29 +288,174 @@ def _gerar_link_pagamento(mensagem: str, empresa: str) -> str:
 
 
 def _responder_faq(waha, chat_id: str) -> None:
-    waha.send_message(chat_id, MENSAGEM_FAQ)
+    waha.send_message(chat_id, MENSAGEM_FAQ_BYTES)
 
 
-def _registrar_lead(empresa: str, dados: Dict[str, str]) -> None:
+# Leads são gravados em lote por uma thread de fundo: o webhook só enfileira.
+LEAD_BATCH_MAX = 256
+LEAD_FLUSH_SEC = 0.05
+
+_LEAD_QUEUE: "queue.Queue[dict]" = queue.Queue()
+_lead_io_lock = threading.Lock()
+_lead_thread_lock = threading.Lock()
+_lead_thread: threading.Thread | None = None
+
+
+def _gravar_leads(lote: list) -> None:
     try:
-        DATA_DIR.mkdir(exist_ok=True)
-        payload = {
-            "empresa": empresa,
-            "capturado_em": datetime.utcnow().isoformat(),
-            "dados": dados,
-        }
-        with LEADS_FILE.open("a", encoding="utf-8") as fp:
-            fp.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        with _lead_io_lock:
+            with LEADS_FILE.open("ab") as fp:
+                fp.write(b"".join(orjson.dumps(p) + b"\n" for p in lote))
     except Exception as exc:  # pragma: no cover - falhas não devem quebrar o fluxo
-        print(f"[clinica_fisio] Falha ao registrar lead: {exc}")
+        print(f"[clinica_fisio] Falha ao registrar {len(lote)} lead(s): {exc}")
+
+
+_FIM_LEADS = object()  # sentinela do atexit: grava o lote em mãos e encerra o writer
+
+
+def _flush_loop() -> None:
+    fim = False
+    while not fim:
+        item = _LEAD_QUEUE.get()
+        if item is _FIM_LEADS:
+            return
+        lote = [item]
+        limite = time.monotonic() + LEAD_FLUSH_SEC
+        while len(lote) < LEAD_BATCH_MAX:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                item = _LEAD_QUEUE.get(timeout=restante)
+            except queue.Empty:
+                break
+            if item is _FIM_LEADS:
+                fim = True
+                break
+            lote.append(item)
+        _gravar_leads(lote)
+
+
+def _drain() -> None:
+    """
+    No atexit: sinaliza o writer e espera ele gravar o lote que já tirou da fila;
+    depois grava o que ainda sobrou nela.
+    """
+    if _lead_thread is not None and _lead_thread.is_alive():
+        _LEAD_QUEUE.put(_FIM_LEADS)
+        _lead_thread.join(timeout=10)
+    lote = []
+    while True:
+        try:
+            item = _LEAD_QUEUE.get_nowait()
+        except queue.Empty:
+            break
+        if item is not _FIM_LEADS:
+            lote.append(item)
+    if lote:
+        _gravar_leads(lote)
+
+
+def _garantir_thread_leads() -> None:
+    global _lead_thread
+    if _lead_thread is not None:
+        return
+    with _lead_thread_lock:
+        if _lead_thread is None:
+            _lead_thread = threading.Thread(target=_flush_loop, name="leads-writer", daemon=True)
+            _lead_thread.start()
+            atexit.register(_drain)
+
+
+def _registrar_lead(empresa: str, dados: Dict[str, str]) -> None:
+    _garantir_thread_leads()
+    _LEAD_QUEUE.put_nowait({
+        "empresa": empresa,
+        "capturado_em_ns": time.time_ns(),  # epoch em ns; converter para ISO na leitura
+        "dados": dados,
+    })
+
+
+# Avisos para a equipe saem em paralelo e fora da thread do webhook
+_NOTIFY_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="clinica-notify")
+
+
+def _safe_send(waha, admin: str, mensagem: str) -> None:
+    try:
+        waha.send_message(admin, mensagem)
+    except Exception as exc:  # pragma: no cover - não deve interromper
+        print(f"[clinica_fisio] Falha ao notificar admin {admin}: {exc}")
 
 
 def _notificar_time(waha, empresa: str, mensagem: str) -> None:
     for admin in ADMINS_EMPRESAS.get(empresa, []) or []:
-        try:
-            waha.send_message(admin, mensagem)
-        except Exception as exc:  # pragma: no cover - não deve interromper
-            print(f"[clinica_fisio] Falha ao notificar admin {admin}: {exc}")
+        _NOTIFY_POOL.submit(_safe_send, waha, admin, mensagem)
+
+
+# ---------------------------------------------------------------------------
+# Tabelas de comandos (montadas uma vez no import)
+# ---------------------------------------------------------------------------
+
+
+def _cmd_menu(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    estado["etapa"] = "menu"
+    estado["contexto"] = {}
+    _handle_menu(waha, chat_id)
+
+
+def _cmd_cancelar(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    _reset_estado(fluxo_usuario, chat_id)
+    waha.send_message(chat_id, "Tudo bem! Quando quiser retomar, é só digitar *menu*.")
+
+
+def _cmd_atendente(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    waha.send_message(
+        chat_id,
+        "📞 Já vou acionar a recepção para continuar o atendimento com você."
+    )
+
+
+def _cmd_quero_pagar(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    link = _gerar_link_pagamento(msg, empresa)
+    waha.send_message(chat_id, link)
+
+
+def _cmd_comercial(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    waha.send_message(chat_id, MENSAGEM_COMERCIAL_BYTES)
+
+
+def _cmd_agendamento(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    _entrar_agendamento(waha, chat_id, estado)
+
+
+def _cmd_pagamentos(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    _responder_pagamentos(waha, chat_id, empresa)
+
+
+def _cmd_faq(waha, chat_id, msg, empresa, estado, fluxo_usuario) -> None:
+    _responder_faq(waha, chat_id)
+
+
+# Chaves já no formato de normalizar_texto (sem acento).
+# Valem em qualquer etapa (inclusive no meio do agendamento)
+COMANDOS_UNIVERSAIS = {
+    **dict.fromkeys(("menu", "inicio", "oi", "ola", "bom dia", "boa tarde", "boa noite"), _cmd_menu),
+    **dict.fromkeys(("cancelar", "sair"), _cmd_cancelar),
+    **dict.fromkeys(("atendente", "falar com atendente", "humano"), _cmd_atendente),
+}
+
+# Comandos por prefixo, checados logo depois dos universais
+COMANDOS_PREFIXO = (
+    ("quero pagar", _cmd_quero_pagar, "pagamento_link"),
+)
+
+# Opções do menu (só fora do agendamento, para não engolir as respostas do cliente)
+COMANDOS_MENU = {
+    **dict.fromkeys(("1", "01", "comercial"), _cmd_comercial),
+    **dict.fromkeys(("2", "02", "agendamento", "agendar", "remarcar", "remarcacao", "confirmar"), _cmd_agendamento),
+    **dict.fromkeys(("3", "03", "pagamento", "pagamentos", "link"), _cmd_pagamentos),
+    **dict.fromkeys(("4", "04", "duvida", "duvidas", "faq"), _cmd_faq),
+}
 
 
 # ---------------------------------------------------------------------------
@@ -280,76 +466,44 @@ def _notificar_time(waha, empresa: str, mensagem: str) -> None:
 def processar(chat_id: str, msg: str, empresa: str, waha, fluxo_usuario: Dict[str, dict]):
     """Roteia a mensagem para o fluxo do protótipo."""
     if not msg:
-        return jsonify({"status": "ignored"}), 200
+        return resposta_json(BODY_IGNORED)
 
-    texto = _normalizar(msg)
+    texto = normalizar_texto(msg)
     estado = _obter_estado(fluxo_usuario, chat_id)
 
     # Comandos universais
-    if texto in {"menu", "inicio", "início", "oi", "olá", "ola", "bom dia", "boa tarde", "boa noite"}:
-        estado.etapa = "menu"
-        estado.contexto = {}
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        _handle_menu(waha, chat_id)
-        return jsonify({"status": "success"}), 200
-
-    if texto in {"cancelar", "sair"}:
-        _reset_estado(fluxo_usuario, chat_id)
-        waha.send_message(chat_id, "Tudo bem! Quando quiser retomar, é só digitar *menu*.")
-        return jsonify({"status": "success"}), 200
-
-    if texto in {"atendente", "falar com atendente", "humano"}:
-        waha.send_message(
-            chat_id,
-            "📞 Já vou acionar a recepção para continuar o atendimento com você."
-        )
-        return jsonify({"status": "success"}), 200
+    handler = COMANDOS_UNIVERSAIS.get(texto)
+    if handler is None:
+        for prefixo, cmd, feature in COMANDOS_PREFIXO:
+            if texto.startswith(prefixo) and _feature(empresa, feature):
+                handler = cmd
+                break
+    if handler is not None:
+        handler(waha, chat_id, msg, empresa, estado, fluxo_usuario)
+        return resposta_json(BODY_SUCCESS)
 
     # Fluxo principal
-    if texto.startswith("quero pagar"):
-        link = _gerar_link_pagamento(msg, empresa)
-        waha.send_message(chat_id, link)
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        return jsonify({"status": "success"}), 200
-
-    if estado.etapa.startswith("agendamento"):
+    if estado["etapa"].startswith("agendamento"):
         _continuar_agendamento(waha, chat_id, estado, msg, empresa)
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        return jsonify({"status": "success"}), 200
-
-    if texto in {"1", "01", "comercial"}:
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        waha.send_message(chat_id, MENSAGEM_COMERCIAL)
-        return jsonify({"status": "success"}), 200
-
-    if texto in {"2", "02", "agendamento", "agendar", "remarcar", "remarcação", "confirmar"}:
-        _entrar_agendamento(waha, chat_id, estado)
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        return jsonify({"status": "success"}), 200
-
-    if texto in {"3", "03", "pagamento", "pagamentos", "link"}:
-        _responder_pagamentos(waha, chat_id, empresa)
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        return jsonify({"status": "success"}), 200
+        return resposta_json(BODY_SUCCESS)
 
-    if texto in {"4", "04", "duvida", "dúvida", "duvidas", "dúvidas", "faq"}:
-        _responder_faq(waha, chat_id)
-        _salvar_estado(fluxo_usuario, chat_id, estado)
-        return jsonify({"status": "success"}), 200
+    handler = COMANDOS_MENU.get(texto)
+    if handler is not None:
+        handler(waha, chat_id, msg, empresa, estado, fluxo_usuario)
+        return resposta_json(BODY_SUCCESS)
 
     # Se nada se encaixar e estivermos no menu, apresenta novamente
-    if estado.etapa == "menu":
-        _salvar_estado(fluxo_usuario, chat_id, estado)
+    if estado["etapa"] == "menu":
         waha.send_message(
             chat_id,
             "Não entendi muito bem. Use um dos números do menu ou digite *menu* para recomeçar."
         )
         _handle_menu(waha, chat_id)
-        return jsonify({"status": "success"}), 200
+        return resposta_json(BODY_SUCCESS)
 
     # Fallback genérico
     waha.send_message(
         chat_id,
         "Certo! Estou encaminhando para a nossa equipe finalizar esse atendimento."
     )
-    return jsonify({"status": "success"}), 200
\ No newline at end of file
+    return resposta_json(BODY_SUCCESS)
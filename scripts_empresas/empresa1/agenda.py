@@ -1,417 +1,690 @@
-import os
-import pandas as pd
-from datetime import datetime, date, timedelta
-import uuid
-import json
-
-BASE_DIR = os.path.dirname(__file__)
-PLANILHA_PATH = os.path.join(BASE_DIR, 'agendamentos_empresa1.xlsx')
-BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
-
-BLOCOS_HORARIOS = [
-    "08:00", "09:00", "10:00", "11:00",
-    "13:00", "14:00", "15:00", "16:00",
-    "17:00"
-]
-
-# =============================
-# Utilidades internas
-# =============================
-def _now():
-    return datetime.now()
-
-def _fmt_ts(ts: datetime) -> str:
-    return ts.strftime("%d/%m/%Y %H:%M:%S")
-
-def _parse_ts(ts_str: str) -> datetime | None:
-    try:
-        return datetime.strptime(ts_str, "%d/%m/%Y %H:%M:%S")
-    except Exception:
-        return None
-
-def _ensure_columns(df: pd.DataFrame) -> pd.DataFrame:
-    cols = [
-        "AgendamentoID", "Nome", "Data", "Horário",
-        "Serviço", "Insta", "Status", "Agendado_em", "Expira_em", "ChatID",
-        "ItensJSON", "Total"
-    ]
-    for c in cols:
-        if c not in df.columns:
-            # Data como NaT, Total como 0.0, demais vazios
-            if c == "Data":
-                df[c] = pd.NaT
-            elif c == "Total":
-                df[c] = 0.0
-            else:
-                df[c] = ""
-
-    # Normalizações
-    if "Data" in df.columns:
-        try:
-            df["Data"] = pd.to_datetime(df["Data"]).dt.date
-        except Exception:
-            pass
-    if "Horário" in df.columns:
-        df["Horário"] = df["Horário"].astype(str)
-    if "Status" in df.columns:
-        df["Status"] = df["Status"].astype(str)
-    if "Total" in df.columns:
-        try:
-            df["Total"] = df["Total"].astype(float)
-        except Exception:
-            pass
-    return df[cols]
-
-def _gen_id(prefix: str = "AG") -> str:
-    return f"{prefix}-{uuid.uuid4().hex[:10].upper()}"
-
-def _itens_to_label(servicos_itens: list) -> str:
-    """
-    Converte lista de itens ({title, quantity, unit_price}) em string legível para 'Serviço'.
-    """
-    if not servicos_itens:
-        return ""
-    partes = []
-    for i in servicos_itens:
-        title = (i.get("title") or "").strip()
-        qty = int(i.get("quantity") or 1)
-        partes.append(f"{title} x{qty}" if qty > 1 else title)
-    return ", ".join([p for p in partes if p])
-
-def _sum_itens_total(servicos_itens: list) -> float:
-    return round(sum(float(i.get("unit_price", 0.0)) * int(i.get("quantity", 1)) for i in (servicos_itens or [])), 2)
-
-# =============================
-# IO de planilha
-# =============================
-def carregar_agendamentos() -> pd.DataFrame:
-    try:
-        df = pd.read_excel(PLANILHA_PATH)
-        df = _ensure_columns(df)
-        return df
-    except FileNotFoundError:
-        df = pd.DataFrame(columns=[
-            "AgendamentoID", "Nome", "Data", "Horário",
-            "Serviço", "Insta", "Status", "Agendado_em", "Expira_em", "ChatID",
-            "ItensJSON", "Total"
-        ])
-        return _ensure_columns(df)
-
-def salvar_agendamentos(df: pd.DataFrame):
-    # Backup
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
-    backup_file = os.path.join(BACKUP_DIR, f"backup_{_now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-    df.to_excel(backup_file, index=False)
-
-    # Planilha principal
-    df.to_excel(PLANILHA_PATH, index=False)
-
-# =============================
-# Limpeza de reservas expiradas
-# =============================
-def limpar_expirados():
-    df = carregar_agendamentos()
-    now = _now()
-    alterado = False
-
-    if "Status" not in df.columns:
-        return
-
-    for i in df.index:
-        try:
-            if str(df.at[i, "Status"]).strip().lower() == "pendente":
-                expira_str = str(df.at[i, "Expira_em"]) if "Expira_em" in df.columns else ""
-                expira = _parse_ts(expira_str) if expira_str else None
-                if expira and expira < now:
-                    df.at[i, "Status"] = "Expirado"
-                    alterado = True
-        except Exception:
-            continue
-
-    if alterado:
-        salvar_agendamentos(df)
-
-# =============================
-# Consulta de disponibilidade
-# =============================
-def listar_blocos_disponiveis(data=None, exibir_nomes: bool=False) -> str:
-    """
-    Retorna uma string com a lista de horários e marcações Livre/Ocupado.
-    """
-    if data is None:
-        data = date.today()
-    limpar_expirados()
-    df = carregar_agendamentos()
-
-    ocupados = df[(df['Data'] == data) & (df['Status'].isin(["Pendente", "Confirmado"]))]  # bloqueia pendente/confirmado
-    ocupados_horas = set(ocupados['Horário'].tolist())
-
-    linhas = []
-    for i, bloco in enumerate(BLOCOS_HORARIOS, 1):
-        if bloco in ocupados_horas:
-            label = "❌ Ocupado"
-            if exibir_nomes:
-                nomes = ocupados[ocupados["Horário"] == bloco]["Nome"].tolist()
-                if nomes:
-                    label += f" — {nomes[0]}"
-        else:
-            label = "✅ Livre"
-        linhas.append(f"{i} - {bloco} - {label}")
-    return "\n".join(linhas)
-
-def horario_disponivel(horario_str, data=None) -> bool:
-    if data is None:
-        data = date.today()
-    limpar_expirados()
-    df = carregar_agendamentos()
-    cond = (df["Data"] == data) & (df["Horário"] == horario_str) & (df["Status"].isin(["Pendente","Confirmado"]))
-    return not cond.any()
-
-# =============================
-# Reserva / confirmação (para pagamentos)
-# =============================
-def reservar_pendente(
-    agendamento_id,
-    nome,
-    horario_str,
-    servico_label,
-    data,
-    insta="",
-    chat_id="",
-    itens=None,      # <- snapshot dos itens
-    total=None,      # <- total calculado
-    ttl_min=20
-) -> bool:
-    """
-    Cria uma linha 'Pendente' (reserva) por ttl_min minutos.
-    'servico_label' é string (ex.: "Corte social, Barba").
-    """
-    df = carregar_agendamentos()
-    if not horario_disponivel(horario_str, data):
-        return False
-
-    now = _now()
-    expira_em = now + timedelta(minutes=ttl_min)
-
-    if total is None and itens:
-        total = _sum_itens_total(itens)
-    if total is None:
-        total = 0.0
-
-    itens_json = json.dumps(itens or [], ensure_ascii=False)
-
-    novo = pd.DataFrame([{
-        "AgendamentoID": agendamento_id,
-        "Nome": (nome or "Cliente").strip().title(),
-        "Data": data,
-        "Horário": str(horario_str),
-        "Serviço": (servico_label or "").strip(),
-        "Insta": insta or "",
-        "Status": "Pendente",
-        "Agendado_em": _fmt_ts(now),
-        "Expira_em": _fmt_ts(expira_em),
-        "ChatID": chat_id or "",
-        "ItensJSON": itens_json,
-        "Total": float(total)
-    }])
-    df = pd.concat([df, novo], ignore_index=True)
-    salvar_agendamentos(df)
-    return True
-
-def confirmar_pagamento(agendamento_id) -> bool:
-    """
-    Marca 'Pendente' -> 'Confirmado' para o agendamento_id.
-    """
-    df = carregar_agendamentos()
-    cond = (df["AgendamentoID"] == agendamento_id) & (df["Status"] == "Pendente")
-    if cond.any():
-        df.loc[cond, "Status"] = "Confirmado"
-        salvar_agendamentos(df)
-        return True
-    return False
-
-def criar_pre_agendamento(chat_id: str, nome: str, data: date, horario: str, servicos: list, insta: str = "", ttl_min: int = 20) -> str:
-    """
-    Cria um pré-agendamento (Status 'Pendente') e retorna agendamento_id.
-    'servicos' é a lista de itens (dicts: title, quantity, unit_price).
-    """
-    agendamento_id = _gen_id("AG")
-    servico_label = _itens_to_label(servicos)
-    total = _sum_itens_total(servicos)
-
-    ok = reservar_pendente(
-        agendamento_id=agendamento_id,
-        nome=nome,
-        horario_str=horario,
-        servico_label=servico_label,
-        data=data,
-        insta=insta,
-        chat_id=chat_id,
-        itens=servicos,
-        total=total,
-        ttl_min=ttl_min
-    )
-    if not ok:
-        raise RuntimeError("Horário ficou indisponível durante a reserva.")
-    return agendamento_id
-
-# --- Helpers para validação/leitura de snapshot ---
-def _to_date(d):
-    """Normaliza entrada para tipo date (YYYY-MM-DD)."""
-    if isinstance(d, date):
-        return d
-    try:
-        return pd.to_datetime(d).date()
-    except Exception:
-        return None
-
-def reserva_bate(agendamento_id: str, data_ref, horario_ref: str, chat_id: str | None = None) -> bool:
-    """
-    Verifica se existe uma reserva Pendente com esse agendamento_id e
-    se ela corresponde à mesma data/horário (e chat_id, se fornecido).
-    """
-    df = carregar_agendamentos()
-    if df.empty:
-        return False
-
-    data_ref = _to_date(data_ref)
-    horario_ref = str(horario_ref)
-
-    cond = (df["AgendamentoID"] == agendamento_id) & (df["Status"] == "Pendente")
-    if data_ref is not None:
-        cond = cond & (df["Data"] == data_ref)
-    if horario_ref:
-        cond = cond & (df["Horário"] == horario_ref)
-    if chat_id:
-        cond = cond & (df["ChatID"] == chat_id)
-
-    return bool(cond.any())
-
-def obter_snapshot(agendamento_id: str) -> dict | None:
-    """
-    Retorna {'itens': list, 'total': float} do pré-agendamento.
-    """
-    df = carregar_agendamentos()
-    rows = df[df["AgendamentoID"] == agendamento_id]
-    if rows.empty:
-        return None
-    row = rows.iloc[0]
-    try:
-        itens = json.loads(row.get("ItensJSON") or "[]")
-    except Exception:
-        itens = []
-    total = float(row.get("Total") or 0.0)
-    return {"itens": itens, "total": total}
-
-# =============================
-# Novos helpers (status / expiração / expira_em breve)
-# =============================
-def obter_por_id(agendamento_id: str) -> dict | None:
-    """
-    Retorna um dicionário com os campos do agendamento (ou None se não encontrado).
-    """
-    df = carregar_agendamentos()
-    rows = df[df["AgendamentoID"] == agendamento_id]
-    if rows.empty:
-        return None
-    row = rows.iloc[0].to_dict()
-    # normaliza tipos
-    if isinstance(row.get("Data"), pd.Timestamp):
-        row["Data"] = row["Data"].date()
-    try:
-        row["Total"] = float(row.get("Total") or 0.0)
-    except Exception:
-        row["Total"] = 0.0
-    return row
-
-def consultar_status(agendamento_id: str) -> str | None:
-    """
-    Retorna o Status do agendamento (ex.: 'Pendente', 'Confirmado', 'Expirado') ou None.
-    """
-    df = carregar_agendamentos()
-    rows = df[df["AgendamentoID"] == agendamento_id]
-    if rows.empty:
-        return None
-    status_txt = str(rows.iloc[0]["Status"]).strip()
-    return status_txt or None
-
-def marcar_expirado(agendamento_id: str) -> bool:
-    """
-    Força a marcação de 'Expirado' se ainda estiver 'Pendente'.
-    Retorna True se alterou, False caso contrário.
-    """
-    df = carregar_agendamentos()
-    cond = (df["AgendamentoID"] == agendamento_id) & (df["Status"] == "Pendente")
-    if cond.any():
-        df.loc[cond, "Status"] = "Expirado"
-        salvar_agendamentos(df)
-        return True
-    return False
-
-def listar_pendentes_prestes_a_expirar(janela_min: int = 5) -> list[dict]:
-    """
-    Lista reservas 'Pendente' cujo Expira_em acontece nos próximos 'janela_min' minutos.
-    Ideal para lembrete proativo via WhatsApp.
-    """
-    limpar_expirados()  # já marca os que passaram
-    df = carregar_agendamentos()
-    if df.empty:
-        return []
-
-    now = _now()
-    limite = now + timedelta(minutes=janela_min)
-
-    candidatos = []
-    pendentes = df[df["Status"] == "Pendente"]
-
-    for _, row in pendentes.iterrows():
-        expira_str = str(row.get("Expira_em") or "")
-        expira_dt = _parse_ts(expira_str) if expira_str else None
-        if not expira_dt:
-            continue
-        if now < expira_dt <= limite:
-            candidatos.append({
-                "AgendamentoID": row.get("AgendamentoID"),
-                "ChatID": row.get("ChatID"),
-                "Nome": row.get("Nome"),
-                "Data": row.get("Data"),
-                "Horário": row.get("Horário"),
-                "Expira_em": expira_str,
-                "Serviço": row.get("Serviço"),
-                "Total": float(row.get("Total") or 0.0)
-            })
-    return candidatos
-
-# =============================
-# Registro direto (sem pagamento)
-# =============================
-def registrar_agendamento(nome, horario_str, servico, data=None, insta="", chat_id=""):
-    """
-    Caso precise registrar sem passar por pagamento (uso administrativo).
-    Já grava como 'Confirmado'.
-    """
-    if data is None:
-        data = date.today()
-    if not horario_disponivel(horario_str, data):
-        return False
-
-    df = carregar_agendamentos()
-    now = _now()
-    novo = pd.DataFrame([{
-        "AgendamentoID": _gen_id("AG"),
-        "Nome": (nome or "Cliente").strip().title(),
-        "Data": data,
-        "Horário": str(horario_str),
-        "Serviço": (servico or "").strip().title(),
-        "Insta": insta or "",
-        "Status": "Confirmado",
-        "Agendado_em": _fmt_ts(now),
-        "Expira_em": "",
-        "ChatID": chat_id or "",
-        "ItensJSON": "[]",
-        "Total": 0.0
-    }])
-    df = pd.concat([df, novo], ignore_index=True)
-    salvar_agendamentos(df)
-    return True
+from __future__ import annotations
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING
+from datetime import datetime, date, timedelta
+import uuid
+import orjson
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+# pandas só é importado nas rotinas legadas/administrativas (DataFrame, planilha);
+# consultas de disponibilidade e reservas usam apenas sqlite3.
+
+BASE_DIR = os.path.dirname(__file__)
+PLANILHA_PATH = os.path.join(BASE_DIR, 'agendamentos_empresa1.xlsx')  # legado: importada uma vez para o SQLite
+DB_PATH = os.getenv("AGENDA_DB_PATH") or os.path.join(BASE_DIR, 'agendamentos_empresa1.db')
+BACKUP_DIR = os.path.join(BASE_DIR, 'backups')
+BACKUP_INTERVAL_SEC = int(os.getenv("AGENDA_BACKUP_INTERVAL_SEC", "3600"))
+BACKUP_KEEP = int(os.getenv("AGENDA_BACKUP_KEEP", "168"))  # 7 dias de backups horários
+DF_CACHE_TTL_SEC = float(os.getenv("AGENDA_DF_CACHE_TTL_SEC", "2"))
+SWEEP_INTERVAL_SEC = int(os.getenv("AGENDA_SWEEP_INTERVAL_SEC", "60"))  # 0 desliga a varredura em background
+
+try:
+    os.makedirs(BACKUP_DIR, exist_ok=True)  # uma vez no import, fora do caminho das escritas
+except OSError as e:
+    print(f"[AGENDA] Não foi possível criar {BACKUP_DIR}: {e}")
+
+BLOCOS_HORARIOS = [
+    "08:00", "09:00", "10:00", "11:00",
+    "13:00", "14:00", "15:00", "16:00",
+    "17:00"
+]
+
+COLUNAS = [
+    "AgendamentoID", "Nome", "Data", "Horário",
+    "Serviço", "Insta", "Status", "Agendado_em", "Expira_em", "ChatID",
+    "ItensJSON", "Total"
+]
+
+# =============================
+# Utilidades internas
+# =============================
+def _now():
+    return datetime.now()
+
+def _fmt_ts(ts: datetime) -> str:
+    return ts.strftime("%d/%m/%Y %H:%M:%S")
+
+def _ensure_columns(df: pd.DataFrame) -> pd.DataFrame:
+    import pandas as pd
+    for c in COLUNAS:
+        if c not in df.columns:
+            # Data como NaT, Total como 0.0, demais vazios
+            if c == "Data":
+                df[c] = pd.NaT
+            elif c == "Total":
+                df[c] = 0.0
+            else:
+                df[c] = ""
+
+    # Normalizações
+    if "Data" in df.columns:
+        try:
+            df["Data"] = pd.to_datetime(df["Data"]).dt.date
+        except Exception:
+            pass
+    if "Horário" in df.columns:
+        df["Horário"] = df["Horário"].astype(str)
+    if "Status" in df.columns:
+        df["Status"] = df["Status"].astype(str)
+    if "Total" in df.columns:
+        try:
+            df["Total"] = df["Total"].astype(float)
+        except Exception:
+            pass
+    return df[COLUNAS]
+
+def _gen_id(prefix: str = "AG") -> str:
+    return f"{prefix}-{uuid.uuid4().hex[:10].upper()}"
+
+def _summarize_itens(servicos_itens: list) -> tuple[str, float]:
+    """
+    Uma passada pelos itens ({title, quantity, unit_price}):
+    devolve (texto legível para 'Serviço', total).
+    """
+    if not servicos_itens:
+        return "", 0.0
+    partes, total = [], 0.0
+    for i in servicos_itens:
+        title = (i.get("title") or "").strip()
+        qty = int(i.get("quantity") or 1)
+        total += float(i.get("unit_price", 0.0)) * qty
+        if title:
+            partes.append(f"{title} x{qty}" if qty > 1 else title)
+    return ", ".join(partes), round(total, 2)
+
+def _agora_iso(now: datetime | None = None) -> str:
+    """Agora (ou 'now', já lido pelo chamador) no formato de _SQL_EXPIRA_ISO, para comparar como texto."""
+    return (now or _now()).strftime("%Y-%m-%d %H:%M:%S")
+
+def _data_iso(d) -> str | None:
+    """Data no formato gravado no banco (YYYY-MM-DD)."""
+    if isinstance(d, datetime):
+        return d.date().isoformat()
+    if isinstance(d, date):
+        return d.isoformat()
+    d = _to_date(d)
+    return d.isoformat() if d is not None else None
+
+def _row_to_dict(row: sqlite3.Row) -> dict:
+    d = dict(row)
+    try:
+        d["Data"] = date.fromisoformat(d["Data"]) if d.get("Data") else None
+    except (TypeError, ValueError):
+        pass
+    try:
+        d["Total"] = float(d.get("Total") or 0.0)
+    except Exception:
+        d["Total"] = 0.0
+    return d
+
+# =============================
+# Banco (SQLite)
+# =============================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agendamentos (
+    AgendamentoID TEXT PRIMARY KEY,
+    Nome          TEXT NOT NULL DEFAULT '',
+    Data          TEXT,
+    "Horário"     TEXT NOT NULL DEFAULT '',
+    "Serviço"     TEXT NOT NULL DEFAULT '',
+    Insta         TEXT NOT NULL DEFAULT '',
+    Status        TEXT NOT NULL DEFAULT '',
+    Agendado_em   TEXT NOT NULL DEFAULT '',
+    Expira_em     TEXT NOT NULL DEFAULT '',
+    ChatID        TEXT NOT NULL DEFAULT '',
+    ItensJSON     TEXT NOT NULL DEFAULT '[]',
+    Total         REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS ix_agendamentos_disp ON agendamentos (Data, "Horário", Status);
+CREATE INDEX IF NOT EXISTS ix_agendamentos_status ON agendamentos (Status);
+"""
+
+# Expira_em é gravado como 'dd/mm/YYYY HH:MM:SS'; reordenado vira ISO e compara como texto
+_SQL_EXPIRA_ISO = (
+    "substr(Expira_em, 7, 4) || '-' || substr(Expira_em, 4, 2) || '-' || substr(Expira_em, 1, 2)"
+    " || ' ' || substr(Expira_em, 12, 8)"
+)
+# índice de expressão: a varredura de pendentes vencidos/prestes a vencer vira busca por faixa
+_SQL_INDICE_EXPIRA = (
+    f"CREATE INDEX IF NOT EXISTS ix_agendamentos_status_expira ON agendamentos (Status, ({_SQL_EXPIRA_ISO}))"
+)
+# reserva que ocupa o horário: confirmada, ou pendente ainda dentro do prazo
+_SQL_OCUPA = (
+    "Status IN ('Pendente', 'Confirmado') AND NOT (Status = 'Pendente' "
+    f"AND length(Expira_em) = 19 AND {_SQL_EXPIRA_ISO} < ?)"
+)
+# no máximo uma reserva ativa por (Data, Horário): o próprio banco impede reserva dupla
+_SQL_INDICE_SLOT = (
+    'CREATE UNIQUE INDEX IF NOT EXISTS ux_agendamentos_slot ON agendamentos (Data, "Horário") '
+    "WHERE Status IN ('Pendente', 'Confirmado')"
+)
+
+_SQL_COLS = ", ".join(f'"{c}"' for c in COLUNAS)
+_SQL_INSERT = f"INSERT INTO agendamentos ({_SQL_COLS}) VALUES ({', '.join('?' for _ in COLUNAS)})"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_inicializados: set[str] = set()
+
+def _conn() -> sqlite3.Connection:
+    """Uma conexão por thread (sqlite3 não compartilha conexão entre threads), em autocommit."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    with _init_lock:
+        if DB_PATH not in _inicializados:
+            _init_db(conn)
+            _inicializados.add(DB_PATH)
+            _garantir_varredura()
+    _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+@contextmanager
+def _tx():
+    """Transação de escrita (BEGIN IMMEDIATE: pega o lock de escrita logo no início)."""
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _init_db(conn: sqlite3.Connection):
+    conn.executescript(_SCHEMA)
+    conn.execute(_SQL_INDICE_EXPIRA)
+    try:
+        conn.execute(_SQL_INDICE_SLOT)
+    except sqlite3.IntegrityError:
+        # base antiga com horários duplicados: segue só com a checagem dentro da transação
+        print("[AGENDA] Horários duplicados na agenda; índice único de horário não criado.")
+    # user_version marca a importação da planilha antiga (roda uma única vez)
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            n = _importar_planilha(conn)
+            conn.execute("PRAGMA user_version = 1")
+            if n:
+                print(f"[AGENDA] {n} agendamentos importados de {PLANILHA_PATH}")
+        conn.execute("COMMIT")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+
+def _df_to_rows(df: pd.DataFrame) -> list[tuple]:
+    import pandas as pd
+    df = _ensure_columns(df.copy())
+    rows = []
+    for rec in df.to_dict("records"):
+        ag_id = rec.get("AgendamentoID")
+        if pd.isna(ag_id) or not str(ag_id).strip():
+            ag_id = _gen_id("AG")
+        row = []
+        for c in COLUNAS:
+            v = rec.get(c)
+            if c == "AgendamentoID":
+                v = str(ag_id)
+            elif c == "Data":
+                v = None if pd.isna(v) else _data_iso(v)
+            elif c == "Total":
+                v = 0.0 if pd.isna(v) else float(v)
+            else:
+                v = "" if pd.isna(v) else str(v)
+            row.append(v)
+        rows.append(tuple(row))
+    return rows
+
+def _importar_planilha(conn: sqlite3.Connection) -> int:
+    if not os.path.exists(PLANILHA_PATH):
+        return 0
+    import pandas as pd
+    rows = _df_to_rows(pd.read_excel(PLANILHA_PATH))
+    conn.executemany(_SQL_INSERT.replace("INSERT", "INSERT OR IGNORE", 1), rows)
+    return len(rows)
+
+_backup_lock = threading.Lock()
+_last_backup_ts = 0.0
+
+def _backup_periodico():
+    """
+    No máximo um backup do banco por BACKUP_INTERVAL_SEC, disparado pelas escritas.
+    A cópia roda numa thread própria: a escrita (e o webhook que a chamou) não espera o backup.
+    """
+    if time.time() - _last_backup_ts < BACKUP_INTERVAL_SEC or _backup_lock.locked():
+        return
+    threading.Thread(target=_fazer_backup, name="agenda-backup", daemon=True).start()
+
+def _fazer_backup():
+    """Copia para .tmp e faz os.replace (nunca fica backup pela metade); mantém os BACKUP_KEEP mais recentes."""
+    global _last_backup_ts
+    if not _backup_lock.acquire(blocking=False):
+        return  # outra thread já está fazendo
+    try:
+        agora = time.time()
+        if agora - _last_backup_ts < BACKUP_INTERVAL_SEC:
+            return
+        _last_backup_ts = agora
+        destino = os.path.join(BACKUP_DIR, f"backup_{_now().strftime('%Y%m%d_%H%M%S')}.db")
+        tmp = destino + ".tmp"
+        src, dst = sqlite3.connect(DB_PATH), sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, destino)
+
+        for antigo in sorted(Path(BACKUP_DIR).glob("backup_*.db"))[:-BACKUP_KEEP]:
+            antigo.unlink(missing_ok=True)
+    except Exception as e:
+        print(f"[AGENDA] Falha no backup: {e}")
+    finally:
+        _backup_lock.release()
+
+# =============================
+# IO (compatibilidade com o formato antigo em DataFrame)
+# =============================
+# DataFrame da tabela inteira, reaproveitado por DF_CACHE_TTL_SEC; toda escrita invalida
+_df_cache = {"df": None, "ts": 0.0}
+
+def _invalidar_cache():
+    _df_cache["ts"] = 0.0
+
+def carregar_agendamentos(fresco: bool = False) -> pd.DataFrame:
+    """
+    Tabela inteira como DataFrame (mesmas colunas da planilha antiga).
+    Só para usos administrativos/legados; os caminhos quentes consultam o banco direto.
+    Devolve uma cópia do cache se ele tiver menos de DF_CACHE_TTL_SEC; fresco=True força a leitura.
+    """
+    cache = _df_cache
+    if not fresco and cache["df"] is not None and time.monotonic() - cache["ts"] < DF_CACHE_TTL_SEC:
+        return cache["df"].copy()
+
+    import pandas as pd
+    df = _ensure_columns(pd.read_sql_query(f"SELECT {_SQL_COLS} FROM agendamentos ORDER BY rowid", _conn()))
+    cache["df"], cache["ts"] = df, time.monotonic()
+    return df.copy()
+
+def salvar_agendamentos(df: pd.DataFrame):
+    """Substitui a tabela inteira pelo DataFrame (compatibilidade; prefira as funções pontuais)."""
+    rows = _df_to_rows(df)
+    with _tx() as conn:
+        conn.execute("DELETE FROM agendamentos")
+        conn.executemany(_SQL_INSERT, rows)
+    _invalidar_cache()
+    _backup_periodico()
+
+def exportar_excel(destino: str | None = None) -> str:
+    """Exporta a agenda para .xlsx sob demanda (comando administrativo). Retorna o caminho gerado."""
+    if destino is None:
+        destino = os.path.join(BACKUP_DIR, f"export_{_now().strftime('%Y%m%d_%H%M%S')}.xlsx")
+    carregar_agendamentos(fresco=True).to_excel(destino, index=False)
+    return destino
+
+# =============================
+# Limpeza de reservas expiradas
+# =============================
+def limpar_expirados():
+    """Marca como 'Expirado' toda reserva 'Pendente' vencida, num único UPDATE."""
+    cur = _conn().execute(
+        "UPDATE agendamentos SET Status = 'Expirado' "
+        "WHERE Status = 'Pendente' AND length(Expira_em) = 19 "
+        f"AND {_SQL_EXPIRA_ISO} < ?",
+        (_agora_iso(),),
+    )
+    if cur.rowcount > 0:
+        _invalidar_cache()
+
+# Varredura periódica em background: as consultas do atendimento não pagam o UPDATE.
+# Até a próxima passada, pendente vencido já conta como livre (_SQL_OCUPA).
+_varredura_thread: threading.Thread | None = None
+
+def _varredura_loop():
+    while True:
+        time.sleep(SWEEP_INTERVAL_SEC)
+        try:
+            limpar_expirados()
+        except Exception as e:
+            print(f"[AGENDA] Falha na varredura de expirados: {e}")
+
+def _garantir_varredura():
+    global _varredura_thread
+    if SWEEP_INTERVAL_SEC <= 0 or _varredura_thread is not None:
+        return
+    _varredura_thread = threading.Thread(target=_varredura_loop, name="agenda-sweeper", daemon=True)
+    _varredura_thread.start()
+
+# =============================
+# Consulta de disponibilidade
+# =============================
+def listar_blocos_disponiveis(data=None, exibir_nomes: bool=False) -> str:
+    """
+    Retorna uma string com a lista de horários e marcações Livre/Ocupado.
+    """
+    now = _now()  # uma leitura do relógio por chamada
+    if data is None:
+        data = now.date()
+
+    # bloqueia pendente no prazo/confirmado; guarda o primeiro nome de cada horário
+    ocupados: dict[str, str] = {}
+    for hora, nome in _conn().execute(
+        f'SELECT "Horário", Nome FROM agendamentos WHERE Data = ? AND {_SQL_OCUPA} ORDER BY rowid',
+        (_data_iso(data), _agora_iso(now)),
+    ):
+        ocupados.setdefault(hora, nome)
+
+    def _linhas():
+        for i, bloco in enumerate(BLOCOS_HORARIOS, 1):
+            if bloco in ocupados:
+                nome = ocupados[bloco] if exibir_nomes else ""
+                label = f"❌ Ocupado — {nome}" if nome else "❌ Ocupado"
+            else:
+                label = "✅ Livre"
+            yield f"{i} - {bloco} - {label}"
+
+    return "\n".join(_linhas())
+
+def horario_disponivel(horario_str, data=None) -> bool:
+    now = _now()
+    if data is None:
+        data = now.date()
+    row = _conn().execute(
+        f'SELECT 1 FROM agendamentos WHERE Data = ? AND "Horário" = ? AND {_SQL_OCUPA} LIMIT 1',
+        (_data_iso(data), str(horario_str), _agora_iso(now)),
+    ).fetchone()
+    return row is None
+
+# =============================
+# Reserva / confirmação (para pagamentos)
+# =============================
+def _inserir(row: dict, now: datetime) -> bool:
+    """
+    Ocupa o horário de forma atômica: numa única transação (BEGIN IMMEDIATE) expira
+    a pendência vencida daquele horário, confere se está livre e insere.
+    Dois workers disputando o mesmo (Data, Horário) não passam os dois.
+    'now' é o mesmo instante usado em Agendado_em/Expira_em da linha.
+    """
+    params = tuple(row[c] for c in COLUNAS)
+    try:
+        with _tx() as conn:
+            conn.execute(
+                "UPDATE agendamentos SET Status = 'Expirado' "
+                'WHERE Data = ? AND "Horário" = ? '
+                "AND Status = 'Pendente' AND length(Expira_em) = 19 "
+                f"AND {_SQL_EXPIRA_ISO} < ?",
+                (row["Data"], row["Horário"], _agora_iso(now)),
+            )
+            ocupado = conn.execute(
+                'SELECT 1 FROM agendamentos WHERE Data = ? AND "Horário" = ? '
+                "AND Status IN ('Pendente', 'Confirmado') LIMIT 1",
+                (row["Data"], row["Horário"]),
+            ).fetchone()
+            if ocupado is not None:
+                return False
+            conn.execute(_SQL_INSERT, params)
+    except sqlite3.IntegrityError:
+        # AgendamentoID repetido (ou horário tomado, pelo índice único)
+        return False
+    _invalidar_cache()
+    _backup_periodico()
+    return True
+
+def reservar_pendente(
+    agendamento_id,
+    nome,
+    horario_str,
+    servico_label,
+    data,
+    insta="",
+    chat_id="",
+    itens=None,      # <- snapshot dos itens
+    total=None,      # <- total calculado
+    ttl_min=20
+) -> bool:
+    """
+    Cria uma linha 'Pendente' (reserva) por ttl_min minutos.
+    'servico_label' é string (ex.: "Corte social, Barba").
+    Retorna False se o horário já estiver ocupado (checagem atômica em _inserir).
+    """
+    now = _now()
+    expira_em = now + timedelta(minutes=ttl_min)
+
+    if total is None and itens:
+        total = _summarize_itens(itens)[1]
+    if total is None:
+        total = 0.0
+
+    itens_json = orjson.dumps(itens or []).decode()  # UTF-8 direto, como ensure_ascii=False
+
+    return _inserir({
+        "AgendamentoID": agendamento_id,
+        "Nome": (nome or "Cliente").strip().title(),
+        "Data": _data_iso(data),
+        "Horário": str(horario_str),
+        "Serviço": (servico_label or "").strip(),
+        "Insta": insta or "",
+        "Status": "Pendente",
+        "Agendado_em": _fmt_ts(now),
+        "Expira_em": _fmt_ts(expira_em),
+        "ChatID": chat_id or "",
+        "ItensJSON": itens_json,
+        "Total": float(total)
+    }, now)
+
+def confirmar_pagamento(agendamento_id) -> bool:
+    """
+    Marca 'Pendente' -> 'Confirmado' para o agendamento_id.
+    """
+    cur = _conn().execute(
+        "UPDATE agendamentos SET Status = 'Confirmado' WHERE AgendamentoID = ? AND Status = 'Pendente'",
+        (agendamento_id,),
+    )
+    if cur.rowcount > 0:
+        _invalidar_cache()
+        _backup_periodico()
+        return True
+    return False
+
+def criar_pre_agendamento(chat_id: str, nome: str, data: date, horario: str, servicos: list, insta: str = "", ttl_min: int = 20) -> str:
+    """
+    Cria um pré-agendamento (Status 'Pendente') e retorna agendamento_id.
+    'servicos' é a lista de itens (dicts: title, quantity, unit_price).
+    """
+    agendamento_id = _gen_id("AG")
+    servico_label, total = _summarize_itens(servicos)
+
+    ok = reservar_pendente(
+        agendamento_id=agendamento_id,
+        nome=nome,
+        horario_str=horario,
+        servico_label=servico_label,
+        data=data,
+        insta=insta,
+        chat_id=chat_id,
+        itens=servicos,
+        total=total,
+        ttl_min=ttl_min
+    )
+    if not ok:
+        raise RuntimeError("Horário ficou indisponível durante a reserva.")
+    return agendamento_id
+
+# --- Helpers para validação/leitura de snapshot ---
+def _to_date(d):
+    """Normaliza entrada para tipo date (YYYY-MM-DD)."""
+    if isinstance(d, date):
+        return d
+    if isinstance(d, str):
+        # caso comum ('YYYY-MM-DD' ou ISO com hora): sem passar pelo parser do pandas
+        try:
+            return date.fromisoformat(d[:10])
+        except ValueError:
+            pass
+    try:
+        import pandas as pd
+        return pd.to_datetime(d).date()
+    except Exception:
+        return None
+
+# texto SQL fixo (filtros opcionais no próprio WHERE): uma busca pela PK, com o
+# statement preparado reaproveitado pelo cache do sqlite3 em toda chamada
+_SQL_RESERVA_BATE = (
+    "SELECT 1 FROM agendamentos WHERE AgendamentoID = ?1 AND Status = 'Pendente' "
+    "AND (?2 IS NULL OR Data = ?2) "
+    "AND (?3 = '' OR \"Horário\" = ?3) "
+    "AND (?4 = '' OR ChatID = ?4) LIMIT 1"
+)
+
+def reserva_bate(agendamento_id: str, data_ref, horario_ref: str, chat_id: str | None = None) -> bool:
+    """
+    Verifica se existe uma reserva Pendente com esse agendamento_id e
+    se ela corresponde à mesma data/horário (e chat_id, se fornecido).
+    """
+    data_iso = _data_iso(data_ref)
+    return _conn().execute(
+        _SQL_RESERVA_BATE, (agendamento_id, data_iso, str(horario_ref), chat_id or ""),
+    ).fetchone() is not None
+
+def obter_snapshot(agendamento_id: str) -> dict | None:
+    """
+    Retorna {'itens': list, 'total': float} do pré-agendamento.
+    """
+    row = _conn().execute(
+        "SELECT ItensJSON, Total FROM agendamentos WHERE AgendamentoID = ? LIMIT 1",
+        (agendamento_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    try:
+        itens = orjson.loads(row["ItensJSON"] or "[]")
+    except Exception:
+        itens = []
+    total = float(row["Total"] or 0.0)
+    return {"itens": itens, "total": total}
+
+# =============================
+# Novos helpers (status / expiração / expira_em breve)
+# =============================
+def obter_por_id(agendamento_id: str) -> dict | None:
+    """
+    Retorna um dicionário com os campos do agendamento (ou None se não encontrado).
+    """
+    row = _conn().execute(
+        f"SELECT {_SQL_COLS} FROM agendamentos WHERE AgendamentoID = ? LIMIT 1",
+        (agendamento_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    return _row_to_dict(row)
+
+def consultar_status(agendamento_id: str) -> str | None:
+    """
+    Retorna o Status do agendamento (ex.: 'Pendente', 'Confirmado', 'Expirado') ou None.
+    """
+    row = _conn().execute(
+        "SELECT Status FROM agendamentos WHERE AgendamentoID = ? LIMIT 1",
+        (agendamento_id,),
+    ).fetchone()
+    if row is None:
+        return None
+    status_txt = str(row[0] or "").strip()
+    return status_txt or None
+
+def marcar_expirado(agendamento_id: str) -> bool:
+    """
+    Força a marcação de 'Expirado' se ainda estiver 'Pendente'.
+    Retorna True se alterou, False caso contrário.
+    """
+    cur = _conn().execute(
+        "UPDATE agendamentos SET Status = 'Expirado' WHERE AgendamentoID = ? AND Status = 'Pendente'",
+        (agendamento_id,),
+    )
+    if cur.rowcount > 0:
+        _invalidar_cache()
+        return True
+    return False
+
+def listar_ids_por_status(status: str) -> set[str]:
+    """
+    Retorna o conjunto de AgendamentoID com o Status informado.
+    """
+    cur = _conn().execute("SELECT AgendamentoID FROM agendamentos WHERE Status = ?", (status,))
+    return {r[0] for r in cur if r[0]}
+
+def carregar_por_ids(ids) -> list[dict]:
+    """
+    Retorna as linhas (como dicts) dos agendamentos cujos IDs estão em 'ids'.
+    """
+    ids = [str(i) for i in {str(i) for i in (ids or ())}]
+    if not ids:
+        return []
+    conn = _conn()
+    rows = []
+    # lotes abaixo do limite de parâmetros do SQLite
+    for i in range(0, len(ids), 500):
+        lote = ids[i:i + 500]
+        rows.extend(conn.execute(
+            f"SELECT {_SQL_COLS} FROM agendamentos WHERE AgendamentoID IN ({', '.join('?' for _ in lote)})",
+            lote,
+        ))
+    return [_row_to_dict(r) for r in rows]
+
+def listar_pendentes_prestes_a_expirar(janela_min: int = 5) -> list[dict]:
+    """
+    Lista reservas 'Pendente' cujo Expira_em acontece nos próximos 'janela_min' minutos.
+    Ideal para lembrete proativo via WhatsApp.
+    """
+    now = _now()
+    limite = now + timedelta(minutes=janela_min)
+
+    # filtro de faixa no próprio banco (índice ix_agendamentos_status_expira), sem parse linha a linha
+    cur = _conn().execute(
+        'SELECT AgendamentoID, ChatID, Nome, Data, "Horário", Expira_em, "Serviço", Total '
+        "FROM agendamentos WHERE Status = 'Pendente' AND length(Expira_em) = 19 "
+        f"AND {_SQL_EXPIRA_ISO} > ? AND {_SQL_EXPIRA_ISO} <= ? ORDER BY rowid",
+        (now.strftime("%Y-%m-%d %H:%M:%S"), limite.strftime("%Y-%m-%d %H:%M:%S")),
+    )
+    return [_row_to_dict(r) for r in cur]
+
+# =============================
+# Registro direto (sem pagamento)
+# =============================
+def registrar_agendamento(nome, horario_str, servico, data=None, insta="", chat_id=""):
+    """
+    Caso precise registrar sem passar por pagamento (uso administrativo).
+    Já grava como 'Confirmado'.
+    """
+    now = _now()
+    if data is None:
+        data = now.date()
+
+    return _inserir({
+        "AgendamentoID": _gen_id("AG"),
+        "Nome": (nome or "Cliente").strip().title(),
+        "Data": _data_iso(data),
+        "Horário": str(horario_str),
+        "Serviço": (servico or "").strip().title(),
+        "Insta": insta or "",
+        "Status": "Confirmado",
+        "Agendado_em": _fmt_ts(now),
+        "Expira_em": "",
+        "ChatID": chat_id or "",
+        "ItensJSON": "[]",
+        "Total": 0.0
+    }, now)
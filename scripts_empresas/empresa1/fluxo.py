@@ -1,775 +1,841 @@
-from flask import jsonify
-from .ai_bot import AIBot as _AIBot  # marcado como _ para evitar aviso de 'unused import'
-from .agenda import (
-    listar_blocos_disponiveis,
-    horario_disponivel,
-    BLOCOS_HORARIOS
-)
-from datetime import datetime, date
-import re
-from collections import OrderedDict
-
-import os, json  # ADICIONE
-from decimal import Decimal, ROUND_HALF_UP  # ADICIONE
-
-CAT_PATH = os.path.join(os.path.dirname(__file__), "catalogo.json")
-
-def _load_catalogo():
-    try:
-        with open(CAT_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-    except FileNotFoundError:
-        return {}
-
-    by_code = {
-        str(s.get("code")).strip(): s
-        for s in data.get("services", [])
-        if s.get("active", True) and s.get("code") is not None
-    }
-    return by_code
-
-CATALOGO = _load_catalogo()
-
-# Base interna da API (para chamadas dentro do container)
-API_INTERNAL_BASE = os.getenv("API_INTERNAL_BASE", "http://api:8000").rstrip("/")
-
-def _fmt_brl(v: float | int) -> str:
-    d = Decimal(str(v)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
-    # formata como R$ 1.234,56
-    s = f"{d:,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
-    return f"R$ {s}"
-
-def _mk_item_from_code(code: str):
-    s = CATALOGO.get(str(code))
-    if not s:
-        return None
-    try:
-        price = float(s.get("price"))
-    except (TypeError, ValueError):
-        return None
-    return {"title": s["label"], "quantity": 1, "unit_price": price}
-
-    
-# ==========================
-# Helpers de UI / Texto
-# ==========================
-EMOJI_TO_NUM = {
-    "1️⃣": "1", "2️⃣": "2", "3️⃣": "3", "4️⃣": "4", "5️⃣": "5",
-    "6️⃣": "6", "7️⃣": "7", "8️⃣": "8", "9️⃣": "9", "0️⃣": "0"
-}
-
-def _chip(n, label):
-    nums = {"1":"1️⃣","2":"2️⃣","3":"3️⃣","4":"4️⃣","5":"5️⃣","6":"6️⃣","7":"7️⃣","8":"8️⃣","9":"9️⃣","0":"0️⃣"}
-    return f"{nums.get(str(n), str(n))} {label}"
-
-def _norm(txt: str) -> str:
-    t = (txt or "").strip()
-    for e, n in EMOJI_TO_NUM.items():
-        t = t.replace(e, n)
-    t = t.replace("\u200b", "").replace("\u200c", "")
-    return re.sub(r"\s+", " ", t).strip()
-
-def _caixa(titulo: str, conteudo: str) -> str:
-    header = "╔════════════════════════╗"
-    mid    = "╠════════════════════════╣"
-    bot    = "╚════════════════════════╝"
-    return f"{header}\n    {titulo}\n{mid}\n{conteudo}\n{bot}"
-
-def _footer_comandos_inline() -> str:
-    return "ℹ️ Comandos rápidos:\n   • Menu   • Voltar   • Cancelar   • Ajuda   • Atendente"
-
-def _footer_tips_sel() -> str:
-    return (
-        "✨ Adicione mais serviços\n"
-        "📝 Digite *pronto* para finalizar\n"
-        "❌ Digite *remover* para tirar um item\n"
-        "🧹 Digite *limpar* para esvaziar tudo"
-    )
-
-# ==========================
-# Estado / Navegação
-# ==========================
-def _get(fluxo_usuario, chat_id):
-    if chat_id not in fluxo_usuario:
-        fluxo_usuario[chat_id] = {"etapa": "menu", "ctx": {}, "pilha": []}
-    fluxo_usuario[chat_id].setdefault("ctx", {})
-    fluxo_usuario[chat_id].setdefault("pilha", [])
-    return fluxo_usuario[chat_id]
-
-def _push(state, new_state):
-    state["pilha"].append(state["etapa"])
-    state["etapa"] = new_state
-
-def _goto(state, new_state):
-    state["etapa"] = new_state
-
-def _back(state):
-    if state["pilha"]:
-        state["etapa"] = state["pilha"].pop()
-        return True
-    return False
-
-def _reset(state):
-    state["etapa"] = "menu"
-    state["ctx"] = {}
-    state["pilha"] = []
-    
-# ==========================
-# Datas
-# ==========================
-def _parse_data(msg: str) -> date | None:
-    m = re.match(r"^\s*(\d{1,2})[/-](\d{1,2})\s*$", msg)
-    if not m:
-        return None
-    d, mth = int(m.group(1)), int(m.group(2))
-    now = datetime.now()
-    y = now.year
-    try:
-        dt = date(y, mth, d)
-    except ValueError:
-        return None
-    if dt < now.date():
-        try:
-            dt = date(y + 1, mth, d)
-        except ValueError:
-            return None
-    return dt
-
-def _is_universal(cmd: str) -> str | None:
-    key = _norm(cmd).lower()
-    if key in {"menu", "início", "inicio"}:
-        return "menu"
-    if key == "voltar":
-        return "voltar"
-    if key == "cancelar":
-        return "cancelar"
-    if key == "ajuda":
-        return "ajuda"
-    if key in {"atendente", "falar com atendente", "humano"}:
-        return "atendente"
-    return None
-
-# ==========================
-# Catálogo de serviços
-# ==========================
-SERVICOS = OrderedDict([
-    ("1", {"slug": "corte social", "label": "Corte social", "emoji": "💇"}),
-    ("2", {"slug": "degradê", "label": "Degradê", "emoji": "🌀"}),
-    ("3", {"slug": "sobrancelha", "label": "Sobrancelha", "emoji": "✨"}),
-    ("4", {"slug": "barba", "label": "Barba", "emoji": "🧔"}),
-])
-SERVICOS_BY_NAME = {v["slug"]: k for k, v in SERVICOS.items()}
-SERVICOS_BY_NAME.update({v["label"].lower(): k for k, v in SERVICOS.items()})
-
-def _catalogo_texto():
-    linhas = []
-    for k, v in SERVICOS.items():
-        linhas.append(f"  {_chip(k, v['label'])}  {v['emoji']}")
-    return "\n".join(linhas)
-
-def _render_carrinho(ids, indent="     "):
-    if not ids:
-        return f"{indent}— (vazio)"
-    linhas = []
-    for sid in ids:
-        if sid in SERVICOS:
-            linhas.append(f"{indent}{_chip(sid, SERVICOS[sid]['label'])}")
-    return "\n".join(linhas)
-
-def _parse_servicos_input(texto: str):
-    raw = re.split(r"[,\s]+", _norm(texto).lower())
-    found = []
-    for token in raw:
-        if not token:
-            continue
-        if token in SERVICOS:
-            found.append(token)
-            continue
-        k = SERVICOS_BY_NAME.get(token)
-        if k:
-            found.append(k)
-    seen, ordered = set(), []
-    for x in found:
-        if x not in seen:
-            seen.add(x)
-            ordered.append(x)
-    return ordered
-
-# ==========================
-# Menu principal
-# ==========================
-def _send_menu(waha, chat_id):
-    titulo = "💈 Barbearia do ERIK"
-    conteudo = (
-        f"{_chip(1, 'Agendar horário')}\n"
-        f"{_chip(2, 'Ver serviços')}\n"
-        f"{_chip(3, 'Ver horários disponíveis')}\n"
-        f"{_chip(4, 'Falar com atendente')}"
-    )
-    rodape = _footer_comandos_inline()
-    msg = _caixa(titulo, conteudo) + "\n\n" + rodape
-    waha.send_message(chat_id, msg)
-
-# ==========================
-# Router do menu
-# ==========================
-MENU_ROUTER = {
-    "1": "agendar", "agendar": "agendar", "agendamento": "agendar",
-    "agendar horario": "agendar", "agendar horário": "agendar",
-    "2": "servicos", "servicos": "servicos", "serviços": "servicos",
-    "ver servicos": "servicos", "ver serviços": "servicos",
-    "3": "ver_horarios", "ver horarios": "ver_horarios", "ver horários": "ver_horarios",
-    "horarios": "ver_horarios", "horários": "ver_horarios",
-    "4": "atendente", "atendente": "atendente", "falar com atendente": "atendente", "humano": "atendente",
-}
-
-TEXTUAL_TRIGGERS = {
-    "agendar", "agendamento", "agendar horario", "agendar horário",
-    "servicos", "serviços", "ver servicos", "ver serviços",
-    "ver horarios", "ver horários", "horarios", "horários",
-    "atendente", "falar com atendente", "humano",
-}
-
-def _handle_menu_action(escolha: str, estado, ctx, chat_id, waha):
-    if escolha == "agendar":
-        _push(estado, "selecionar_servicos")
-        ctx["servicos"] = []
-        titulo = "✍ Selecione os serviços"
-        conteudo = _catalogo_texto()
-        msg = _caixa(titulo, conteudo) + "\n\n" + \
-            "ℹ️ Dica:\n   envie números (ex.: 1,3) ou nomes (ex.: corte social, barba)."
-        waha.send_message(chat_id, msg)
-        return
-
-    if escolha == "servicos":
-        titulo = "📋 Serviços disponíveis"
-        conteudo = _catalogo_texto()
-        msg = _caixa(titulo, conteudo) + "\n\n" + "Para agendar, escolha 1 no menu ou digite Agendar."
-        waha.send_message(chat_id, msg)
-        _goto(estado, "menu")
-        return
-
-    if escolha == "ver_horarios":
-        hoje = date.today()
-        ctx["consulta_data"] = hoje
-        _goto(estado, "ver_horarios_listar")
-
-        horarios = listar_blocos_disponiveis(hoje, exibir_nomes=True)
-        if not horarios or horarios.strip() == "":
-            waha.send_message(
-                chat_id,
-                _caixa(
-                    "📅 Consulta — Hoje",
-                    f"Não encontrei horários para {hoje.strftime('%d/%m/%Y')}."
-                )
-            )
-            waha.send_message(
-                chat_id,
-                _caixa(
-                    "ℹ️ Como proceder",
-                    "• Para *agendar*, digite: agendar\n"
-                    "• Para ver outra *data*, envie: DD/MM (ex.: 15/08)\n"
-                    "• Ou digite: menu"
-                )
-            )
-            return
-
-        titulo = f"📅 Consulta — {hoje.strftime('%d/%m/%Y')}"
-        conteudo = (
-            f"⏰ Disponíveis:\n{horarios}\n\n"
-            "Para *agendar*, digite: agendar\n"
-            "Para consultar outra *data*, envie: DD/MM (ex.: 15/08)"
-        )
-        waha.send_message(chat_id, _caixa(titulo, conteudo))
-        return
-
-    if escolha == "atendente":
-        titulo = "👨‍💼 Atendente"
-        conteudo = "Certo! Um atendente vai te chamar em instantes."
-        waha.send_message(chat_id, _caixa(titulo, conteudo))
-        _goto(estado, "menu")
-        _send_menu(waha, chat_id)
-        return
-
-# ==========================
-# Fluxo principal
-# ==========================
-def processar(chat_id, msg, nome_empresa, waha, fluxo_usuario):
-    estado = _get(fluxo_usuario, chat_id)
-    ctx = estado["ctx"]
-    msg_original = msg or ""
-    msg_norm = _norm(msg_original)
-    msg_lower = msg_norm.lower()
-
-    # 1) Comandos UNIVERSAIS
-    uni = _is_universal(msg_original)
-    if uni == "menu":
-        _reset(estado)
-        _send_menu(waha, chat_id)
-        return jsonify({"status": "success"}), 200
-    if uni == "voltar":
-        if _back(estado):
-            waha.send_message(chat_id, _caixa("↩️ Voltar", "Voltei para a etapa anterior. Vamos continuar?"))
-        else:
-            waha.send_message(chat_id, _caixa("↩️ Início", "Você já está no início. Digite menu para recomeçar."))
-        return jsonify({"status": "success"}), 200
-    if uni == "cancelar":
-        _reset(estado)
-        waha.send_message(chat_id, _caixa("✅ Fluxo cancelado", "Voltei ao menu principal."))
-        _send_menu(waha, chat_id)
-        return jsonify({"status": "success"}), 200
-    if uni == "ajuda":
-        conteudo = (
-            "• Use menu para voltar ao início\n"
-            "• voltar para etapa anterior\n"
-            "• cancelar para encerrar\n"
-            "• atendente para falar com humano\n\n"
-            "Ex.: “agendar amanhã às 14h”"
-        )
-        waha.send_message(chat_id, _caixa("🆘 Ajuda rápida", conteudo))
-        return jsonify({"status": "success"}), 200
-    if uni == "atendente":
-        _reset(estado)
-        waha.send_message(chat_id, _caixa("👩‍💼 Atendente", "Perfeito! Vou te direcionar para um atendente agora."))
-        _send_menu(waha, chat_id)
-        return jsonify({"status": "success"}), 200
-
-    # 1.1) Comandos rápidos de pagamento  (<<< fora do bloco do 'atendente')
-    if msg_lower in {"status", "status do pagamento", "pagamento"}:
-        from . import agenda
-        ag_id = ctx.get("ultimo_agendamento_id")
-        if not ag_id:
-            waha.send_message(chat_id, _caixa("ℹ️ Status", "Não encontrei um pagamento pendente recente. Digite *agendar* para começar."))
-            return jsonify({"status": "success"}), 200
-
-        # tenta função dedicada; se não houver, consulta direto a planilha
-        status_txt = None
-        if hasattr(agenda, "consultar_status"):
-            try:
-                status_txt = agenda.consultar_status(ag_id)
-            except Exception:
-                status_txt = None
-        if not status_txt:
-            try:
-                df = agenda.carregar_agendamentos()
-                row = df.loc[df["AgendamentoID"] == ag_id]
-                if not row.empty:
-                    status_txt = str(row.iloc[0]["Status"])
-            except Exception:
-                status_txt = None
-
-        if not status_txt:
-            waha.send_message(chat_id, _caixa("ℹ️ Status", f"Agendamento {ag_id}\nStatus: _indisponível agora_."))
-        else:
-            waha.send_message(chat_id, _caixa("ℹ️ Status do pagamento", f"Agendamento {ag_id}\nStatus: *{status_txt}*"))
-        return jsonify({"status": "success"}), 200
-
-    if msg_lower in {"reenviar pix", "reenvia pix", "pix de novo", "pagar agora"}:
-        import requests
-        from . import agenda
-        ag_id = ctx.get("ultimo_agendamento_id")
-        payload = ctx.get("ultimo_pix_payload") or {}
-
-        if not ag_id or not payload:
-            waha.send_message(chat_id, _caixa("ℹ️ PIX", "Não encontrei um pagamento pendente recente. Digite *agendar* para começar."))
-            return jsonify({"status": "success"}), 200
-
-        # checa se a reserva ainda está válida
-        try:
-            dt_ref = datetime.fromisoformat(payload["data"]).date()
-            if not agenda.horario_disponivel(payload["horario"], dt_ref):
-                # pode ser a própria reserva pendente; tenta bater pelo id
-                bate = False
-                if hasattr(agenda, "reserva_bate"):
-                    try:
-                        bate = agenda.reserva_bate(
-                            agendamento_id=ag_id, data_ref=dt_ref, horario_ref=payload["horario"], chat_id=chat_id
-                        )
-                    except Exception:
-                        bate = False
-                if not bate:
-                    waha.send_message(chat_id, _caixa("⏰ Reserva expirada", "Esse horário não está mais disponível. Digite *agendar* para refazer."))
-                    return jsonify({"status": "success"}), 200
-        except Exception:
-            pass
-
-        # chama novamente o endpoint PIX
-        try:
-            resp = requests.post(
-                f"{API_INTERNAL_BASE}/mp/{nome_empresa}/pix",
-                json={
-                    "agendamento_id": ag_id,
-                    "chat_id": chat_id,
-                    "nome": payload.get("nome") or "Cliente",
-                    "insta": payload.get("insta") or "",
-                    "data": payload.get("data"),
-                    "horario": payload.get("horario"),
-                },
-                timeout=15
-            )
-            if resp.status_code == 200:
-                data_pix = resp.json()
-                qr_code    = data_pix.get("qr_code")
-                ticket_url = data_pix.get("ticket_url")
-
-                waha.send_message(chat_id, _caixa("💳 Novo PIX", f"Enviei um novo PIX (validade ~20 min).\n\n🌐 QR em página web:\n{ticket_url or '— indisponível —'}"))
-                if qr_code:
-                    waha.send_message(chat_id, "🔹 *PIX Copia e Cola* (copie a mensagem abaixo):")
-                    waha.send_message(chat_id, qr_code)
-            else:
-                waha.send_message(chat_id, _caixa("⚠️ PIX", "Não consegui gerar agora. Talvez a reserva tenha expirado. Digite *agendar* para refazer."))
-        except Exception as e:
-            waha.send_message(chat_id, _caixa("⚠️ PIX", f"Erro ao gerar: {e}"))
-
-        return jsonify({"status": "success"}), 200
-
-    # 2) HOTKEYS DO MENU
-    escolha = None
-    if estado["etapa"] == "menu":
-        escolha = MENU_ROUTER.get(msg_lower)
-    else:
-        if msg_lower in TEXTUAL_TRIGGERS:
-            escolha = MENU_ROUTER.get(msg_lower)
-    if escolha:
-        _handle_menu_action(escolha, estado, ctx, chat_id, waha)
-        return jsonify({"status": "success"}), 200
-
-    # 3) Estados
-    if estado["etapa"] == "menu":
-        _send_menu(waha, chat_id)
-        _goto(estado, "menu")
-        return jsonify({"status": "success"}), 200
-
-    # ===== Seleção de serviços =====
-    if estado["etapa"] == "selecionar_servicos":
-        carrinho = ctx.get("servicos", [])
-
-        if msg_lower in {"pronto", "finalizar", "ok"}:
-            if not carrinho:
-                waha.send_message(chat_id, _caixa("⚠️ Atenção", "Você ainda não selecionou nenhum serviço. Escolha ao menos 1."))
-                return jsonify({"status": "success"}), 200
-            _goto(estado, "solicitar_nome")
-            lista = _render_carrinho(carrinho)
-            titulo = "🗂 Serviços selecionados"
-            conteudo = f"{lista}"
-            msg = _caixa(titulo, conteudo) + "\n\n" + "🧑 Por favor, digite seu nome completo.\n(ou digite: pular)"
-            waha.send_message(chat_id, msg)
-            return jsonify({"status": "success"}), 200
-
-        if msg_lower == "limpar":
-            ctx["servicos"] = []
-            titulo = "🧹 Seleção limpa!"
-            conteudo = _catalogo_texto()
-            msg = _caixa(titulo, conteudo) + "\n\n" + "Adicione serviços (ex.: 1,3) e digite pronto quando terminar."
-            waha.send_message(chat_id, msg)
-            return jsonify({"status": "success"}), 200
-
-        mrem = re.match(r"^\s*remover\s+(.+)\s*$", msg_lower)
-        if mrem:
-            alvo = mrem.group(1).strip()
-            ids = _parse_servicos_input(alvo)
-            if not ids and alvo:
-                for sid, v in SERVICOS.items():
-                    if alvo in v["label"].lower() or alvo in v["slug"]:
-                        ids = [sid]
-                        break
-            if not ids:
-                waha.send_message(chat_id, _caixa("⚠️ Não encontrado", "Não encontrei esse serviço para remover. Tente remover 2 ou remover barba."))
-                return jsonify({"status": "success"}), 200
-            for sid in ids:
-                if sid in carrinho:
-                    carrinho.remove(sid)
-            ctx["servicos"] = carrinho
-            titulo = "🗑 Removido"
-            conteudo = f"🗂 Agora:\n{_render_carrinho(carrinho)}"
-            msg = _caixa(titulo, conteudo) + "\n\n" + _footer_tips_sel()
-            waha.send_message(chat_id, msg)
-            return jsonify({"status": "success"}), 200
-
-        ids = _parse_servicos_input(msg_lower)
-        if not ids:
-            waha.send_message(
-                chat_id,
-                _caixa(
-                    "⚠️ Não entendi",
-                    "Envie números (ex.: 1,3) ou nomes (ex.: corte social, barba).\n"
-                    "Dica: pronto para finalizar."
-                )
-            )
-            return jsonify({"status": "success"}), 200
-
-        for sid in ids:
-            if sid not in carrinho and sid in SERVICOS:
-                carrinho.append(sid)
-        ctx["servicos"] = carrinho
-
-        titulo = "✅ Adicionado!"
-        conteudo = f"🗂 Seleção:\n{_render_carrinho(carrinho)}"
-        msg = _caixa(titulo, conteudo) + "\n\n" + _footer_tips_sel()
-        waha.send_message(chat_id, msg)
-        return jsonify({"status": "success"}), 200
-
-    # ===== Nome =====
-    if estado["etapa"] == "solicitar_nome":
-        nome_raw = msg_norm
-        if nome_raw.lower() in {"pular", "skip"}:
-            ctx["nome_cliente"] = "Cliente"
-        else:
-            if not re.match(r"^[A-Za-zÀ-ÿ'´`^~\- ]{2,}$", nome_raw):
-                waha.send_message(chat_id, _caixa("❌ Nome inválido", "Envie seu nome completo (somente letras). Ex.: João da Silva\n(ou digite: pular)"))
-                return jsonify({"status": "success"}), 200
-            parts = re.sub(r"\s+", " ", nome_raw.strip()).split(" ")
-            lowers = {"de","da","do","dos","das","e","di","du"}
-            formatted = []
-            for i, p in enumerate(parts):
-                p = p.lower()
-                formatted.append(p if (i != 0 and p in lowers) else p[:1].upper() + p[1:])
-            ctx["nome_cliente"] = " ".join(formatted)
-
-        _goto(estado, "solicitar_insta")
-        titulo = "📷 Quer aparecer com @ na vitrine?"
-        conteudo = "Envie seu @ do Instagram (ex.: @seuuser)\nOu digite: pular"
-        waha.send_message(chat_id, _caixa(titulo, conteudo))
-        return jsonify({"status": "success"}), 200
-
-    # ===== Instagram (opcional) =====
-    if estado["etapa"] == "solicitar_insta":
-        handle = msg_norm.strip()
-        insta = ""
-        if handle.lower() not in {"pular", "skip", ""}:
-            if not re.match(r"^@?[A-Za-z0-9._]{1,30}$", handle):
-                waha.send_message(chat_id, _caixa("❌ @ inválido", "Envie no formato @usuario (letras, números, ponto e sublinhado).\nOu digite: pular"))
-                return jsonify({"status": "success"}), 200
-            handle = handle.lower()
-            insta = handle if handle.startswith("@") else f"@{handle}"
-        ctx["insta"] = insta
-
-        _goto(estado, "solicitar_data")
-        titulo = "📅 Informe a data"
-        conteudo = "Digite no formato DD/MM (ex.: 12/06)."
-        waha.send_message(chat_id, _caixa(titulo, conteudo))
-        return jsonify({"status": "success"}), 200
-
-    # ===== Data e horários =====
-    if estado["etapa"] == "solicitar_data":
-        dt = _parse_data(msg_norm.replace(" ", ""))
-        if not dt:
-            waha.send_message(chat_id, _caixa("❌ Data inválida", "Use DD/MM (ex.: 12/06)."))
-            return jsonify({"status": "success"}), 200
-
-        ctx["data"] = dt
-        horarios = listar_blocos_disponiveis(dt, exibir_nomes=True)
-        if not horarios or horarios.strip() == "":
-            waha.send_message(
-                chat_id,
-                _caixa("😕 Sem horários", f"Não encontrei horários para {dt.strftime('%d/%m/%Y')}.\nTente outra data, ou voltar para escolher outra opção.")
-            )
-            return jsonify({"status": "success"}), 200
-
-        _goto(estado, "solicitar_horario")
-        titulo = f"⏰ Horários disponíveis — {dt.strftime('%d/%m/%Y')}"
-        conteudo = f"{horarios}\n\n👉 Digite o número do horário desejado."
-        waha.send_message(chat_id, _caixa(titulo, conteudo))
-        return jsonify({"status": "success"}), 200
-
-    if estado["etapa"] == "solicitar_horario":
-        try:
-            indice = int(msg_norm)
-        except ValueError:
-            waha.send_message(chat_id, _caixa("❌ Entrada inválida", "Digite o número do horário da lista."))
-            return jsonify({"status": "success"}), 200
-
-        if not (1 <= indice <= len(BLOCOS_HORARIOS)):
-            waha.send_message(chat_id, _caixa("❌ Número inválido", "Digite um dos números exibidos."))
-            return jsonify({"status": "success"}), 200
-
-        horario_escolhido = BLOCOS_HORARIOS[indice - 1]
-        data_sel = ctx.get("data")
-        if not data_sel:
-            _reset(estado)
-            waha.send_message(chat_id, _caixa("⚠️ Ops", "Perdi o contexto da data. Vamos recomeçar pelo menu."))
-            _send_menu(waha, chat_id)
-            return jsonify({"status": "success"}), 200
-
-        if not horario_disponivel(horario_escolhido, data_sel):
-            horarios = listar_blocos_disponiveis(data_sel, exibir_nomes=True)
-            titulo = "❌ Horário indisponível"
-            conteudo = f"O horário {horario_escolhido} acabou de ser ocupado.\n\n⏰ Ainda disponíveis:\n{horarios}\n\nEscolha outro número."
-            waha.send_message(chat_id, _caixa(titulo, conteudo))
-            return jsonify({"status": "success"}), 200
-
-        # Dados do cliente
-        nome = ctx.get("nome_cliente", "Cliente")
-        serv_ids = ctx.get("servicos", [])
-        servicos_label = ", ".join([SERVICOS[s]["label"] for s in serv_ids]) if serv_ids else "Serviço"
-        insta = ctx.get("insta", "")
-
-        # Monta itens a partir do catálogo (com preços reais)
-        itens = []
-        for sid in serv_ids:
-            item = _mk_item_from_code(sid)
-            if item:
-                itens.append(item)
-
-        if not itens:
-            waha.send_message(chat_id, _caixa("⚠️ Catálogo", "Não encontrei preços para os serviços selecionados. Tente novamente."))
-            return jsonify({"status": "success"}), 200
-
-        # Total calculado
-        total = round(sum(i["unit_price"] * int(i.get("quantity", 1)) for i in itens), 2)
-
-        # Cria pré-agendamento com snapshot dos itens
-        from . import agenda
-        agendamento_id = agenda.criar_pre_agendamento(
-            chat_id=chat_id,
-            nome=nome,
-            data=data_sel,
-            horario=horario_escolhido,
-            servicos=itens,   # lista com títulos e preços
-            insta=insta
-        )
-
-        # ===== Geração do PIX (Payments API) e mensagens =====
-        import requests
-
-        # guarda no contexto para comandos rápidos depois
-        ctx["ultimo_agendamento_id"] = agendamento_id
-        ctx["ultimo_pix_payload"] = {
-            "chat_id": chat_id,
-            "nome": nome,
-            "insta": insta,
-            "data": data_sel.isoformat(),
-            "horario": horario_escolhido,
-        }
-
-        # monta itens caso ainda não exista a lista (com fallback de preço)
-        serv_ids = ctx.get("servicos", [])
-        itens = locals().get("itens") or []
-        if not itens:
-            itens = []
-            for sid in serv_ids:
-                if sid in SERVICOS:
-                    preco = SERVICOS[sid].get("price", 35.0) if isinstance(SERVICOS[sid], dict) else 35.0
-                    itens.append({
-                        "title": SERVICOS[sid]["label"],
-                        "quantity": 1,
-                        "unit_price": float(preco)
-                    })
-
-        def _fmt_brl_local(v: float) -> str:
-            return ("R$ {:,.2f}".format(float(v))).replace(",", "X").replace(".", ",").replace("X", ".")
-
-        servicos_label = ", ".join([SERVICOS[s]["label"] for s in serv_ids if s in SERVICOS]) or "Serviço"
-        linhas = "\n".join([f"- {i['title']}: {_fmt_brl(i.get('unit_price', 0))}" for i in itens]) or "—"
-        total_local = round(sum(float(i.get("unit_price", 0)) * int(i.get("quantity", 1)) for i in itens), 2)
-
-
-        try:
-            resp = requests.post(
-                f"{API_INTERNAL_BASE}/mp/{nome_empresa}/pix",
-                json={
-                    "agendamento_id": agendamento_id,
-                    "chat_id": chat_id,
-                    "nome": nome,
-                    "insta": insta,
-                    "data": data_sel.isoformat(),
-                    "horario": horario_escolhido,
-                },
-                timeout=15
-            )
-
-            if resp.status_code == 200:
-                data_pix = resp.json()
-                qr_code    = data_pix.get("qr_code")       # PIX Copia e Cola (string longa)
-                ticket_url = data_pix.get("ticket_url")    # Página web com o QR (sem login)
-
-                # 1) Mensagem de resumo (sem o código, fica mais limpo)
-                titulo = "💳 PIX para confirmar"
-                conteudo = (
-                    f"👤 Cliente: {nome}\n"
-                    f"💈 Serviço(s): {servicos_label}\n"
-                    f"📅 Data: {data_sel.strftime('%d/%m/%Y')}\n"
-                    f"🕒 Horário: {horario_escolhido}\n\n"
-                    f"🧾 Itens:\n{linhas}\n"
-                    f"Total: {_fmt_brl_local(total_local)}\n\n"
-                    f"🌐 Prefere escanear o QR?\n{ticket_url or '— indisponível —'}\n\n"
-                    "Assim que o banco confirmar, eu te aviso aqui 👍\n"
-                    "_(validade ~20 minutos)_"
-                )
-                waha.send_message(chat_id, _caixa(titulo, conteudo))
-
-                # 2) Mensagem curta só com o “PIX Copia e Cola” para facilitar copiar
-                if qr_code:
-                    waha.send_message(chat_id, "🔹 *PIX Copia e Cola* (copie a mensagem abaixo):")
-                    waha.send_message(chat_id, qr_code)  # <- apenas o código, isolado
-
-            else:
-                waha.send_message(chat_id, _caixa("⚠️ Erro", "Não consegui gerar o PIX agora. Tente novamente."))
-        except Exception as e:
-            waha.send_message(chat_id, _caixa("⚠️ Erro", f"Ocorreu um problema ao criar o pagamento: {e}"))
-
-        _reset(estado)
-        return jsonify({"status": "success"}), 200
-
-
-    # ===== Ver horários (consulta sem agendar) =====
-    if estado["etapa"] == "ver_horarios_data":
-        dt = _parse_data(msg_norm.replace(" ", ""))
-        if not dt:
-            waha.send_message(chat_id, _caixa("❌ Data inválida", "Use DD/MM (ex.: 12/06)."))
-            return jsonify({"status": "success"}), 200
-
-        ctx["consulta_data"] = dt
-        _goto(estado, "ver_horarios_listar")
-
-        horarios = listar_blocos_disponiveis(dt, exibir_nomes=True)
-        if not horarios or horarios.strip() == "":
-            waha.send_message(
-                chat_id,
-                _caixa("😕 Sem horários", f"Não encontrei horários para {dt.strftime('%d/%m/%Y')}.\nEnvie outra data, voltar ou menu.")
-            )
-            return jsonify({"status": "success"}), 200
-
-        titulo = f"📅 Consulta — {dt.strftime('%d/%m/%Y')}"
-        conteudo = f"⏰ Disponíveis:\n{horarios}\n\nPara agendar, digite agendar.\nOu envie outra data."
-        waha.send_message(chat_id, _caixa(titulo, conteudo))
-        return jsonify({"status": "success"}), 200
-
-    if estado["etapa"] == "ver_horarios_listar":
-        dt_try = _parse_data(msg_norm.replace(" ", ""))
-        if dt_try:
-            ctx["consulta_data"] = dt_try
-            horarios = listar_blocos_disponiveis(dt_try, exibir_nomes=True)
-            if not horarios or horarios.strip() == "":
-                waha.send_message(
-                    chat_id,
-                    _caixa("😕 Sem horários", f"Não encontrei horários para {dt_try.strftime('%d/%m/%Y')}.\nEnvie outra data, voltar ou menu.")
-                )
-                return jsonify({"status": "success"}), 200
-
-            titulo = f"📅 Consulta — {dt_try.strftime('%d/%m/%Y')}"
-            conteudo = f"⏰ Disponíveis:\n{horarios}\n\nPara agendar, digite agendar.\nOu envie outra data."
-            waha.send_message(chat_id, _caixa(titulo, conteudo))
-            return jsonify({"status": "success"}), 200
-
-        if msg_lower in {"agendar", "quero agendar", "fazer agendamento"}:
-            _push(estado, "selecionar_servicos")
-            ctx["servicos"] = []
-            titulo = "✍ Selecione os serviços"
-            conteudo = _catalogo_texto()
-            msg = _caixa(titulo, conteudo) + "\n\n" + \
-                "ℹ️ Dica:\n   envie números (ex.: 1,3) ou nomes (ex.: corte social, barba)."
-            waha.send_message(chat_id, msg)
-            return jsonify({"status": "success"}), 200
-
-        waha.send_message(
-            chat_id,
-            _caixa("ℹ️ Dica", "Para agendar, digite agendar.\nVocê também pode enviar outra data (DD/MM), voltar ou menu.")
-        )
-        return jsonify({"status": "success"}), 200
-
-    # ===== Fallback =====
-    _reset(estado)
-    waha.send_message(chat_id, _caixa("⚠️ Não entendi", "Vamos recomeçar."))
-    _send_menu(waha, chat_id)
-    return jsonify({"status": "success"}), 200
+from services.respostas import BODY_SUCCESS, resposta_json
+from services.waha import encode_text
+from .ai_bot import AIBot as _AIBot  # marcado como _ para evitar aviso de 'unused import'
+from .agenda import (
+    listar_blocos_disponiveis,
+    horario_disponivel,
+    BLOCOS_HORARIOS
+)
+from datetime import datetime, date
+import re
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from functools import lru_cache
+
+import os  # ADICIONE
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from decimal import Decimal, ROUND_HALF_UP  # ADICIONE
+
+CAT_PATH = os.path.join(os.path.dirname(__file__), "catalogo.json")
+
+# Regex compiladas uma vez (rodam a cada mensagem recebida)
+_RE_SPACES = re.compile(r"\s+")
+_RE_DDMM = re.compile(r"^\s*(\d{1,2})\s*[/-]\s*(\d{1,2})\s*$")  # aceita "12 / 06" sem precisar tirar espaços antes
+_RE_SPLIT_TOK = re.compile(r"[,\s]+")
+_RE_REMOVER = re.compile(r"^\s*remover\s+(.+)\s*$")
+_RE_NOME = re.compile(r"^[A-Za-zÀ-ÿ'´`^~\- ]{2,}$")
+_RE_INSTA = re.compile(r"^@?[A-Za-z0-9._]{1,30}$")
+
+# Conjuntos fixos das etapas de nome/Instagram
+_PULAR = frozenset({"pular", "skip"})
+_PREPOSICOES_NOME = frozenset({"de", "da", "do", "dos", "das", "e", "di", "du"})  # ficam minúsculas no nome
+
+def _code_key(code) -> str:
+    """Chave normalizada do catálogo (a mesma usada ao carregar)."""
+    return str(code).strip().lower()
+
+def _load_catalogo():
+    try:
+        with open(CAT_PATH, "rb") as f:
+            data = orjson.loads(f.read())
+    except FileNotFoundError:
+        return MappingProxyType({})
+
+    # somente leitura: compartilhado entre as threads do webhook
+    by_code = {
+        _code_key(s.get("code")): s
+        for s in data.get("services", [])
+        if s.get("active", True) and s.get("code") is not None
+    }
+    return MappingProxyType(by_code)
+
+CATALOGO = _load_catalogo()
+
+# Base interna da API (para chamadas dentro do container)
+API_INTERNAL_BASE = os.getenv("API_INTERNAL_BASE", "http://api:8000").rstrip("/")
+
+# Endpoint PIX: sessão HTTP compartilhada (reaproveita conexões) e pool próprio,
+# para o worker do fluxo não ficar preso esperando o Mercado Pago responder
+PIX_TIMEOUT_SEC = float(os.getenv("PIX_TIMEOUT_SEC", "15"))
+PIX_WORKERS = int(os.getenv("PIX_WORKERS", "4"))
+
+_pix_http = requests.Session()
+_pix_http.mount("http://", HTTPAdapter(pool_connections=20, pool_maxsize=50))
+_pix_http.mount("https://", HTTPAdapter(pool_connections=20, pool_maxsize=50))
+_PIX_POOL = ThreadPoolExecutor(max_workers=PIX_WORKERS, thread_name_prefix="pix")
+
+def _pedir_pix(nome_empresa, payload):
+    """POST no endpoint PIX interno. Devolve o JSON (qr_code/ticket_url) ou None se não veio 200."""
+    resp = _pix_http.post(f"{API_INTERNAL_BASE}/mp/{nome_empresa}/pix", json=payload, timeout=PIX_TIMEOUT_SEC)
+    return resp.json() if resp.status_code == 200 else None
+
+def _pix_em_andamento(ctx) -> bool:
+    fut = ctx.get("pix_future")
+    return fut is not None and not fut.done()
+
+_CENTAVOS = Decimal("0.01")
+# troca ',' <-> '.' numa passada só (translate mapeia cada caractere uma vez, sem colisão)
+_BRL_TRANS = str.maketrans({",": ".", ".": ","})
+
+@lru_cache(maxsize=1024)  # preços do catálogo se repetem a cada carrinho
+def _fmt_brl(v: float | int) -> str:
+    d = Decimal(str(v)).quantize(_CENTAVOS, rounding=ROUND_HALF_UP)
+    # formata como R$ 1.234,56
+    return f"R$ {format(d, ',.2f').translate(_BRL_TRANS)}"
+
+def _mk_item_from_code(code: str):
+    """'code' já normalizado com _code_key (os ids de SERVICOS já estão nesse formato)."""
+    s = CATALOGO.get(code)
+    if not s:
+        return None
+    try:
+        price = float(s.get("price"))
+    except (TypeError, ValueError):
+        return None
+    return {"title": s["label"], "quantity": 1, "unit_price": price}
+
+    
+# ==========================
+# Helpers de UI / Texto
+# ==========================
+EMOJI_TO_NUM = {
+    "1️⃣": "1", "2️⃣": "2", "3️⃣": "3", "4️⃣": "4", "5️⃣": "5",
+    "6️⃣": "6", "7️⃣": "7", "8️⃣": "8", "9️⃣": "9", "0️⃣": "0"
+}
+# Os emojis de EMOJI_TO_NUM são sequências de 3 code points (dígito + U+FE0F + U+20E3),
+# que str.translate não mapeia: uma regex troca todos numa passada só
+_RE_KEYCAP = re.compile("([0-9])\ufe0f\u20e3")
+_ZERO_WIDTH = str.maketrans({"\u200b": None, "\u200c": None})
+
+_NUM_EMOJI = {"1":"1️⃣","2":"2️⃣","3":"3️⃣","4":"4️⃣","5":"5️⃣","6":"6️⃣","7":"7️⃣","8":"8️⃣","9":"9️⃣","0":"0️⃣"}
+
+def _chip(n, label):
+    n = str(n)
+    return f"{_NUM_EMOJI.get(n, n)} {label}"
+
+def _norm(txt: str) -> str:
+    t = _RE_KEYCAP.sub(r"\1", (txt or "").strip()).translate(_ZERO_WIDTH)
+    return _RE_SPACES.sub(" ", t).strip()
+
+# Bordas da caixa já com as quebras de linha: cada _caixa é um único f-string de 4 partes
+_CAIXA_TOPO = "╔════════════════════════╗\n    "
+_CAIXA_MEIO = "\n╠════════════════════════╣\n"
+_CAIXA_BASE = "\n╚════════════════════════╝"
+
+def _caixa(titulo: str, conteudo: str) -> str:
+    return f"{_CAIXA_TOPO}{titulo}{_CAIXA_MEIO}{conteudo}{_CAIXA_BASE}"
+
+FOOTER_COMANDOS = "ℹ️ Comandos rápidos:\n   • Menu   • Voltar   • Cancelar   • Ajuda   • Atendente"
+
+FOOTER_TIPS_SEL = (
+    "✨ Adicione mais serviços\n"
+    "📝 Digite *pronto* para finalizar\n"
+    "❌ Digite *remover* para tirar um item\n"
+    "🧹 Digite *limpar* para esvaziar tudo"
+)
+
+def _format_nome(nome: str) -> str:
+    """'joão DA silva' -> 'João da Silva' (preposições minúsculas, exceto a primeira palavra)."""
+    # split() sem argumento já descarta espaços repetidos; capitalize() sobe só a 1ª letra
+    return " ".join(
+        p if (i and p in _PREPOSICOES_NOME) else p.capitalize()
+        for i, p in enumerate(nome.lower().split())
+    )
+
+# ==========================
+# Estado / Navegação
+# ==========================
+@dataclass(slots=True)
+class Estado:
+    """Estado de um chat. Slots fixos (sem __dict__): menos memória por usuário e acesso direto."""
+    etapa: str = "menu"
+    ctx: dict = field(default_factory=dict)    # dados da conversa (chaves variam por etapa)
+    pilha: list = field(default_factory=list)  # etapas anteriores, para o "voltar"
+
+def _get(fluxo_usuario, chat_id) -> Estado:
+    estado = fluxo_usuario.get(chat_id)
+    if estado is None:
+        estado = fluxo_usuario[chat_id] = Estado()
+    return estado
+
+def _push(state, new_state):
+    state.pilha.append(state.etapa)
+    state.etapa = new_state
+
+def _goto(state, new_state):
+    state.etapa = new_state
+
+def _back(state):
+    if state.pilha:
+        state.etapa = state.pilha.pop()
+        return True
+    return False
+
+def _reset(state):
+    state.etapa = "menu"
+    state.ctx = {}
+    state.pilha = []
+    
+# ==========================
+# Datas
+# ==========================
+def _parse_data(msg: str) -> date | None:
+    m = _RE_DDMM.match(msg)
+    if not m:
+        return None
+    d, mth = int(m.group(1)), int(m.group(2))
+    hoje = date.today()
+    y = hoje.year
+    try:
+        dt = date(y, mth, d)
+    except ValueError:
+        return None
+    if dt < hoje:
+        try:
+            dt = date(y + 1, mth, d)
+        except ValueError:
+            return None
+    return dt
+
+# texto normalizado (_norm + lower) -> comando universal
+UNIVERSAIS = MappingProxyType({
+    "menu": "menu", "início": "menu", "inicio": "menu",
+    "voltar": "voltar",
+    "cancelar": "cancelar",
+    "ajuda": "ajuda",
+    "atendente": "atendente", "falar com atendente": "atendente", "humano": "atendente",
+})
+
+# ==========================
+# Catálogo de serviços
+# ==========================
+SERVICOS = OrderedDict([
+    ("1", {"slug": "corte social", "label": "Corte social", "emoji": "💇"}),
+    ("2", {"slug": "degradê", "label": "Degradê", "emoji": "🌀"}),
+    ("3", {"slug": "sobrancelha", "label": "Sobrancelha", "emoji": "✨"}),
+    ("4", {"slug": "barba", "label": "Barba", "emoji": "🧔"}),
+])
+# slug e label (minúsculo) -> id; somente leitura, montado uma vez no import
+SERVICOS_BY_NAME = MappingProxyType({
+    **{v["slug"]: k for k, v in SERVICOS.items()},
+    **{v["label"].lower(): k for k, v in SERVICOS.items()},
+})
+# (id, label minúsculo, slug) para a busca por trecho do "remover"
+_SERVICOS_BUSCA = tuple((k, v["label"].lower(), v["slug"]) for k, v in SERVICOS.items())
+
+# SERVICOS não muda em runtime: o texto do catálogo é montado uma vez
+CATALOGO_TEXTO = "\n".join(f"  {_chip(k, v['label'])}  {v['emoji']}" for k, v in SERVICOS.items())
+
+def _render_carrinho(ids, indent="     "):
+    return _render_carrinho_cached(tuple(ids or ()), indent)
+
+@lru_cache(maxsize=128)  # poucos serviços -> poucos carrinhos distintos
+def _render_carrinho_cached(ids: tuple, indent: str) -> str:
+    if not ids:
+        return f"{indent}— (vazio)"
+    return "\n".join(f"{indent}{_chip(sid, SERVICOS[sid]['label'])}" for sid in ids if sid in SERVICOS)
+
+def _parse_servicos_input(texto: str):
+    # id direto ("1") ou nome/slug; dict.fromkeys remove repetidos mantendo a ordem
+    found = (
+        token if token in SERVICOS else SERVICOS_BY_NAME.get(token)
+        for token in _RE_SPLIT_TOK.split(_norm(texto).lower())
+        if token
+    )
+    return list(dict.fromkeys(k for k in found if k))
+
+# Avisos fixos usados em mais de uma etapa
+MSG_DATA_INVALIDA = _caixa("❌ Data inválida", "Use DD/MM (ex.: 12/06).")
+
+# ==========================
+# Menu principal
+# ==========================
+# O menu não muda: texto montado e serializado (encode_text) uma vez no import
+MENU_TEXTO = _caixa(
+    "💈 Barbearia do ERIK",
+    "\n".join((
+        _chip(1, "Agendar horário"),
+        _chip(2, "Ver serviços"),
+        _chip(3, "Ver horários disponíveis"),
+        _chip(4, "Falar com atendente"),
+    )),
+) + "\n\n" + FOOTER_COMANDOS
+MENU_BYTES = encode_text(MENU_TEXTO)
+
+def _send_menu(waha, chat_id, antes: str | None = None):
+    """Envia o menu; 'antes' (aviso do mesmo turno) vai junto, numa chamada só ao WAHA."""
+    if antes:
+        waha.send_messages(chat_id, [antes, MENU_TEXTO])
+    else:
+        waha.send_message(chat_id, MENU_BYTES)
+
+# ==========================
+# Router do menu
+# ==========================
+MENU_ROUTER = {
+    "1": "agendar", "agendar": "agendar", "agendamento": "agendar",
+    "agendar horario": "agendar", "agendar horário": "agendar",
+    "2": "servicos", "servicos": "servicos", "serviços": "servicos",
+    "ver servicos": "servicos", "ver serviços": "servicos",
+    "3": "ver_horarios", "ver horarios": "ver_horarios", "ver horários": "ver_horarios",
+    "horarios": "ver_horarios", "horários": "ver_horarios",
+    "4": "atendente", "atendente": "atendente", "falar com atendente": "atendente", "humano": "atendente",
+}
+
+TEXTUAL_TRIGGERS = {
+    "agendar", "agendamento", "agendar horario", "agendar horário",
+    "servicos", "serviços", "ver servicos", "ver serviços",
+    "ver horarios", "ver horários", "horarios", "horários",
+    "atendente", "falar com atendente", "humano",
+}
+# fora do menu só os gatilhos textuais valem: tabela já filtrada, uma consulta por mensagem
+MENU_ROUTER_TEXTUAL = MappingProxyType({k: MENU_ROUTER[k] for k in TEXTUAL_TRIGGERS})
+
+def _handle_menu_action(escolha: str, estado, ctx, chat_id, waha):
+    if escolha == "agendar":
+        _push(estado, "selecionar_servicos")
+        ctx["servicos"] = []
+        titulo = "✍ Selecione os serviços"
+        conteudo = CATALOGO_TEXTO
+        msg = _caixa(titulo, conteudo) + "\n\n" + \
+            "ℹ️ Dica:\n   envie números (ex.: 1,3) ou nomes (ex.: corte social, barba)."
+        waha.send_message(chat_id, msg)
+        return
+
+    if escolha == "servicos":
+        titulo = "📋 Serviços disponíveis"
+        conteudo = CATALOGO_TEXTO
+        msg = _caixa(titulo, conteudo) + "\n\n" + "Para agendar, escolha 1 no menu ou digite Agendar."
+        waha.send_message(chat_id, msg)
+        _goto(estado, "menu")
+        return
+
+    if escolha == "ver_horarios":
+        hoje = date.today()
+        ctx["consulta_data"] = hoje
+        _goto(estado, "ver_horarios_listar")
+
+        horarios = listar_blocos_disponiveis(hoje, exibir_nomes=True)
+        if not horarios or horarios.strip() == "":
+            waha.send_message(
+                chat_id,
+                _caixa(
+                    "📅 Consulta — Hoje",
+                    f"Não encontrei horários para {hoje.strftime('%d/%m/%Y')}."
+                )
+            )
+            waha.send_message(
+                chat_id,
+                _caixa(
+                    "ℹ️ Como proceder",
+                    "• Para *agendar*, digite: agendar\n"
+                    "• Para ver outra *data*, envie: DD/MM (ex.: 15/08)\n"
+                    "• Ou digite: menu"
+                )
+            )
+            return
+
+        titulo = f"📅 Consulta — {hoje.strftime('%d/%m/%Y')}"
+        conteudo = (
+            f"⏰ Disponíveis:\n{horarios}\n\n"
+            "Para *agendar*, digite: agendar\n"
+            "Para consultar outra *data*, envie: DD/MM (ex.: 15/08)"
+        )
+        waha.send_message(chat_id, _caixa(titulo, conteudo))
+        return
+
+    if escolha == "atendente":
+        titulo = "👨‍💼 Atendente"
+        conteudo = "Certo! Um atendente vai te chamar em instantes."
+        _goto(estado, "menu")
+        _send_menu(waha, chat_id, antes=_caixa(titulo, conteudo))
+        return
+
+# ==========================
+# Comandos rápidos e etapas (despacho por dicionário em processar)
+# ==========================
+def _cmd_status_pagamento(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    from . import agenda
+    ag_id = ctx.get("ultimo_agendamento_id")
+    if not ag_id:
+        waha.send_message(chat_id, _caixa("ℹ️ Status", "Não encontrei um pagamento pendente recente. Digite *agendar* para começar."))
+        return resposta_json(BODY_SUCCESS)
+
+    if _pix_em_andamento(ctx):
+        waha.send_message(chat_id, _caixa("⏳ PIX", f"Agendamento {ag_id}\nSeu PIX ainda está sendo gerado, já te envio."))
+        return resposta_json(BODY_SUCCESS)
+
+    # consulta pontual no banco (SELECT por AgendamentoID)
+    try:
+        status_txt = agenda.consultar_status(ag_id)
+    except Exception:
+        status_txt = None
+
+    if not status_txt:
+        waha.send_message(chat_id, _caixa("ℹ️ Status", f"Agendamento {ag_id}\nStatus: _indisponível agora_."))
+    else:
+        waha.send_message(chat_id, _caixa("ℹ️ Status do pagamento", f"Agendamento {ag_id}\nStatus: *{status_txt}*"))
+    return resposta_json(BODY_SUCCESS)
+
+def _cmd_reenviar_pix(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    from . import agenda
+    ag_id = ctx.get("ultimo_agendamento_id")
+    payload = ctx.get("ultimo_pix_payload") or {}
+
+    if not ag_id or not payload:
+        waha.send_message(chat_id, _caixa("ℹ️ PIX", "Não encontrei um pagamento pendente recente. Digite *agendar* para começar."))
+        return resposta_json(BODY_SUCCESS)
+
+    if _pix_em_andamento(ctx):
+        waha.send_message(chat_id, _caixa("⏳ PIX", "Seu PIX ainda está sendo gerado, já te envio."))
+        return resposta_json(BODY_SUCCESS)
+
+    # checa se a reserva ainda está válida
+    try:
+        dt_ref = payload.get("data_obj") or datetime.fromisoformat(payload["data"]).date()
+        if not agenda.horario_disponivel(payload["horario"], dt_ref):
+            # pode ser a própria reserva pendente; tenta bater pelo id
+            bate = False
+            if hasattr(agenda, "reserva_bate"):
+                try:
+                    bate = agenda.reserva_bate(
+                        agendamento_id=ag_id, data_ref=dt_ref, horario_ref=payload["horario"], chat_id=chat_id
+                    )
+                except Exception:
+                    bate = False
+            if not bate:
+                waha.send_message(chat_id, _caixa("⏰ Reserva expirada", "Esse horário não está mais disponível. Digite *agendar* para refazer."))
+                return resposta_json(BODY_SUCCESS)
+    except Exception:
+        pass
+
+    # chama novamente o endpoint PIX (em background; a resposta chega por mensagem)
+    def _gerar():
+        try:
+            data_pix = _pedir_pix(nome_empresa, {
+                "agendamento_id": ag_id,
+                "chat_id": chat_id,
+                "nome": payload.get("nome") or "Cliente",
+                "insta": payload.get("insta") or "",
+                "data": payload.get("data"),
+                "horario": payload.get("horario"),
+            })
+            if data_pix is not None:
+                qr_code    = data_pix.get("qr_code")
+                ticket_url = data_pix.get("ticket_url")
+
+                # resumo + aviso do copia-e-cola num envio; o código vai sozinho para facilitar copiar
+                waha.send_messages(chat_id, [
+                    _caixa("💳 Novo PIX", f"Enviei um novo PIX (validade ~20 min).\n\n🌐 QR em página web:\n{ticket_url or '— indisponível —'}"),
+                    "🔹 *PIX Copia e Cola* (copie a mensagem abaixo):" if qr_code else None,
+                ])
+                if qr_code:
+                    waha.send_message(chat_id, qr_code)
+            else:
+                waha.send_message(chat_id, _caixa("⚠️ PIX", "Não consegui gerar agora. Talvez a reserva tenha expirado. Digite *agendar* para refazer."))
+        except Exception as e:
+            waha.send_message(chat_id, _caixa("⚠️ PIX", f"Erro ao gerar: {e}"))
+
+    waha.send_message(chat_id, "⏳ Gerando um novo PIX…")
+    ctx["pix_future"] = _PIX_POOL.submit(_gerar)
+    return resposta_json(BODY_SUCCESS)
+
+def _etapa_menu(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    _send_menu(waha, chat_id)
+    _goto(estado, "menu")
+    return resposta_json(BODY_SUCCESS)
+
+# ===== Seleção de serviços =====
+def _etapa_selecionar_servicos(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    carrinho = ctx.get("servicos", [])
+
+    if msg_lower in {"pronto", "finalizar", "ok"}:
+        if not carrinho:
+            waha.send_message(chat_id, _caixa("⚠️ Atenção", "Você ainda não selecionou nenhum serviço. Escolha ao menos 1."))
+            return resposta_json(BODY_SUCCESS)
+        _goto(estado, "solicitar_nome")
+        lista = _render_carrinho(carrinho)
+        titulo = "🗂 Serviços selecionados"
+        conteudo = f"{lista}"
+        msg = _caixa(titulo, conteudo) + "\n\n" + "🧑 Por favor, digite seu nome completo.\n(ou digite: pular)"
+        waha.send_message(chat_id, msg)
+        return resposta_json(BODY_SUCCESS)
+
+    if msg_lower == "limpar":
+        ctx["servicos"] = []
+        titulo = "🧹 Seleção limpa!"
+        conteudo = CATALOGO_TEXTO
+        msg = _caixa(titulo, conteudo) + "\n\n" + "Adicione serviços (ex.: 1,3) e digite pronto quando terminar."
+        waha.send_message(chat_id, msg)
+        return resposta_json(BODY_SUCCESS)
+
+    mrem = _RE_REMOVER.match(msg_lower)
+    if mrem:
+        alvo = mrem.group(1).strip()
+        # nome exato ("corte social") num hash; depois ids/tokens; por último, trecho do nome
+        sid = SERVICOS_BY_NAME.get(alvo)
+        ids = [sid] if sid else _parse_servicos_input(alvo)
+        if not ids and alvo:
+            ids = next(([sid] for sid, label_lc, slug in _SERVICOS_BUSCA if alvo in label_lc or alvo in slug), [])
+        if not ids:
+            waha.send_message(chat_id, _caixa("⚠️ Não encontrado", "Não encontrei esse serviço para remover. Tente remover 2 ou remover barba."))
+            return resposta_json(BODY_SUCCESS)
+        for sid in ids:
+            if sid in carrinho:
+                carrinho.remove(sid)
+        ctx["servicos"] = carrinho
+        titulo = "🗑 Removido"
+        conteudo = f"🗂 Agora:\n{_render_carrinho(carrinho)}"
+        msg = _caixa(titulo, conteudo) + "\n\n" + FOOTER_TIPS_SEL
+        waha.send_message(chat_id, msg)
+        return resposta_json(BODY_SUCCESS)
+
+    ids = _parse_servicos_input(msg_lower)
+    if not ids:
+        waha.send_message(
+            chat_id,
+            _caixa(
+                "⚠️ Não entendi",
+                "Envie números (ex.: 1,3) ou nomes (ex.: corte social, barba).\n"
+                "Dica: pronto para finalizar."
+            )
+        )
+        return resposta_json(BODY_SUCCESS)
+
+    for sid in ids:
+        if sid not in carrinho and sid in SERVICOS:
+            carrinho.append(sid)
+    ctx["servicos"] = carrinho
+
+    titulo = "✅ Adicionado!"
+    conteudo = f"🗂 Seleção:\n{_render_carrinho(carrinho)}"
+    msg = _caixa(titulo, conteudo) + "\n\n" + FOOTER_TIPS_SEL
+    waha.send_message(chat_id, msg)
+    return resposta_json(BODY_SUCCESS)
+
+# ===== Nome =====
+def _etapa_solicitar_nome(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    if msg_lower in _PULAR:
+        ctx["nome_cliente"] = "Cliente"
+    else:
+        if not _RE_NOME.match(msg_norm):
+            waha.send_message(chat_id, _caixa("❌ Nome inválido", "Envie seu nome completo (somente letras). Ex.: João da Silva\n(ou digite: pular)"))
+            return resposta_json(BODY_SUCCESS)
+        ctx["nome_cliente"] = _format_nome(msg_lower)
+
+    _goto(estado, "solicitar_insta")
+    titulo = "📷 Quer aparecer com @ na vitrine?"
+    conteudo = "Envie seu @ do Instagram (ex.: @seuuser)\nOu digite: pular"
+    waha.send_message(chat_id, _caixa(titulo, conteudo))
+    return resposta_json(BODY_SUCCESS)
+
+# ===== Instagram (opcional) =====
+def _etapa_solicitar_insta(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    handle = msg_norm.strip()
+    insta = ""
+    if handle and handle.lower() not in _PULAR:
+        if not _RE_INSTA.match(handle):
+            waha.send_message(chat_id, _caixa("❌ @ inválido", "Envie no formato @usuario (letras, números, ponto e sublinhado).\nOu digite: pular"))
+            return resposta_json(BODY_SUCCESS)
+        handle = handle.lower()
+        insta = handle if handle.startswith("@") else f"@{handle}"
+    ctx["insta"] = insta
+
+    _goto(estado, "solicitar_data")
+    titulo = "📅 Informe a data"
+    conteudo = "Digite no formato DD/MM (ex.: 12/06)."
+    waha.send_message(chat_id, _caixa(titulo, conteudo))
+    return resposta_json(BODY_SUCCESS)
+
+# ===== Data e horários =====
+def _etapa_solicitar_data(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    dt = _parse_data(msg_norm)
+    if not dt:
+        waha.send_message(chat_id, MSG_DATA_INVALIDA)
+        return resposta_json(BODY_SUCCESS)
+
+    ctx["data"] = dt
+    horarios = listar_blocos_disponiveis(dt, exibir_nomes=True)
+    if not horarios or horarios.strip() == "":
+        waha.send_message(
+            chat_id,
+            _caixa("😕 Sem horários", f"Não encontrei horários para {dt.strftime('%d/%m/%Y')}.\nTente outra data, ou voltar para escolher outra opção.")
+        )
+        return resposta_json(BODY_SUCCESS)
+
+    _goto(estado, "solicitar_horario")
+    titulo = f"⏰ Horários disponíveis — {dt.strftime('%d/%m/%Y')}"
+    conteudo = f"{horarios}\n\n👉 Digite o número do horário desejado."
+    waha.send_message(chat_id, _caixa(titulo, conteudo))
+    return resposta_json(BODY_SUCCESS)
+
+def _etapa_solicitar_horario(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    try:
+        indice = int(msg_norm)
+    except ValueError:
+        waha.send_message(chat_id, _caixa("❌ Entrada inválida", "Digite o número do horário da lista."))
+        return resposta_json(BODY_SUCCESS)
+
+    if not (1 <= indice <= len(BLOCOS_HORARIOS)):
+        waha.send_message(chat_id, _caixa("❌ Número inválido", "Digite um dos números exibidos."))
+        return resposta_json(BODY_SUCCESS)
+
+    horario_escolhido = BLOCOS_HORARIOS[indice - 1]
+    data_sel = ctx.get("data")
+    if not data_sel:
+        _reset(estado)
+        _send_menu(waha, chat_id, antes=_caixa("⚠️ Ops", "Perdi o contexto da data. Vamos recomeçar pelo menu."))
+        return resposta_json(BODY_SUCCESS)
+
+    if not horario_disponivel(horario_escolhido, data_sel):
+        horarios = listar_blocos_disponiveis(data_sel, exibir_nomes=True)
+        titulo = "❌ Horário indisponível"
+        conteudo = f"O horário {horario_escolhido} acabou de ser ocupado.\n\n⏰ Ainda disponíveis:\n{horarios}\n\nEscolha outro número."
+        waha.send_message(chat_id, _caixa(titulo, conteudo))
+        return resposta_json(BODY_SUCCESS)
+
+    # Dados do cliente
+    nome = ctx.get("nome_cliente", "Cliente")
+    serv_ids = ctx.get("servicos", [])
+    insta = ctx.get("insta", "")
+
+    # Uma passada pelo carrinho: itens com preço do catálogo, labels, linhas do resumo e total
+    servicos = SERVICOS
+    itens, labels, linhas_itens = [], [], []
+    total = 0.0
+    for sid in serv_ids:
+        serv = servicos.get(sid)
+        if serv is not None:
+            labels.append(serv["label"])
+        item = _mk_item_from_code(sid)
+        if item:
+            itens.append(item)
+            linhas_itens.append(f"- {item['title']}: {_fmt_brl(item['unit_price'])}")
+            total += item["unit_price"] * item["quantity"]
+
+    if not itens:
+        waha.send_message(chat_id, _caixa("⚠️ Catálogo", "Não encontrei preços para os serviços selecionados. Tente novamente."))
+        return resposta_json(BODY_SUCCESS)
+
+    total = round(total, 2)
+    servicos_label = ", ".join(labels) or "Serviço"
+    linhas = "\n".join(linhas_itens)
+
+    # Cria pré-agendamento com snapshot dos itens
+    from . import agenda
+    agendamento_id = agenda.criar_pre_agendamento(
+        chat_id=chat_id,
+        nome=nome,
+        data=data_sel,
+        horario=horario_escolhido,
+        servicos=itens,   # lista com títulos e preços
+        insta=insta
+    )
+
+    # ===== Geração do PIX (Payments API) e mensagens =====
+    # formata a data uma vez: ISO só vai no JSON para a API, DD/MM/AAAA só nas mensagens
+    data_iso = data_sel.isoformat()
+    data_br = data_sel.strftime("%d/%m/%Y")
+
+    # guarda no contexto para comandos rápidos depois (a date pronta evita reparsear a ISO)
+    ctx["ultimo_agendamento_id"] = agendamento_id
+    ctx["ultimo_pix_payload"] = {
+        "chat_id": chat_id,
+        "nome": nome,
+        "insta": insta,
+        "data": data_iso,
+        "data_obj": data_sel,
+        "data_br": data_br,
+        "horario": horario_escolhido,
+    }
+
+    # POST ao endpoint PIX em background: responde já e manda o QR quando chegar
+    def _gerar():
+        try:
+            data_pix = _pedir_pix(nome_empresa, {
+                "agendamento_id": agendamento_id,
+                "chat_id": chat_id,
+                "nome": nome,
+                "insta": insta,
+                "data": data_iso,
+                "horario": horario_escolhido,
+            })
+
+            if data_pix is not None:
+                qr_code    = data_pix.get("qr_code")       # PIX Copia e Cola (string longa)
+                ticket_url = data_pix.get("ticket_url")    # Página web com o QR (sem login)
+
+                # 1) Mensagem de resumo (sem o código, fica mais limpo)
+                titulo = "💳 PIX para confirmar"
+                conteudo = (
+                    f"👤 Cliente: {nome}\n"
+                    f"💈 Serviço(s): {servicos_label}\n"
+                    f"📅 Data: {data_br}\n"
+                    f"🕒 Horário: {horario_escolhido}\n\n"
+                    f"🧾 Itens:\n{linhas}\n"
+                    f"Total: {_fmt_brl(total)}\n\n"
+                    f"🌐 Prefere escanear o QR?\n{ticket_url or '— indisponível —'}\n\n"
+                    "Assim que o banco confirmar, eu te aviso aqui 👍\n"
+                    "_(validade ~20 minutos)_"
+                )
+                # 2) Aviso do “PIX Copia e Cola” no mesmo envio do resumo; o código vai sozinho para facilitar copiar
+                waha.send_messages(chat_id, [
+                    _caixa(titulo, conteudo),
+                    "🔹 *PIX Copia e Cola* (copie a mensagem abaixo):" if qr_code else None,
+                ])
+                if qr_code:
+                    waha.send_message(chat_id, qr_code)  # <- apenas o código, isolado
+
+            else:
+                waha.send_message(chat_id, _caixa("⚠️ Erro", "Não consegui gerar o PIX agora. Tente novamente."))
+        except Exception as e:
+            waha.send_message(chat_id, _caixa("⚠️ Erro", f"Ocorreu um problema ao criar o pagamento: {e}"))
+
+    waha.send_message(chat_id, f"⏳ Reservei {horario_escolhido} de {data_br[:5]}. Gerando seu PIX…")
+    ctx["pix_future"] = _PIX_POOL.submit(_gerar)
+
+    _reset(estado)
+    # o reset limpa o ctx; os comandos rápidos (status / reenviar pix) ainda precisam disto
+    for k in ("ultimo_agendamento_id", "ultimo_pix_payload", "pix_future"):
+        estado.ctx[k] = ctx[k]
+    return resposta_json(BODY_SUCCESS)
+
+# ===== Ver horários (consulta sem agendar) =====
+def _etapa_ver_horarios_data(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    dt = _parse_data(msg_norm)
+    if not dt:
+        waha.send_message(chat_id, MSG_DATA_INVALIDA)
+        return resposta_json(BODY_SUCCESS)
+
+    ctx["consulta_data"] = dt
+    _goto(estado, "ver_horarios_listar")
+
+    horarios = listar_blocos_disponiveis(dt, exibir_nomes=True)
+    if not horarios or horarios.strip() == "":
+        waha.send_message(
+            chat_id,
+            _caixa("😕 Sem horários", f"Não encontrei horários para {dt.strftime('%d/%m/%Y')}.\nEnvie outra data, voltar ou menu.")
+        )
+        return resposta_json(BODY_SUCCESS)
+
+    titulo = f"📅 Consulta — {dt.strftime('%d/%m/%Y')}"
+    conteudo = f"⏰ Disponíveis:\n{horarios}\n\nPara agendar, digite agendar.\nOu envie outra data."
+    waha.send_message(chat_id, _caixa(titulo, conteudo))
+    return resposta_json(BODY_SUCCESS)
+
+def _etapa_ver_horarios_listar(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha):
+    dt_try = _parse_data(msg_norm)
+    if dt_try:
+        ctx["consulta_data"] = dt_try
+        horarios = listar_blocos_disponiveis(dt_try, exibir_nomes=True)
+        if not horarios or horarios.strip() == "":
+            waha.send_message(
+                chat_id,
+                _caixa("😕 Sem horários", f"Não encontrei horários para {dt_try.strftime('%d/%m/%Y')}.\nEnvie outra data, voltar ou menu.")
+            )
+            return resposta_json(BODY_SUCCESS)
+
+        titulo = f"📅 Consulta — {dt_try.strftime('%d/%m/%Y')}"
+        conteudo = f"⏰ Disponíveis:\n{horarios}\n\nPara agendar, digite agendar.\nOu envie outra data."
+        waha.send_message(chat_id, _caixa(titulo, conteudo))
+        return resposta_json(BODY_SUCCESS)
+
+    if msg_lower in {"agendar", "quero agendar", "fazer agendamento"}:
+        _push(estado, "selecionar_servicos")
+        ctx["servicos"] = []
+        titulo = "✍ Selecione os serviços"
+        conteudo = CATALOGO_TEXTO
+        msg = _caixa(titulo, conteudo) + "\n\n" + \
+            "ℹ️ Dica:\n   envie números (ex.: 1,3) ou nomes (ex.: corte social, barba)."
+        waha.send_message(chat_id, msg)
+        return resposta_json(BODY_SUCCESS)
+
+    waha.send_message(
+        chat_id,
+        _caixa("ℹ️ Dica", "Para agendar, digite agendar.\nVocê também pode enviar outra data (DD/MM), voltar ou menu.")
+    )
+    return resposta_json(BODY_SUCCESS)
+
+# texto normalizado -> comando rápido de pagamento (vale em qualquer etapa)
+COMANDOS_RAPIDOS = MappingProxyType({
+    **dict.fromkeys(("status", "status do pagamento", "pagamento"), _cmd_status_pagamento),
+    **dict.fromkeys(("reenviar pix", "reenvia pix", "pix de novo", "pagar agora"), _cmd_reenviar_pix),
+})
+
+# etapa -> handler
+ETAPAS = MappingProxyType({
+    "menu": _etapa_menu,
+    "selecionar_servicos": _etapa_selecionar_servicos,
+    "solicitar_nome": _etapa_solicitar_nome,
+    "solicitar_insta": _etapa_solicitar_insta,
+    "solicitar_data": _etapa_solicitar_data,
+    "solicitar_horario": _etapa_solicitar_horario,
+    "ver_horarios_data": _etapa_ver_horarios_data,
+    "ver_horarios_listar": _etapa_ver_horarios_listar,
+})
+
+# ==========================
+# Fluxo principal
+# ==========================
+def processar(chat_id, msg, nome_empresa, waha, fluxo_usuario):
+    estado = _get(fluxo_usuario, chat_id)
+    ctx = estado.ctx
+    msg_original = msg or ""
+    msg_norm = _norm(msg_original)
+    msg_lower = msg_norm.lower()
+
+    # 1) Comandos UNIVERSAIS
+    uni = UNIVERSAIS.get(msg_lower)  # msg_lower já é _norm(msg).lower()
+    if uni == "menu":
+        _reset(estado)
+        _send_menu(waha, chat_id)
+        return resposta_json(BODY_SUCCESS)
+    if uni == "voltar":
+        if _back(estado):
+            waha.send_message(chat_id, _caixa("↩️ Voltar", "Voltei para a etapa anterior. Vamos continuar?"))
+        else:
+            waha.send_message(chat_id, _caixa("↩️ Início", "Você já está no início. Digite menu para recomeçar."))
+        return resposta_json(BODY_SUCCESS)
+    if uni == "cancelar":
+        _reset(estado)
+        _send_menu(waha, chat_id, antes=_caixa("✅ Fluxo cancelado", "Voltei ao menu principal."))
+        return resposta_json(BODY_SUCCESS)
+    if uni == "ajuda":
+        conteudo = (
+            "• Use menu para voltar ao início\n"
+            "• voltar para etapa anterior\n"
+            "• cancelar para encerrar\n"
+            "• atendente para falar com humano\n\n"
+            "Ex.: “agendar amanhã às 14h”"
+        )
+        waha.send_message(chat_id, _caixa("🆘 Ajuda rápida", conteudo))
+        return resposta_json(BODY_SUCCESS)
+    if uni == "atendente":
+        _reset(estado)
+        _send_menu(waha, chat_id, antes=_caixa("👩‍💼 Atendente", "Perfeito! Vou te direcionar para um atendente agora."))
+        return resposta_json(BODY_SUCCESS)
+
+    # 1.1) Comandos rápidos de pagamento  (<<< fora do bloco do 'atendente')
+    comando = COMANDOS_RAPIDOS.get(msg_lower)
+    if comando is not None:
+        return comando(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha)
+
+    # 2) HOTKEYS DO MENU
+    escolha = (MENU_ROUTER if estado.etapa == "menu" else MENU_ROUTER_TEXTUAL).get(msg_lower)
+    if escolha:
+        _handle_menu_action(escolha, estado, ctx, chat_id, waha)
+        return resposta_json(BODY_SUCCESS)
+
+    # 3) Estados
+    etapa = ETAPAS.get(estado.etapa)
+    if etapa is not None:
+        return etapa(estado, ctx, chat_id, msg_norm, msg_lower, nome_empresa, waha)
+
+    # ===== Fallback =====
+    _reset(estado)
+    _send_menu(waha, chat_id, antes=_caixa("⚠️ Não entendi", "Vamos recomeçar."))
+    return resposta_json(BODY_SUCCESS)
@@ -1,128 +1,302 @@
-import pandas as pd
-from datetime import datetime, timedelta
-import os
-
-PLANILHA_PATH = 'agendamentos_empresa1.xlsx'
-BACKUP_DIR = 'backups'
-
-# Blocos de horário fixos
-BLOCOS_HORARIOS = [
-    "08:00", "09:30", "11:00", "13:00",
-    "14:30", "16:00", "17:30", "19:00"
-]
-
-def carregar_agendamentos():
-    try:
-        df = pd.read_excel(PLANILHA_PATH)
-        df['Horário'] = df['Horário'].astype(str)
-        df['Data'] = pd.to_datetime(df['Data']).dt.date
-        return df
-    except FileNotFoundError:
-        return pd.DataFrame(columns=[
-            "Nome", "Data", "Horário", "Serviço", "Status", "Agendado_em"
-        ])
-
-def salvar_agendamentos(df):
-    # Backup automático
-    if not os.path.exists(BACKUP_DIR):
-        os.makedirs(BACKUP_DIR)
-
-    backup_file = os.path.join(BACKUP_DIR, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx")
-    df.to_excel(backup_file, index=False)
-
-    # Salva planilha oficial
-    df.to_excel(PLANILHA_PATH, index=False)
-
-def listar_blocos_disponiveis(data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = carregar_agendamentos()
-    ocupados = df[(df['Data'] == data) & (df['Status'] == 'Pendente')]['Horário'].tolist()
-
-    mensagem = f"📅 *Horários disponíveis para {data.strftime('%d/%m/%Y')}:*\n\n"
-    for i, bloco in enumerate(BLOCOS_HORARIOS, start=1):
-        status = "❌ Ocupado" if bloco in ocupados else "✅ Livre"
-        mensagem += f"{i} - {bloco} - {status}\n"
-    return mensagem
-
-def horario_valido(indice_usuario):
-    try:
-        index = int(indice_usuario) - 1
-        return BLOCOS_HORARIOS[index] if 0 <= index < len(BLOCOS_HORARIOS) else None
-    except:
-        return None
-
-def horario_disponivel(horario_str, data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = carregar_agendamentos()
-    filtro = (df['Data'] == data) & (df['Horário'] == horario_str) & (df['Status'] == "Pendente")
-    return df[~filtro].shape[0] == df.shape[0]
-
-def registrar_agendamento(nome, horario_str, servico, data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = carregar_agendamentos()
-    novo = pd.DataFrame([{
-        "Nome": nome.strip().title(),
-        "Data": data,
-        "Horário": horario_str,
-        "Serviço": servico,
-        "Status": "Pendente",
-        "Agendado_em": datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-    }])
-    df = pd.concat([df, novo], ignore_index=True)
-    salvar_agendamentos(df)
-
-def listar_agendamentos_do_dia(data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = carregar_agendamentos()
-    df = df[(df["Data"] == data) & (df["Status"] == "Pendente")]
-    return df.sort_values(by="Horário")
-
-def proximo_cliente(data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = listar_agendamentos_do_dia(data)
-    return df.iloc[0] if not df.empty else None
-
-def finalizar_agendamento(data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = carregar_agendamentos()
-    df = df.sort_values(by=["Data", "Horário"])
-
-    for i in df.index:
-        if df.at[i, "Data"] == data and df.at[i, "Status"] == "Pendente":
-            df.at[i, "Status"] = "Finalizado"
-            salvar_agendamentos(df)
-            return df.at[i, "Nome"]
-    return None
-
-def cancelar_agendamento_por_nome(nome, data=None):
-    if data is None:
-        data = datetime.now().date()
-
-    df = carregar_agendamentos()
-    cond = (df["Nome"].str.lower() == nome.strip().lower()) & (df["Data"] == data) & (df["Status"] == "Pendente")
-
-    if cond.any():
-        df.loc[cond, "Status"] = "Cancelado"
-        salvar_agendamentos(df)
-        return True
-    return False
-
-def buscar_por_nome(nome):
-    df = carregar_agendamentos()
-    return df[df["Nome"].str.lower().str.contains(nome.strip().lower())]
-
-def buscar_por_data(data):
-    df = carregar_agendamentos()
-    return df[df["Data"] == data]
+import pandas as pd
+from datetime import datetime, date, timedelta
+import atexit
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PLANILHA_PATH = 'agendamentos_empresa1.xlsx'  # legado: importada uma vez para o SQLite
+DB_PATH = os.getenv("SERVICES_AGENDA_DB_PATH", 'agendamentos_empresa1.db')
+BACKUP_DIR = 'backups'
+BACKUP_INTERVAL_SEC = int(os.getenv("SERVICES_AGENDA_BACKUP_INTERVAL_SEC", str(7 * 24 * 3600)))  # semanal
+OCUPADOS_TTL_SEC = float(os.getenv("SERVICES_AGENDA_OCUPADOS_TTL_SEC", "5"))
+
+# Blocos de horário fixos
+BLOCOS_HORARIOS = [
+    "08:00", "09:30", "11:00", "13:00",
+    "14:30", "16:00", "17:30", "19:00"
+]
+
+COLUNAS = ["Nome", "Data", "Horário", "Serviço", "Status", "Agendado_em"]
+
+# =============================
+# Banco (SQLite)
+# =============================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS agendamentos (
+    id            INTEGER PRIMARY KEY,
+    Nome          TEXT NOT NULL DEFAULT '',
+    Data          TEXT,
+    "Horário"     TEXT NOT NULL DEFAULT '',
+    "Serviço"     TEXT NOT NULL DEFAULT '',
+    Status        TEXT NOT NULL DEFAULT '',
+    Agendado_em   TEXT NOT NULL DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS ix_agendamentos_disp ON agendamentos (Data, "Horário", Status);
+"""
+
+_SQL_COLS = ", ".join(f'"{c}"' for c in COLUNAS)
+_SQL_INSERT = f"INSERT INTO agendamentos ({_SQL_COLS}) VALUES ({', '.join('?' for _ in COLUNAS)})"
+
+_local = threading.local()
+_init_lock = threading.Lock()
+_inicializados = set()
+
+def _conn():
+    """Uma conexão por thread, em autocommit (WAL: leituras não esperam escritas)."""
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.path == DB_PATH:
+        return conn
+
+    conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # lower() do SQLite só trata ASCII; nomes com acento usam o str.lower do Python
+    conn.create_function("py_lower", 1, lambda s: (s or "").lower(), deterministic=True)
+    with _init_lock:
+        if DB_PATH not in _inicializados:
+            _init_db(conn)
+            if not _inicializados:
+                # só quem abriu o banco faz o snapshot pendente no encerramento (síncrono)
+                atexit.register(_fazer_backup)
+            _inicializados.add(DB_PATH)
+    _local.conn, _local.path = conn, DB_PATH
+    return conn
+
+@contextmanager
+def _tx(conn=None):
+    """Transação de escrita (BEGIN IMMEDIATE: pega o lock de escrita logo no início)."""
+    conn = conn or _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+def _data_iso(d):
+    """Data no formato gravado no banco (YYYY-MM-DD)."""
+    if isinstance(d, datetime):
+        return d.date().isoformat()
+    if isinstance(d, date):
+        return d.isoformat()
+    return pd.to_datetime(d).date().isoformat()
+
+def _df_to_rows(df):
+    rows = []
+    for rec in df.to_dict("records"):
+        row = []
+        for c in COLUNAS:
+            v = rec.get(c)
+            if c == "Data":
+                v = None if pd.isna(v) else _data_iso(v)
+            else:
+                v = "" if pd.isna(v) else str(v)
+            row.append(v)
+        rows.append(tuple(row))
+    return rows
+
+def _init_db(conn):
+    conn.executescript(_SCHEMA)
+    # user_version marca a importação da planilha antiga (roda uma única vez)
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= 1:
+        return
+    with _tx(conn):
+        if conn.execute("PRAGMA user_version").fetchone()[0] < 1:
+            if os.path.exists(PLANILHA_PATH):
+                rows = _df_to_rows(pd.read_excel(PLANILHA_PATH))
+                conn.executemany(_SQL_INSERT, rows)
+                print(f"[AGENDA] {len(rows)} agendamentos importados de {PLANILHA_PATH}")
+            conn.execute("PRAGMA user_version = 1")
+
+def _select_df(where="", params=(), order="id"):
+    df = pd.read_sql_query(
+        f"SELECT {_SQL_COLS} FROM agendamentos {where} ORDER BY {order}", _conn(), params=params
+    )
+    df['Horário'] = df['Horário'].astype(str)
+    df['Data'] = pd.to_datetime(df['Data']).dt.date
+    return df
+
+# =============================
+# Backup (snapshot do banco, no máximo um por BACKUP_INTERVAL_SEC)
+# =============================
+_backup_lock = threading.Lock()
+_proximo_backup = 0.0  # time.time() antes do qual nem vale olhar a pasta de backups
+
+def _backup_se_preciso():
+    """Chamado após cada escrita: se o snapshot venceu, copia numa thread (a escrita não espera)."""
+    if time.time() < _proximo_backup or _backup_lock.locked():
+        return
+    threading.Thread(target=_fazer_backup, name="agenda-backup", daemon=True).start()
+
+def _fazer_backup():
+    """Checa o mtime do backup mais recente; só copia o banco se ele for mais velho que o intervalo."""
+    global _proximo_backup
+    if not os.path.exists(DB_PATH):
+        return  # sqlite3.connect criaria um banco vazio só para copiá-lo
+    if not _backup_lock.acquire(blocking=False):
+        return
+    try:
+        os.makedirs(BACKUP_DIR, exist_ok=True)
+        existentes = sorted(Path(BACKUP_DIR).glob("backup_*.db"))
+        if existentes:
+            ultimo = existentes[-1].stat().st_mtime
+            if time.time() - ultimo < BACKUP_INTERVAL_SEC:
+                _proximo_backup = ultimo + BACKUP_INTERVAL_SEC
+                return
+        destino = os.path.join(BACKUP_DIR, f"backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.db")
+        tmp = destino + ".tmp"
+        src, dst = sqlite3.connect(DB_PATH), sqlite3.connect(tmp)
+        try:
+            src.backup(dst)
+        finally:
+            dst.close()
+            src.close()
+        os.replace(tmp, destino)
+        _proximo_backup = time.time() + BACKUP_INTERVAL_SEC
+    except Exception as e:
+        print(f"[AGENDA] Falha no backup: {e}")
+    finally:
+        _backup_lock.release()
+
+# =============================
+# IO (compatibilidade com o formato em DataFrame)
+# =============================
+def carregar_agendamentos():
+    """Tabela inteira como DataFrame (mesmas colunas da planilha). Só para usos legados."""
+    return _select_df()
+
+def salvar_agendamentos(df):
+    """Substitui a tabela inteira pelo DataFrame (compatibilidade; prefira as funções pontuais)."""
+    rows = _df_to_rows(df)
+    with _tx() as conn:
+        conn.execute("DELETE FROM agendamentos")
+        conn.executemany(_SQL_INSERT, rows)
+    _invalidar_ocupados()
+    _backup_se_preciso()
+
+# =============================
+# Horários ocupados por dia (cache curto; escritas invalidam o dia afetado)
+# =============================
+_ocupados_cache = {}  # data ISO -> (monotonic, frozenset de horários)
+_ocupados_lock = threading.Lock()
+
+def _ocupados(data):
+    chave = _data_iso(data)
+    agora = time.monotonic()
+    hit = _ocupados_cache.get(chave)
+    if hit is not None and agora - hit[0] < OCUPADOS_TTL_SEC:
+        return hit[1]
+
+    ocupados = frozenset(r[0] for r in _conn().execute(
+        'SELECT "Horário" FROM agendamentos WHERE Data = ? AND Status = ?',
+        (chave, "Pendente"),
+    ))
+    with _ocupados_lock:
+        _ocupados_cache[chave] = (agora, ocupados)
+    return ocupados
+
+def _invalidar_ocupados(data=None):
+    """Descarta o cache do dia (ou de todos, sem 'data')."""
+    with _ocupados_lock:
+        if data is None:
+            _ocupados_cache.clear()
+        else:
+            _ocupados_cache.pop(_data_iso(data), None)
+
+def listar_blocos_disponiveis(data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    ocupados = _ocupados(data)
+
+    mensagem = f"📅 *Horários disponíveis para {data.strftime('%d/%m/%Y')}:*\n\n"
+    for i, bloco in enumerate(BLOCOS_HORARIOS, start=1):
+        status = "❌ Ocupado" if bloco in ocupados else "✅ Livre"
+        mensagem += f"{i} - {bloco} - {status}\n"
+    return mensagem
+
+def horario_valido(indice_usuario):
+    try:
+        index = int(indice_usuario) - 1
+        return BLOCOS_HORARIOS[index] if 0 <= index < len(BLOCOS_HORARIOS) else None
+    except:
+        return None
+
+def horario_disponivel(horario_str, data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    return str(horario_str) not in _ocupados(data)
+
+def registrar_agendamento(nome, horario_str, servico, data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    # uma linha: INSERT em autocommit, sem reescrever nada
+    _conn().execute(_SQL_INSERT, (
+        nome.strip().title(),
+        _data_iso(data),
+        str(horario_str),
+        servico,
+        "Pendente",
+        datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+    ))
+    _invalidar_ocupados(data)
+    _backup_se_preciso()
+
+def listar_agendamentos_do_dia(data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    return _select_df("WHERE Data = ? AND Status = 'Pendente'", (_data_iso(data),), order='"Horário", id')
+
+def proximo_cliente(data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    df = listar_agendamentos_do_dia(data)
+    return df.iloc[0] if not df.empty else None
+
+def finalizar_agendamento(data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    with _tx() as conn:
+        row = conn.execute(
+            "SELECT id, Nome FROM agendamentos WHERE Data = ? AND Status = 'Pendente' "
+            'ORDER BY "Horário", id LIMIT 1',
+            (_data_iso(data),),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute("UPDATE agendamentos SET Status = 'Finalizado' WHERE id = ?", (row[0],))
+    _invalidar_ocupados(data)
+    _backup_se_preciso()
+    return row[1]
+
+def cancelar_agendamento_por_nome(nome, data=None):
+    if data is None:
+        data = datetime.now().date()
+
+    with _tx() as conn:
+        cur = conn.execute(
+            "UPDATE agendamentos SET Status = 'Cancelado' "
+            "WHERE Data = ? AND Status = 'Pendente' AND py_lower(Nome) = ?",
+            (_data_iso(data), nome.strip().lower()),
+        )
+    if cur.rowcount > 0:
+        _invalidar_ocupados(data)
+        _backup_se_preciso()
+        return True
+    return False
+
+def buscar_por_nome(nome):
+    return _select_df("WHERE instr(py_lower(Nome), ?) > 0", (nome.strip().lower(),))
+
+def buscar_por_data(data):
+    return _select_df("WHERE Data = ?", (_data_iso(data),))
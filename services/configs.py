@@ -1,21 +1,40 @@
-# services/configs.py
-import os, json
-
-_EMPRESAS = None
-
-def load_empresas():
-    global _EMPRESAS
-    if _EMPRESAS is None:
-        with open("config/empresas_config.json", "r", encoding="utf-8") as f:
-            _EMPRESAS = json.load(f)
-    return _EMPRESAS
-
-def get_empresa_config(empresa_id: str) -> dict:
-    empresas = load_empresas()
-    if empresa_id not in empresas:
-        raise KeyError(f"Empresa não configurada: {empresa_id}")
-    return empresas[empresa_id]
-
-def get_base_url() -> str:
-    base = os.getenv("BASE_URL")
-    return base.rstrip("/") if base else "http://localhost:5000"
+# services/configs.py
+import os
+from functools import lru_cache
+from pathlib import Path
+
+import orjson
+
+CONFIG_DIR = Path(__file__).resolve().parents[1] / "config"
+EMPRESAS_CONFIG_PATH = CONFIG_DIR / "empresas_config.json"
+ADMINS_CONFIG_PATH = CONFIG_DIR / "admins_config.json"
+
+@lru_cache(maxsize=32)
+def _parse(path_str: str, mtime_ns: int):
+    return orjson.loads(Path(path_str).read_bytes())
+
+def load_config(path):
+    """
+    JSON de configuração parseado uma única vez por versão do arquivo:
+    o cache é indexado pelo mtime, então editar o arquivo força um novo parse.
+    O dict devolvido é compartilhado — não altere.
+    Erros (FileNotFoundError / orjson.JSONDecodeError, que é um json.JSONDecodeError) sobem para quem chamou.
+    """
+    path = Path(path)
+    return _parse(str(path), path.stat().st_mtime_ns)
+
+def load_empresas():
+    return load_config(EMPRESAS_CONFIG_PATH)
+
+def load_admins():
+    return load_config(ADMINS_CONFIG_PATH)
+
+def get_empresa_config(empresa_id: str) -> dict:
+    empresas = load_empresas()
+    if empresa_id not in empresas:
+        raise KeyError(f"Empresa não configurada: {empresa_id}")
+    return empresas[empresa_id]
+
+def get_base_url() -> str:
+    base = os.getenv("BASE_URL")
+    return base.rstrip("/") if base else "http://localhost:5000"
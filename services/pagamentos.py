@@ -1,582 +1,766 @@
-# services/pagamentos.py
-import os, json, importlib, hmac, hashlib
-from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
-from flask import Blueprint, request, jsonify
-import mercadopago
-from mercadopago.config import RequestOptions
-from urllib.parse import urljoin
-import requests
-
-# Envio de WhatsApp após aprovação
-from services.waha import Waha
-
-# =========================
-# Configurações básicas
-# =========================
-BASE_URL = os.getenv("BASE_URL", "https://example.com").rstrip("/")
-MP_WEBHOOK_SECRET = os.getenv("MP_WEBHOOK_SECRET", "")  # secret gerada ao salvar o webhook no painel
-MP_REQUIRE_SIGNATURE = os.getenv("MP_REQUIRE_SIGNATURE", "false").lower() in ("1", "true", "yes")
-
-pagamentos_bp = Blueprint("pagamentos", __name__)
-
-with open(os.path.join("config", "empresas_config.json"), "r", encoding="utf-8") as f:
-    EMP_CFG = json.load(f)
-
-# =========================
-# Helpers gerais
-# =========================
-def _build_url(path: str) -> str:
-    return urljoin(BASE_URL + "/", path.lstrip("/"))
-
-def get_cfg(empresa: str) -> Dict[str, Any]:
-    cfg = EMP_CFG.get(empresa)
-    if not cfg or not cfg.get("mp_access_token"):
-        raise ValueError(f"Config MP ausente para empresa '{empresa}'")
-    return cfg
-
-def get_mp_sdk(empresa: str) -> mercadopago.SDK:
-    cfg = get_cfg(empresa)
-    return mercadopago.SDK(cfg["mp_access_token"])
-
-def get_agenda_mod(empresa: str):
-    return importlib.import_module(f"scripts_empresas.{empresa}.agenda")
-
-def _pref_expiration(minutes=20):
-    now = datetime.utcnow()
-    return {
-        "expires": True,
-        "expiration_date_from": now.strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-        "expiration_date_to": (now + timedelta(minutes=minutes)).strftime("%Y-%m-%dT%H:%M:%S.000Z"),
-    }
-
-def _sum_total(itens: List[Dict[str, Any]]) -> float:
-    return round(sum(float(i.get("unit_price", 0.0)) * int(i.get("quantity", 1)) for i in (itens or [])), 2)
-
-def _fmt_brl(v: float) -> str:
-    try:
-        return ("R$ {:,.2f}".format(float(v))).replace(",", "X").replace(".", ",").replace("X", ".")
-    except Exception:
-        return f"R$ {v}"
-
-def _debug(tag: str, data: dict | None):
-    try:
-        print(f"[MP:{tag}] {json.dumps(data or {}, ensure_ascii=False)[:2000]}")
-    except Exception:
-        print(f"[MP:{tag}] (payload não serializável)")
-
-# =========================
-# Assinatura do Webhook (opcional/soft)
-# =========================
-def _validar_assinatura(req) -> bool:
-    """
-    Validação 'soft' da assinatura (x-signature) do Mercado Pago.
-    - Se MP_WEBHOOK_SECRET vazio: True (não valida).
-    - Se sem header: True, a menos que MP_REQUIRE_SIGNATURE=true.
-    - Tenta bases comuns (varia por produto/região).
-    """
-    if not MP_WEBHOOK_SECRET:
-        return True
-
-    sig_hdr = req.headers.get("x-signature") or req.headers.get("X-Signature")
-    if not sig_hdr:
-        return not MP_REQUIRE_SIGNATURE
-
-    ts, v1 = None, None
-    try:
-        parts = dict(p.strip().split("=", 1) for p in sig_hdr.split(","))
-        ts = parts.get("ts")
-        v1 = parts.get("v1")
-    except Exception:
-        _debug("sig.parse.error", {"header": sig_hdr})
-        return not MP_REQUIRE_SIGNATURE
-
-    if not ts or not v1:
-        return not MP_REQUIRE_SIGNATURE
-
-    body_text = req.get_data(as_text=True) or ""
-    path = req.path or ""
-    qs = req.query_string.decode("utf-8") if req.query_string else ""
-
-    candidates = [
-        ts + body_text,
-        f"{ts}{body_text}",
-        f"{ts}:{body_text}",
-        f"{ts}{path}{qs}",
-        f"{ts}{path}",
-        f"{path}{ts}",
-        f"{ts}",
-    ]
-
-    for base in candidates:
-        calc = hmac.new(MP_WEBHOOK_SECRET.encode("utf-8"), base.encode("utf-8"), hashlib.sha256).hexdigest()
-        if hmac.compare_digest(calc, v1):
-            return True
-
-    _debug("sig.mismatch", {"ts": ts, "path": path, "qs": qs, "tried": len(candidates)})
-    return not MP_REQUIRE_SIGNATURE
-
-# =========================
-# Utilitários de webhook
-# =========================
-def _extract_payment_id(args_dict: dict, payload_dict: dict) -> Optional[str]:
-    # via querystring
-    if (args_dict.get("topic") or "").lower() == "payment" and args_dict.get("id"):
-        return str(args_dict.get("id"))
-
-    # via payload data.id
-    data_id = (payload_dict.get("data") or {}).get("id")
-    if data_id:
-        return str(data_id)
-
-    # via resource .../v1/payments/<id>
-    res_url = str(payload_dict.get("resource") or "")
-    if "/v1/payments/" in res_url:
-        return res_url.rsplit("/", 1)[-1]
-
-    return None
-
-def _fetch_payment_with_sdk(mp_sdk: mercadopago.SDK, pid: str) -> Optional[dict]:
-    try:
-        res = mp_sdk.payment().get(pid)
-    except Exception as e:
-        _debug("payment.get.exc", {"id": pid, "error": str(e)})
-        return None
-    if res.get("status") != 200:
-        _debug("payment.get.bad", res)
-        return None
-    return res.get("response") or {}
-
-def _process_approved_for_empresa(empresa: str, payment: dict) -> None:
-    """Confirma na planilha e envia WhatsApp se approved."""
-    agenda = get_agenda_mod(empresa)
-    status = (payment.get("status") or "").lower()
-    if status != "approved":
-        return
-
-    # External reference -> nosso snapshot/contexto
-    try:
-        pld = json.loads(payment.get("external_reference") or "{}")
-    except Exception:
-        pld = {}
-
-    if pld.get("empresa") != empresa:
-        _debug("webhook.mismatch_empresa", {"payload_empresa": pld.get("empresa"), "route": empresa})
-        return
-
-    agendamento_id = pld.get("agendamento_id")
-    chat_id = pld.get("chat_id")
-    total = pld.get("total") or 0.0
-    servico_lbl = pld.get("servico") or "Serviço"
-
-    # Confirma na planilha (evita duplicar mensagens)
-    enviou_confirmacao = False
-    if agendamento_id:
-        try:
-            altered = agenda.confirmar_pagamento(agendamento_id)
-            enviou_confirmacao = bool(altered)
-        except Exception as e:
-            _debug("confirmar_pagamento.exc", {"error": str(e)})
-
-    # Monta resumo (snapshot)
-    try:
-        snap = agenda.obter_snapshot(agendamento_id) if agendamento_id else None
-    except Exception:
-        snap = None
-    itens = (snap or {}).get("itens") or []
-    if not total and snap:
-        total = (snap.get("total") or 0.0)
-
-    linhas = "\n".join(
-        [f"- {i.get('title')}: {_fmt_brl(i.get('unit_price', 0))}" for i in itens]
-    ) if itens else None
-
-    # Data/horário (se disponível)
-    data_txt, horario_txt = pld.get("data") or "", pld.get("horario") or ""
-    if hasattr(agenda, "obter_por_id") and agendamento_id:
-        try:
-            row = agenda.obter_por_id(agendamento_id)
-            if row:
-                try:
-                    d = row.get("Data")
-                    if hasattr(d, "strftime"):
-                        data_txt = d.strftime("%d/%m/%Y")
-                    else:
-                        data_txt = datetime.fromisoformat(str(d)).strftime("%d/%m/%Y")
-                except Exception:
-                    pass
-                horario_txt = str(row.get("Horário") or horario_txt)
-                servico_lbl = str(row.get("Serviço") or servico_lbl)
-        except Exception as e:
-            _debug("obter_por_id.exc", {"error": str(e)})
-
-    # Envia a confirmação no WhatsApp (apenas se houve transição de status)
-    if enviou_confirmacao and chat_id:
-        try:
-            base_url = EMP_CFG[empresa].get("base_url")
-            waha_session = EMP_CFG[empresa].get("waha_session", "default")
-            waha = Waha(base_url, session=waha_session)
-
-            msg = (
-                "✅ *Pagamento aprovado*\n\n"
-                "🎉 *Agendamento concluído!*\n"
-                f"💈 {servico_lbl}\n"
-                f"📅 {data_txt}  🕒 {horario_txt}\n"
-            )
-            if linhas:
-                msg += f"\n🧾 Itens:\n{linhas}\n"
-            if total:
-                msg += f"Total: {_fmt_brl(total)}\n"
-            msg += "\nObrigado! Sessão encerrada ✅\nSe precisar, responda aqui. Para novo agendamento, digite *menu*."
-
-            waha.send_message(chat_id, msg)
-        except Exception as e:
-            _debug("whatsapp.send.exc", {"error": str(e)})
-
-# =========================
-# Checkout Pro (opcional)
-# =========================
-@pagamentos_bp.post("/<empresa>/create")
-def mp_create_preference(empresa: str):
-    mp = get_mp_sdk(empresa)
-    agenda = get_agenda_mod(empresa)
-
-    body = request.get_json(force=True) or {}
-    agendamento_id = body.get("agendamento_id")
-    chat_id = body.get("chat_id")
-    nome     = (body.get("nome") or "Cliente").strip()
-    insta    = (body.get("insta") or "").strip()
-    data_iso = body.get("data")
-    horario  = body.get("horario")
-    itens_in = body.get("itens") or []
-
-    if not (agendamento_id and chat_id and data_iso and horario):
-        return jsonify({"error": "missing_fields"}), 400
-
-    # Data
-    try:
-        dt = datetime.fromisoformat(data_iso).date()
-    except Exception:
-        return jsonify({"error": "invalid_date"}), 400
-
-    # Pode estar indisponível pela própria reserva; aceita se bater com a reserva
-    if not agenda.horario_disponivel(horario, dt):
-        try:
-            bate = agenda.reserva_bate(
-                agendamento_id=agendamento_id, data_ref=dt, horario_ref=horario, chat_id=chat_id
-            )
-        except AttributeError:
-            bate = False
-        if not bate:
-            return jsonify({"error": "slot_unavailable"}), 409
-
-    # Usa snapshot, se existir
-    itens = itens_in
-    total = None
-    try:
-        snap = agenda.obter_snapshot(agendamento_id)
-        if snap and (snap.get("itens") or []):
-            itens = snap["itens"]
-            total = float(snap.get("total") or 0.0)
-    except Exception:
-        pass
-    total = total if total is not None else _sum_total(itens)
-    servico_label = ", ".join([str(x.get("title","")).strip() for x in itens]) or "Serviço"
-
-    pref = {
-        "items": itens,
-        "payer": {"name": nome},
-        "auto_return": "approved",
-        "back_urls": {
-            "success": _build_url(f"/mp/{empresa}/return?status=success"),
-            "failure": _build_url(f"/mp/{empresa}/return?status=failure"),
-            "pending": _build_url(f"/mp/{empresa}/return?status=pending"),
-        },
-        "notification_url": _build_url(f"/mp/{empresa}/webhook"),
-        "statement_descriptor": EMP_CFG[empresa].get("statement_descriptor", "BARBEARIA"),
-        "external_reference": json.dumps({
-            "empresa": empresa,
-            "agendamento_id": agendamento_id,
-            "chat_id": chat_id,
-            "nome": nome,
-            "insta": insta,
-            "data": data_iso,
-            "horario": horario,
-            "servico": servico_label,
-            "total": total
-        }, ensure_ascii=False),
-        **_pref_expiration(20),
-        "metadata": {
-            "empresa": empresa,
-            "agendamento_id": agendamento_id
-        }
-    }
-
-    # Idempotência
-    idem_key = f"pref:{empresa}:{chat_id}:{data_iso}:{horario}:{total}"
-    req_opts = RequestOptions()
-    req_opts.custom_headers = {"x-idempotency-key": idem_key}
-
-    _debug("pref.create.req", {"pref": pref, "idem": idem_key})
-    result = mp.preference().create(pref, req_opts)
-    _debug("pref.create.res", result)
-
-    if result.get("status") not in (200, 201):
-        return jsonify({"error": "mp_error", "details": result}), 502
-
-    resp = result["response"]
-    return jsonify({
-        "id": resp.get("id"),
-        "init_point": resp.get("init_point"),
-        "sandbox_init_point": resp.get("sandbox_init_point"),
-        "total": total
-    }), 200
-
-@pagamentos_bp.get("/<empresa>/return")
-def mp_return(empresa: str):
-    return "Pagamento processado. Você pode fechar esta janela.", 200
-
-# =========================
-# Webhook por empresa (GET/HEAD/POST)
-# =========================
-@pagamentos_bp.get("/<empresa>/webhook")
-def mp_webhook_get_empresa(empresa: str):
-    # validação do painel
-    return jsonify({"status": "ok", "msg": "webhook alive", "empresa": empresa}), 200
-
-@pagamentos_bp.route("/<empresa>/webhook", methods=["HEAD"])
-def mp_webhook_head_empresa(empresa: str):
-    return ("", 200)
-
-@pagamentos_bp.post("/<empresa>/webhook")
-def mp_webhook_empresa(empresa: str):
-    # valida assinatura
-    if not _validar_assinatura(request):
-        return jsonify({"status": "invalid_signature"}), 401
-
-    mp = get_mp_sdk(empresa)
-
-    args = request.args or {}
-    payload = request.get_json(silent=True) or {}
-    _debug("webhook.in", {"empresa": empresa, "args": dict(args), "payload": payload})
-
-    pid = _extract_payment_id(args, payload)
-    if not pid:
-        _debug("webhook.no_pid", {"empresa": empresa})
-        return jsonify({"status": "ignored"}), 200
-
-    payment = _fetch_payment_with_sdk(mp, pid)
-    if not payment:
-        return jsonify({"status": "payment_lookup_failed"}), 200
-
-    _process_approved_for_empresa(empresa, payment)
-    return jsonify({"status": "ok"}), 200
-
-# =========================
-# Webhook coringa (sem /<empresa>) — útil quando o painel está apontando para /mp/webhook
-# =========================
-@pagamentos_bp.get("/webhook")
-def mp_webhook_get_generic():
-    return jsonify({"status": "ok", "msg": "generic webhook alive"}), 200
-
-@pagamentos_bp.route("/webhook", methods=["HEAD"])
-def mp_webhook_head_generic():
-    return ("", 200)
-
-@pagamentos_bp.post("/webhook")
-def mp_webhook_generic():
-    # valida assinatura
-    if not _validar_assinatura(request):
-        return jsonify({"status": "invalid_signature"}), 401
-
-    args = request.args or {}
-    payload = request.get_json(silent=True) or {}
-    _debug("webhook.generic.in", {"args": dict(args), "payload": payload})
-
-    pid = _extract_payment_id(args, payload)
-    if not pid:
-        _debug("webhook.generic.no_pid", {})
-        return jsonify({"status": "ignored"}), 200
-
-    # tenta buscar o pagamento usando cada token até achar
-    payment = None
-    empresa_ref = None
-    for emp_key, cfg in EMP_CFG.items():
-        token = cfg.get("mp_access_token")
-        if not token:
-            continue
-        sdk = mercadopago.SDK(token)
-        payment = _fetch_payment_with_sdk(sdk, pid)
-        if not payment:
-            continue
-        # achou um pagamento; tenta extrair external_reference
-        try:
-            pld = json.loads(payment.get("external_reference") or "{}")
-        except Exception:
-            pld = {}
-        empresa_ref = pld.get("empresa")
-        if empresa_ref and empresa_ref in EMP_CFG:
-            break
-        # se não achou empresa no external_reference, continua procurando
-        payment = None
-
-    if not payment or not empresa_ref:
-        _debug("webhook.generic.unresolved", {"pid": pid})
-        return jsonify({"status": "ignored"}), 200
-
-    _process_approved_for_empresa(empresa_ref, payment)
-    return jsonify({"status": "ok", "empresa": empresa_ref}), 200
-
-# =========================
-# Diagnóstico (opcional)
-# =========================
-@pagamentos_bp.get("/<empresa>/payment_methods")
-def mp_list_payment_methods(empresa: str):
-    try:
-        token = get_cfg(empresa)["mp_access_token"]
-    except Exception as e:
-        return jsonify({"error": "cfg_error", "message": str(e)}), 400
-
-    try:
-        resp = requests.get(
-            "https://api.mercadopago.com/v1/payment_methods",
-            headers={"Authorization": f"Bearer {token}"},
-            timeout=10
-        )
-    except Exception as e:
-        return jsonify({"error": "network_error", "message": str(e)}), 502
-
-    if resp.status_code != 200:
-        return jsonify({"error": "mp_error", "status": resp.status_code, "details": resp.text}), 502
-
-    data = resp.json() if isinstance(resp.json(), list) else []
-    methods = []
-    pix_available = False
-    for m in data:
-        mid = (m.get("id") or "").lower()
-        status = (m.get("status") or m.get("status_detail") or "").lower()
-        name = m.get("name") or m.get("description") or ""
-        methods.append({
-            "id": mid,
-            "name": name,
-            "payment_type_id": m.get("payment_type_id"),
-            "status": status
-        })
-        if mid == "pix" and status == "active":
-            pix_available = True
-
-    return jsonify({"pix_available": pix_available, "count": len(methods), "methods": methods}), 200
-
-# =========================
-# PIX DIRETO (Payments API)
-# =========================
-@pagamentos_bp.post("/<empresa>/pix")
-def mp_create_pix(empresa: str):
-    """
-    Cria um pagamento PIX (copia e cola) sem exigir login/app do MP.
-    Retorna o qr_code (string copia e cola) e o ticket_url (página do MP).
-    """
-    mp = get_mp_sdk(empresa)
-    agenda = get_agenda_mod(empresa)
-
-    body = request.get_json(force=True) or {}
-    agendamento_id = body.get("agendamento_id")
-    chat_id = body.get("chat_id")
-    nome     = (body.get("nome") or "Cliente").strip()
-    insta    = (body.get("insta") or "").strip()
-    data_iso = body.get("data")
-    horario  = body.get("horario")
-
-    if not (agendamento_id and chat_id and data_iso and horario):
-        return jsonify({"error": "missing_fields"}), 400
-
-    # validando data/slot
-    try:
-        dt = datetime.fromisoformat(data_iso).date()
-    except Exception:
-        return jsonify({"error": "invalid_date"}), 400
-
-    if not agenda.horario_disponivel(horario, dt):
-        try:
-            bate = agenda.reserva_bate(
-                agendamento_id=agendamento_id, data_ref=dt, horario_ref=horario, chat_id=chat_id
-            )
-        except AttributeError:
-            bate = False
-        if not bate:
-            return jsonify({"error": "slot_unavailable"}), 409
-
-    # Snapshot de itens/total
-    itens = []
-    total = 0.0
-    servico_label = "Serviço"
-    try:
-        snap = agenda.obter_snapshot(agendamento_id)
-        if snap and (snap.get("itens") or []):
-            itens = snap["itens"]
-            total = float(snap.get("total") or 0.0)
-            servico_label = ", ".join([str(x.get("title","")).strip() for x in itens]) or servico_label
-    except Exception:
-        pass
-    if not itens or total <= 0:
-        return jsonify({"error": "no_items"}), 400
-
-    # PIX body
-    payer_email = body.get("payer_email") or f"cliente+{agendamento_id.lower()}@example.com"
-    exp_to = datetime.utcnow() + timedelta(minutes=20)
-    exp_str = exp_to.strftime("%Y-%m-%dT%H:%M:%S.000Z")
-
-    payment_data = {
-        "transaction_amount": total,
-        "description": f"Agendamento {servico_label} — {data_iso} {horario}",
-        "payment_method_id": "pix",
-        "payer": {
-            "email": payer_email,
-            "first_name": nome[:60]
-        },
-        "external_reference": json.dumps({
-            "empresa": empresa,
-            "agendamento_id": agendamento_id,
-            "chat_id": chat_id,
-            "nome": nome,
-            "insta": insta,
-            "data": data_iso,
-            "horario": horario,
-            "servico": servico_label,
-            "total": total
-        }, ensure_ascii=False),
-        "metadata": {
-            "empresa": empresa,
-            "agendamento_id": agendamento_id
-        },
-        "date_of_expiration": exp_str,
-        "notification_url": _build_url(f"/mp/{empresa}/webhook")  # garante notificação por payment
-    }
-
-    idem_key = f"pix:{empresa}:{chat_id}:{data_iso}:{horario}:{total}"
-    req_opts = RequestOptions()
-    req_opts.custom_headers = {"X-Idempotency-Key": idem_key}
-
-    _debug("pix.create.req", {"payment_data": payment_data, "idem": idem_key})
-    try:
-        result = mp.payment().create(payment_data, req_opts)
-    except Exception as e:
-        _debug("pix.create.exc", {"error": str(e)})
-        return jsonify({"error": "mp_exception", "message": str(e)}), 502
-    _debug("pix.create.res", result)
-
-    status = result.get("status")
-    if status not in (200, 201):
-        return jsonify({"error": "mp_error", "status": status, "details": result}), 502
-
-    resp = result.get("response", {}) or {}
-    poi = resp.get("point_of_interaction", {}) or {}
-    tx = poi.get("transaction_data", {}) or {}
-
-    return jsonify({
-        "payment_id": resp.get("id"),
-        "status": resp.get("status"),
-        "qr_code": tx.get("qr_code"),        # PIX copia e cola
-        "ticket_url": tx.get("ticket_url"),  # página web com QR (sem login)
-        "total": total
-    }), 200
+# services/pagamentos.py
+import os, re, importlib, hmac, hashlib, time, traceback
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import threading
+from flask import Blueprint, request, jsonify
+import mercadopago
+import orjson
+from mercadopago.config import RequestOptions
+from urllib.parse import urljoin
+import requests
+
+# Envio de WhatsApp após aprovação
+from services.waha import Waha
+from services.configs import load_empresas
+
+# =========================
+# Configurações básicas
+# =========================
+BASE_URL = os.getenv("BASE_URL", "https://example.com").rstrip("/")
+MP_WEBHOOK_SECRET = os.getenv("MP_WEBHOOK_SECRET", "")  # secret gerada ao salvar o webhook no painel
+MP_REQUIRE_SIGNATURE = os.getenv("MP_REQUIRE_SIGNATURE", "false").lower() in ("1", "true", "yes")
+
+# Logs [MP:*] de depuração (lidos uma vez; desligado, _debug nem monta o payload)
+MP_DEBUG = os.getenv("MP_DEBUG", "true").lower() in ("1", "true", "yes")
+
+# Janela aceita para o ts da assinatura (0 desliga a checagem)
+MP_SIG_TOLERANCE_SEC = int(os.getenv("MP_SIG_TOLERANCE_SEC", "600"))
+
+# Sessão HTTP reaproveitada nas chamadas diretas à API do MP (keep-alive)
+_MP_HTTP = requests.Session()
+
+# HMAC-SHA256 com a secret já preparada: cada candidato da assinatura faz só .copy() + update
+_HMAC_SECRET = hmac.new(MP_WEBHOOK_SECRET.encode("utf-8"), digestmod=hashlib.sha256)
+
+pagamentos_bp = Blueprint("pagamentos", __name__)
+
+# =========================
+# Helpers gerais
+# =========================
+@lru_cache(maxsize=256)  # só depende do path (empresa + rota) e do BASE_URL fixo
+def _build_url(path: str) -> str:
+    return urljoin(BASE_URL + "/", path.lstrip("/"))
+
+def get_cfg(empresa: str) -> Dict[str, Any]:
+    # load_empresas() só reparseia quando o mtime do arquivo muda
+    cfg = load_empresas().get(empresa)
+    if not cfg or not cfg.get("mp_access_token"):
+        raise ValueError(f"Config MP ausente para empresa '{empresa}'")
+    return cfg
+
+@lru_cache(maxsize=32)
+def _sdk_por_token(token: str) -> mercadopago.SDK:
+    # chaveado pelo token (não pela empresa): trocar o token no config gera um SDK novo
+    return mercadopago.SDK(token)
+
+def get_mp_sdk(empresa: str) -> mercadopago.SDK:
+    cfg = get_cfg(empresa)
+    return _sdk_por_token(cfg["mp_access_token"])
+
+@lru_cache(maxsize=32)
+def _waha(base_url: str, session: str) -> Waha:
+    """Cliente WAHA reaproveitado por (base_url, sessão), em vez de um novo a cada pagamento aprovado."""
+    return Waha(base_url, session=session)
+
+def get_agenda_mod(empresa: str):
+    return importlib.import_module(f"scripts_empresas.{empresa}.agenda")
+
+def _iso_mp(dt_utc: datetime) -> str:
+    """UTC naive -> '2025-01-31T12:00:00.000Z' (formato de datas do MP), sem o strftime."""
+    return dt_utc.isoformat(timespec="seconds") + ".000Z"
+
+def _pref_expiration(minutes=20):
+    now = datetime.utcnow()
+    return {
+        "expires": True,
+        "expiration_date_from": _iso_mp(now),
+        "expiration_date_to": _iso_mp(now + timedelta(minutes=minutes)),
+    }
+
+def _sum_total(itens: List[Dict[str, Any]]) -> float:
+    return round(sum(float(i.get("unit_price", 0.0)) * int(i.get("quantity", 1)) for i in (itens or [])), 2)
+
+_BRL_SEP = str.maketrans(",.", ".,")  # 1,234.50 -> 1.234,50 numa passada só
+
+def _fmt_brl(v: float) -> str:
+    try:
+        return "R$ " + format(float(v), ",.2f").translate(_BRL_SEP)
+    except Exception:
+        return f"R$ {v}"
+
+def _debug(tag: str, data: Any = None):
+    """'data' pode ser um dict ou um callable que o devolve (só é chamado com MP_DEBUG ligado)."""
+    if not MP_DEBUG:
+        return
+    try:
+        if callable(data):
+            data = data()
+        print(f"[MP:{tag}] {orjson.dumps(data or {}).decode()[:2000]}")
+    except Exception:
+        print(f"[MP:{tag}] (payload não serializável)")
+
+# =========================
+# Assinatura do Webhook (opcional/soft)
+# =========================
+def _parse_sig(sig_hdr: str) -> tuple[Optional[str], Optional[str]]:
+    """
+    'ts=...,v1=...' -> (ts, v1) numa passada, parando assim que achar os dois.
+    Campos extras (v2, ...) ou sem '=' são ignorados; o que faltar vem como None.
+    """
+    ts = v1 = None
+    for part in sig_hdr.split(","):
+        k, _, v = part.partition("=")
+        k = k.strip()
+        if k == "ts":
+            ts = v.strip()
+        elif k == "v1":
+            v1 = v.strip()
+        else:
+            continue
+        if ts and v1:
+            break
+    return ts, v1
+
+def _manifesto_mp(req, ts_b: bytes) -> tuple:
+    """Base documentada do MP: 'id:<data.id>;request-id:<x-request-id>;ts:<ts>;' (omite o que faltar)."""
+    data_id = req.args.get("data.id") or ""
+    req_id = req.headers.get("x-request-id") or ""
+    partes = []
+    if data_id:
+        partes.append(b"id:" + (data_id.lower() if data_id.isalnum() else data_id).encode("utf-8") + b";")
+    if req_id:
+        partes.append(b"request-id:" + req_id.encode("utf-8") + b";")
+    partes.append(b"ts:" + ts_b + b";")
+    return tuple(partes)
+
+# Bases candidatas do HMAC, montadas sob demanda (a que casar primeiro evita montar as outras).
+# _SIG_ORDEM guarda a ordem de tentativa; quem casa ganha ponto e sobe pro começo da fila.
+_SIG_BASES = (
+    _manifesto_mp,
+    lambda req, ts_b: (ts_b, req.get_data() or b""),
+    lambda req, ts_b: (ts_b, b":", req.get_data() or b""),
+    lambda req, ts_b: (ts_b, req.path.encode("utf-8"), req.query_string or b""),
+    lambda req, ts_b: (ts_b, req.path.encode("utf-8")),
+    lambda req, ts_b: (req.path.encode("utf-8"), ts_b),
+    lambda req, ts_b: (ts_b,),
+)
+_sig_hits: Counter = Counter()
+_SIG_ORDEM = list(range(len(_SIG_BASES)))
+
+def _iter_candidates(req, ts_b: bytes):
+    for i in _SIG_ORDEM:
+        yield i, _SIG_BASES[i](req, ts_b)
+
+def _sig_acertou(i: int):
+    global _SIG_ORDEM
+    _sig_hits[i] += 1
+    if _SIG_ORDEM[0] != i:
+        # troca a lista inteira (atribuição atômica): quem está iterando segue na cópia antiga
+        _SIG_ORDEM = sorted(_SIG_ORDEM, key=lambda j: -_sig_hits[j])
+
+def _validar_assinatura(req) -> bool:
+    """
+    Validação 'soft' da assinatura (x-signature) do Mercado Pago.
+    - Se MP_WEBHOOK_SECRET vazio: True (não valida).
+    - Se sem header: True, a menos que MP_REQUIRE_SIGNATURE=true.
+    - Tenta bases comuns (varia por produto/região).
+    """
+    if not MP_WEBHOOK_SECRET:
+        return True
+
+    sig_hdr = req.headers.get("x-signature") or req.headers.get("X-Signature")
+    if not sig_hdr:
+        return not MP_REQUIRE_SIGNATURE
+
+    ts, v1 = _parse_sig(sig_hdr)
+    if not ts or not v1:
+        return not MP_REQUIRE_SIGNATURE
+
+    # ts fora da janela (ou que nem é número) é rejeitado antes de qualquer HMAC
+    if MP_SIG_TOLERANCE_SEC > 0:
+        try:
+            ts_sec = int(ts)
+        except ValueError:
+            return not MP_REQUIRE_SIGNATURE
+        if ts_sec > 10**11:  # veio em milissegundos
+            ts_sec //= 1000
+        if abs(time.time() - ts_sec) > MP_SIG_TOLERANCE_SEC:
+            _debug("sig.ts_fora_da_janela", {"ts": ts})
+            return not MP_REQUIRE_SIGNATURE
+
+    # compara digests em bytes: decodifica o v1 uma vez em vez de hex-codificar cada candidato
+    try:
+        v1_bytes = bytes.fromhex(v1)
+    except ValueError:
+        return not MP_REQUIRE_SIGNATURE
+
+    # tudo em bytes: o corpo cru vai direto pro HMAC (sem decode/encode) e cada base
+    # é alimentada por partes com update(), sem concatenar cópias do corpo
+    ts_b = ts.encode("utf-8")
+    for i, partes in _iter_candidates(req, ts_b):
+        h = _HMAC_SECRET.copy()  # chave já absorvida (ipad/opad); só falta a base
+        for parte in partes:
+            h.update(parte)
+        if hmac.compare_digest(h.digest(), v1_bytes):
+            _sig_acertou(i)
+            return True
+
+    _debug("sig.mismatch", {"ts": ts, "path": req.path, "qs": req.query_string.decode("utf-8", "replace"), "tried": len(_SIG_BASES)})
+    return not MP_REQUIRE_SIGNATURE
+
+# =========================
+# Utilitários de webhook
+# =========================
+# id numérico do pagamento no 'resource' (ignora querystring/sufixos depois do id)
+_RE_PAYMENT_ID = re.compile(r"/v1/payments/(\d+)")
+
+def _extract_payment_id(args_dict: dict, payload_dict: dict) -> Optional[str]:
+    # via querystring
+    if (args_dict.get("topic") or "").lower() == "payment" and args_dict.get("id"):
+        return str(args_dict.get("id"))
+
+    # via payload data.id
+    data_id = (payload_dict.get("data") or {}).get("id")
+    if data_id:
+        return str(data_id)
+
+    # via resource .../v1/payments/<id>
+    m = _RE_PAYMENT_ID.search(str(payload_dict.get("resource") or ""))
+    if m:
+        return m.group(1)
+
+    return None
+
+def _fetch_payment_with_sdk(mp_sdk: mercadopago.SDK, pid: str) -> Optional[dict]:
+    try:
+        res = mp_sdk.payment().get(pid)
+    except Exception as e:
+        _debug("payment.get.exc", {"id": pid, "error": str(e)})
+        return None
+    if res.get("status") != 200:
+        _debug("payment.get.bad", res)
+        return None
+    return res.get("response") or {}
+
+def _parse_ref(payment: dict) -> dict:
+    """external_reference do pagamento (JSON gerado por nós) -> dict; {} se vazio/inválido."""
+    try:
+        pld = orjson.loads(payment.get("external_reference") or "{}")
+    except (orjson.JSONDecodeError, TypeError):
+        return {}
+    return pld if isinstance(pld, dict) else {}
+
+def _process_approved_for_empresa(empresa: str, payment: dict, parsed_ref: Optional[dict] = None) -> None:
+    """Confirma na planilha e envia WhatsApp se approved. 'parsed_ref': external_reference já parseado."""
+    agenda = get_agenda_mod(empresa)
+    status = (payment.get("status") or "").lower()
+    if status != "approved":
+        return
+
+    # External reference -> nosso snapshot/contexto
+    pld = parsed_ref if parsed_ref is not None else _parse_ref(payment)
+
+    if pld.get("empresa") != empresa:
+        _debug("webhook.mismatch_empresa", {"payload_empresa": pld.get("empresa"), "route": empresa})
+        return
+
+    agendamento_id = pld.get("agendamento_id")
+    chat_id = pld.get("chat_id")
+    total = pld.get("total") or 0.0
+    servico_lbl = pld.get("servico") or "Serviço"
+
+    # Confirma na planilha (evita duplicar mensagens)
+    enviou_confirmacao = False
+    if agendamento_id:
+        try:
+            altered = agenda.confirmar_pagamento(agendamento_id)
+            enviou_confirmacao = bool(altered)
+        except Exception as e:
+            _debug("confirmar_pagamento.exc", {"error": str(e)})
+
+    # Monta resumo (snapshot)
+    try:
+        snap = agenda.obter_snapshot(agendamento_id) if agendamento_id else None
+    except Exception:
+        snap = None
+    itens = (snap or {}).get("itens") or []
+    if not total and snap:
+        total = (snap.get("total") or 0.0)
+
+    linhas = "\n".join(
+        [f"- {i.get('title')}: {_fmt_brl(i.get('unit_price', 0))}" for i in itens]
+    ) if itens else None
+
+    # Data/horário (se disponível)
+    data_txt, horario_txt = pld.get("data") or "", pld.get("horario") or ""
+    if hasattr(agenda, "obter_por_id") and agendamento_id:
+        try:
+            row = agenda.obter_por_id(agendamento_id)
+            if row:
+                try:
+                    d = row.get("Data")
+                    if hasattr(d, "strftime"):
+                        data_txt = d.strftime("%d/%m/%Y")
+                    else:
+                        data_txt = datetime.fromisoformat(str(d)).strftime("%d/%m/%Y")
+                except Exception:
+                    pass
+                horario_txt = str(row.get("Horário") or horario_txt)
+                servico_lbl = str(row.get("Serviço") or servico_lbl)
+        except Exception as e:
+            _debug("obter_por_id.exc", {"error": str(e)})
+
+    # Envia a confirmação no WhatsApp (apenas se houve transição de status)
+    if enviou_confirmacao and chat_id:
+        try:
+            emp_cfg = load_empresas()[empresa]
+            base_url = emp_cfg.get("base_url")
+            waha_session = emp_cfg.get("waha_session", "default")
+            waha = _waha(base_url, waha_session)
+
+            msg = (
+                "✅ *Pagamento aprovado*\n\n"
+                "🎉 *Agendamento concluído!*\n"
+                f"💈 {servico_lbl}\n"
+                f"📅 {data_txt}  🕒 {horario_txt}\n"
+            )
+            if linhas:
+                msg += f"\n🧾 Itens:\n{linhas}\n"
+            if total:
+                msg += f"Total: {_fmt_brl(total)}\n"
+            msg += "\nObrigado! Sessão encerrada ✅\nSe precisar, responda aqui. Para novo agendamento, digite *menu*."
+
+            waha.send_message(chat_id, msg)
+        except Exception as e:
+            _debug("whatsapp.send.exc", {"error": str(e)})
+
+# =========================
+# Checkout Pro (opcional)
+# =========================
+@pagamentos_bp.post("/<empresa>/create")
+def mp_create_preference(empresa: str):
+    mp = get_mp_sdk(empresa)
+    agenda = get_agenda_mod(empresa)
+
+    body = request.get_json(force=True) or {}
+    agendamento_id = body.get("agendamento_id")
+    chat_id = body.get("chat_id")
+    nome     = (body.get("nome") or "Cliente").strip()
+    insta    = (body.get("insta") or "").strip()
+    data_iso = body.get("data")
+    horario  = body.get("horario")
+    itens_in = body.get("itens") or []
+
+    if not (agendamento_id and chat_id and data_iso and horario):
+        return jsonify({"error": "missing_fields"}), 400
+
+    # Data
+    try:
+        dt = datetime.fromisoformat(data_iso).date()
+    except Exception:
+        return jsonify({"error": "invalid_date"}), 400
+
+    # Pode estar indisponível pela própria reserva; aceita se bater com a reserva
+    if not agenda.horario_disponivel(horario, dt):
+        try:
+            bate = agenda.reserva_bate(
+                agendamento_id=agendamento_id, data_ref=dt, horario_ref=horario, chat_id=chat_id
+            )
+        except AttributeError:
+            bate = False
+        if not bate:
+            return jsonify({"error": "slot_unavailable"}), 409
+
+    # Usa snapshot, se existir
+    itens = itens_in
+    total = None
+    try:
+        snap = agenda.obter_snapshot(agendamento_id)
+        if snap and (snap.get("itens") or []):
+            itens = snap["itens"]
+            total = float(snap.get("total") or 0.0)
+    except Exception:
+        pass
+    total = total if total is not None else _sum_total(itens)
+    servico_label = ", ".join([str(x.get("title","")).strip() for x in itens]) or "Serviço"
+
+    pref = {
+        "items": itens,
+        "payer": {"name": nome},
+        "auto_return": "approved",
+        "back_urls": {
+            "success": _build_url(f"/mp/{empresa}/return?status=success"),
+            "failure": _build_url(f"/mp/{empresa}/return?status=failure"),
+            "pending": _build_url(f"/mp/{empresa}/return?status=pending"),
+        },
+        "notification_url": _build_url(f"/mp/{empresa}/webhook"),
+        "statement_descriptor": get_cfg(empresa).get("statement_descriptor", "BARBEARIA"),
+        "external_reference": orjson.dumps({
+            "empresa": empresa,
+            "agendamento_id": agendamento_id,
+            "chat_id": chat_id,
+            "nome": nome,
+            "insta": insta,
+            "data": data_iso,
+            "horario": horario,
+            "servico": servico_label,
+            "total": total
+        }).decode("utf-8"),
+        **_pref_expiration(20),
+        "metadata": {
+            "empresa": empresa,
+            "agendamento_id": agendamento_id
+        }
+    }
+
+    # Idempotência
+    idem_key = f"pref:{empresa}:{chat_id}:{data_iso}:{horario}:{total}"
+    req_opts = RequestOptions()
+    req_opts.custom_headers = {"x-idempotency-key": idem_key}
+
+    _debug("pref.create.req", lambda: {"pref": pref, "idem": idem_key})
+    result = mp.preference().create(pref, req_opts)
+    _debug("pref.create.res", result)
+
+    if result.get("status") not in (200, 201):
+        return jsonify({"error": "mp_error", "details": result}), 502
+
+    resp = result["response"]
+    return jsonify({
+        "id": resp.get("id"),
+        "init_point": resp.get("init_point"),
+        "sandbox_init_point": resp.get("sandbox_init_point"),
+        "total": total
+    }), 200
+
+@pagamentos_bp.get("/<empresa>/return")
+def mp_return(empresa: str):
+    return "Pagamento processado. Você pode fechar esta janela.", 200
+
+# =========================
+# Processamento dos webhooks em segundo plano
+# =========================
+# O MP reenvia a notificação se não recebe resposta rápido: o handler só valida e enfileira.
+# Um pid tem no máximo um worker por vez. Notificação que chega durante o processamento
+# (ex.: payment.updated logo após o payment.created) não é descartada: fica marcada e o
+# worker consulta o pagamento de novo ao terminar, senão uma aprovação vista só na segunda
+# notificação se perderia (o MP já recebeu 200 e não reenvia).
+# confirmar_pagamento só muda Pendente -> Confirmado, então a reconsulta não duplica o WhatsApp.
+MP_WEBHOOK_WORKERS = int(os.getenv("MP_WEBHOOK_WORKERS", "8"))
+_WH_POOL = ThreadPoolExecutor(max_workers=MP_WEBHOOK_WORKERS, thread_name_prefix="mp-webhook")
+_pids_em_andamento: Dict[str, Optional[tuple]] = {}  # pid -> (fn, args) da reconsulta pendente, ou None
+_pids_em_andamento_lock = threading.Lock()
+
+def _enfileirar_webhook(pid: str, fn, *args) -> bool:
+    """
+    Agenda fn(*args) no pool. Se o pid já está sendo processado, só pede uma reconsulta
+    ao worker atual (várias notificações no meio viram uma só) e devolve False.
+    """
+    with _pids_em_andamento_lock:
+        if pid in _pids_em_andamento:
+            _pids_em_andamento[pid] = (fn, args)
+            return False
+        _pids_em_andamento[pid] = None
+
+    def _rodar():
+        tarefa = (fn, args)
+        while tarefa is not None:
+            f, a = tarefa
+            try:
+                f(*a)
+            except Exception:
+                print(f"[MP] Falha ao processar o webhook do pagamento {pid}:")
+                traceback.print_exc()
+            with _pids_em_andamento_lock:
+                tarefa = _pids_em_andamento.get(pid)
+                if tarefa is None:
+                    _pids_em_andamento.pop(pid, None)
+                else:
+                    _pids_em_andamento[pid] = None
+
+    try:
+        _WH_POOL.submit(_rodar)
+    except RuntimeError:
+        # pool encerrado (shutdown do processo): processa aqui mesmo
+        _rodar()
+    return True
+
+# =========================
+# Webhook por empresa (GET/HEAD/POST)
+# =========================
+@pagamentos_bp.get("/<empresa>/webhook")
+def mp_webhook_get_empresa(empresa: str):
+    # validação do painel
+    return jsonify({"status": "ok", "msg": "webhook alive", "empresa": empresa}), 200
+
+@pagamentos_bp.route("/<empresa>/webhook", methods=["HEAD"])
+def mp_webhook_head_empresa(empresa: str):
+    return ("", 200)
+
+@pagamentos_bp.post("/<empresa>/webhook")
+def mp_webhook_empresa(empresa: str):
+    # valida assinatura
+    if not _validar_assinatura(request):
+        return jsonify({"status": "invalid_signature"}), 401
+
+    mp = get_mp_sdk(empresa)
+
+    args = request.args or {}
+    payload = request.get_json(silent=True) or {}
+    _debug("webhook.in", lambda: {"empresa": empresa, "args": dict(args), "payload": payload})
+
+    pid = _extract_payment_id(args, payload)
+    if not pid:
+        _debug("webhook.no_pid", {"empresa": empresa})
+        return jsonify({"status": "ignored"}), 200
+
+    # consulta ao MP + confirmação + WhatsApp rodam no pool; o MP recebe o 200 na hora
+    if not _enfileirar_webhook(pid, _processar_webhook_empresa, empresa, mp, pid):
+        return jsonify({"status": "requeued"}), 200
+    return jsonify({"status": "queued"}), 200
+
+def _processar_webhook_empresa(empresa: str, mp: mercadopago.SDK, pid: str) -> None:
+    payment = _fetch_payment_with_sdk(mp, pid)
+    if not payment:
+        return
+    _process_approved_for_empresa(empresa, payment)
+
+# =========================
+# Webhook coringa (sem /<empresa>) — útil quando o painel está apontando para /mp/webhook
+# =========================
+@pagamentos_bp.get("/webhook")
+def mp_webhook_get_generic():
+    return jsonify({"status": "ok", "msg": "generic webhook alive"}), 200
+
+@pagamentos_bp.route("/webhook", methods=["HEAD"])
+def mp_webhook_head_generic():
+    return ("", 200)
+
+# O MP notifica o mesmo pagamento várias vezes (created/updated/retries): guarda pid -> empresa
+# e conta acertos por empresa, para o webhook coringa consultar primeiro o token certo
+PID_EMPRESA_MAX = 4096
+_pid_empresa: "OrderedDict[str, str]" = OrderedDict()
+_hits_empresa: Counter = Counter()
+_pid_lock = threading.Lock()
+
+def _empresas_por_probabilidade(pid: str, empresas: Dict[str, Any]) -> List[str]:
+    with _pid_lock:
+        conhecida = _pid_empresa.get(pid)
+        ordem = sorted(empresas, key=lambda e: -_hits_empresa[e])  # estável: empate mantém a ordem do config
+    if conhecida in empresas:
+        ordem.remove(conhecida)
+        ordem.insert(0, conhecida)
+    return ordem
+
+def _lembrar_pid(pid: str, empresa: str) -> None:
+    with _pid_lock:
+        _pid_empresa[pid] = empresa
+        _pid_empresa.move_to_end(pid)
+        if len(_pid_empresa) > PID_EMPRESA_MAX:
+            _pid_empresa.popitem(last=False)
+        _hits_empresa[empresa] += 1
+
+@pagamentos_bp.post("/webhook")
+def mp_webhook_generic():
+    # valida assinatura
+    if not _validar_assinatura(request):
+        return jsonify({"status": "invalid_signature"}), 401
+
+    args = request.args or {}
+    payload = request.get_json(silent=True) or {}
+    _debug("webhook.generic.in", lambda: {"args": dict(args), "payload": payload})
+
+    pid = _extract_payment_id(args, payload)
+    if not pid:
+        _debug("webhook.generic.no_pid")
+        return jsonify({"status": "ignored"}), 200
+
+    if not _enfileirar_webhook(pid, _processar_webhook_generico, pid):
+        return jsonify({"status": "requeued"}), 200
+    return jsonify({"status": "queued"}), 200
+
+def _processar_webhook_generico(pid: str) -> None:
+    # tenta buscar o pagamento usando cada token até achar (a empresa mais provável primeiro)
+    payment = None
+    empresa_ref = None
+    empresas = load_empresas()
+    for emp_key in _empresas_por_probabilidade(pid, empresas):
+        cfg = empresas[emp_key]
+        token = cfg.get("mp_access_token")
+        if not token:
+            continue
+        payment = _fetch_payment_with_sdk(_sdk_por_token(token), pid)
+        if not payment:
+            continue
+        # achou um pagamento; tenta extrair external_reference
+        pld = _parse_ref(payment)
+        empresa_ref = pld.get("empresa")
+        if empresa_ref and empresa_ref in empresas:
+            break
+        # se não achou empresa no external_reference, continua procurando
+        payment = None
+
+    if not payment or not empresa_ref:
+        _debug("webhook.generic.unresolved", {"pid": pid})
+        return
+
+    _lembrar_pid(pid, empresa_ref)
+    _process_approved_for_empresa(empresa_ref, payment, parsed_ref=pld)
+
+# =========================
+# Diagnóstico (opcional)
+# =========================
+@pagamentos_bp.get("/<empresa>/payment_methods")
+def mp_list_payment_methods(empresa: str):
+    try:
+        token = get_cfg(empresa)["mp_access_token"]
+    except Exception as e:
+        return jsonify({"error": "cfg_error", "message": str(e)}), 400
+
+    try:
+        resp = _MP_HTTP.get(
+            "https://api.mercadopago.com/v1/payment_methods",
+            headers={"Authorization": f"Bearer {token}"},
+            timeout=10
+        )
+    except Exception as e:
+        return jsonify({"error": "network_error", "message": str(e)}), 502
+
+    if resp.status_code != 200:
+        return jsonify({"error": "mp_error", "status": resp.status_code, "details": resp.text}), 502
+
+    data = resp.json() if isinstance(resp.json(), list) else []
+    methods = []
+    pix_available = False
+    for m in data:
+        mid = (m.get("id") or "").lower()
+        status = (m.get("status") or m.get("status_detail") or "").lower()
+        name = m.get("name") or m.get("description") or ""
+        methods.append({
+            "id": mid,
+            "name": name,
+            "payment_type_id": m.get("payment_type_id"),
+            "status": status
+        })
+        if mid == "pix" and status == "active":
+            pix_available = True
+
+    return jsonify({"pix_available": pix_available, "count": len(methods), "methods": methods}), 200
+
+# =========================
+# PIX DIRETO (Payments API)
+# =========================
+@pagamentos_bp.post("/<empresa>/pix")
+def mp_create_pix(empresa: str):
+    """
+    Cria um pagamento PIX (copia e cola) sem exigir login/app do MP.
+    Retorna o qr_code (string copia e cola) e o ticket_url (página do MP).
+    """
+    mp = get_mp_sdk(empresa)
+    agenda = get_agenda_mod(empresa)
+
+    body = request.get_json(force=True) or {}
+    agendamento_id = body.get("agendamento_id")
+    chat_id = body.get("chat_id")
+    nome     = (body.get("nome") or "Cliente").strip()
+    insta    = (body.get("insta") or "").strip()
+    data_iso = body.get("data")
+    horario  = body.get("horario")
+
+    if not (agendamento_id and chat_id and data_iso and horario):
+        return jsonify({"error": "missing_fields"}), 400
+
+    # validando data/slot
+    try:
+        dt = datetime.fromisoformat(data_iso).date()
+    except Exception:
+        return jsonify({"error": "invalid_date"}), 400
+
+    if not agenda.horario_disponivel(horario, dt):
+        try:
+            bate = agenda.reserva_bate(
+                agendamento_id=agendamento_id, data_ref=dt, horario_ref=horario, chat_id=chat_id
+            )
+        except AttributeError:
+            bate = False
+        if not bate:
+            return jsonify({"error": "slot_unavailable"}), 409
+
+    # Snapshot de itens/total
+    itens = []
+    total = 0.0
+    servico_label = "Serviço"
+    try:
+        snap = agenda.obter_snapshot(agendamento_id)
+        if snap and (snap.get("itens") or []):
+            itens = snap["itens"]
+            total = float(snap.get("total") or 0.0)
+            servico_label = ", ".join([str(x.get("title","")).strip() for x in itens]) or servico_label
+    except Exception:
+        pass
+    if not itens or total <= 0:
+        return jsonify({"error": "no_items"}), 400
+
+    # PIX body
+    payer_email = body.get("payer_email") or f"cliente+{agendamento_id.lower()}@example.com"
+    exp_to = datetime.utcnow() + timedelta(minutes=20)
+    exp_str = _iso_mp(exp_to)
+
+    payment_data = {
+        "transaction_amount": total,
+        "description": f"Agendamento {servico_label} — {data_iso} {horario}",
+        "payment_method_id": "pix",
+        "payer": {
+            "email": payer_email,
+            "first_name": nome[:60]
+        },
+        "external_reference": orjson.dumps({
+            "empresa": empresa,
+            "agendamento_id": agendamento_id,
+            "chat_id": chat_id,
+            "nome": nome,
+            "insta": insta,
+            "data": data_iso,
+            "horario": horario,
+            "servico": servico_label,
+            "total": total
+        }).decode("utf-8"),
+        "metadata": {
+            "empresa": empresa,
+            "agendamento_id": agendamento_id
+        },
+        "date_of_expiration": exp_str,
+        "notification_url": _build_url(f"/mp/{empresa}/webhook")  # garante notificação por payment
+    }
+
+    idem_key = f"pix:{empresa}:{chat_id}:{data_iso}:{horario}:{total}"
+    req_opts = RequestOptions()
+    req_opts.custom_headers = {"X-Idempotency-Key": idem_key}
+
+    _debug("pix.create.req", lambda: {"payment_data": payment_data, "idem": idem_key})
+    try:
+        result = mp.payment().create(payment_data, req_opts)
+    except Exception as e:
+        _debug("pix.create.exc", {"error": str(e)})
+        return jsonify({"error": "mp_exception", "message": str(e)}), 502
+    _debug("pix.create.res", result)
+
+    status = result.get("status")
+    if status not in (200, 201):
+        return jsonify({"error": "mp_error", "status": status, "details": result}), 502
+
+    resp = result.get("response", {}) or {}
+    poi = resp.get("point_of_interaction", {}) or {}
+    tx = poi.get("transaction_data", {}) or {}
+
+    return jsonify({
+        "payment_id": resp.get("id"),
+        "status": resp.get("status"),
+        "qr_code": tx.get("qr_code"),        # PIX copia e cola
+        "ticket_url": tx.get("ticket_url"),  # página web com QR (sem login)
+        "total": total
+    }), 200
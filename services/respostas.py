@@ -0,0 +1,11 @@
+# services/respostas.py
+from flask import Response
+
+# Corpos JSON fixos das respostas dos fluxos ao webhook, serializados uma única vez
+# (sem passar pelo jsonify). O Response é novo a cada chamada, já que o Flask pode
+# alterar headers do objeto devolvido.
+BODY_SUCCESS = b'{"status":"success"}'
+BODY_IGNORED = b'{"status":"ignored"}'
+
+def resposta_json(body: bytes, status: int = 200) -> Response:
+    return Response(body, status=status, mimetype="application/json")
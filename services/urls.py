@@ -1,7 +1,7 @@
-# services/urls.py
-from urllib.parse import urljoin
-
-def build_url(base: str, path: str) -> str:
-    if not base.endswith('/'):
-        base += '/'
-    return urljoin(base, path.lstrip('/'))
+# services/urls.py
+from urllib.parse import urljoin
+
+def build_url(base: str, path: str) -> str:
+    if not base.endswith('/'):
+        base += '/'
+    return urljoin(base, path.lstrip('/'))
@@ -1,171 +1,219 @@
-# services/waha.py
-import os
-import requests
-from typing import Optional
-
-class Waha:
-    """
-    Cliente minimalista para WAHA.
-    - send_message(chat_id, text): envia texto.
-    - send_image_base64(chat_id, base64_str, filename='img.png', caption=None): envia imagem (ex.: QR em base64).
-    - get_history_messages(chat_id, limit=50): histórico.
-    - start_typing(chat_id) / stop_typing(chat_id): indicador de digitação.
-    """
-
-    def __init__(self, base_url: str, session: Optional[str] = "default", api_key: Optional[str] = None):
-        self.__api_url = (base_url or "").rstrip("/")
-        # Permite desabilitar o uso explícito de sessão caso o WAHA utilize apenas a sessão padrão
-        self.__session = (session or None)
-        self.__headers = {"Content-Type": "application/json"}
-
-        # Se você proteger o WAHA com WAHA_API_KEY, envie o header
-        self.__api_key = api_key or os.getenv("WAHA_API_KEY", "")
-        if self.__api_key:
-            self.__headers["WAHA-API-KEY"] = self.__api_key
-
-        # Tentativa de health-check (não crítico)
-        try:
-            r = requests.get(f"{self.__api_url}/api/version", headers=self.__headers, timeout=5)
-            print("[WAHA] health:", r.status_code, str(r.text)[:200])
-        except Exception as e:
-            print("[WAHA] Erro ao verificar health:", repr(e))
-
-    # ----------------------
-    # Envios básicos
-    # ----------------------
-    def send_message(self, chat_id: str, message: str):
-        url = f"{self.__api_url}/api/sendText"
-        payload = {"chatId": chat_id, "text": message}
-        if self.__session:
-            payload["session"] = self.__session
-        try:
-            resp = requests.post(url, json=payload, headers=self.__headers, timeout=10)
-            if resp.status_code >= 400 and self.__session:
-                # fallback: tenta novamente sem enviar session para compatibilidade com instâncias single-session
-                payload.pop("session", None)
-                resp = requests.post(url, json=payload, headers=self.__headers, timeout=10)
-            if resp.status_code >= 400:
-                print("[WAHA] send_message erro:", resp.status_code, str(resp.text)[:300])
-        except Exception as e:
-            print("[WAHA] Erro send_message:", repr(e))
-
-    def send_image_base64(
-        self,
-        chat_id: str,
-        base64_str: str,
-        filename: str = "image.png",
-        caption: Optional[str] = None
-    ):
-        """
-        Envia uma imagem em base64.
-        - Tenta /api/sendFile com data URI (file: {name, data})
-        - Se falhar, tenta /api/sendImage com campo 'base64'
-        - Se ainda falhar, faz fallback para uma mensagem de texto
-        Obs.: Aceita tanto string "pura" base64 quanto "data:image/png;base64,XXXX..."
-        """
-        if not base64_str:
-            self.send_message(chat_id, "⚠️ Não foi possível anexar a imagem no momento.")
-            return
-
-        # Garante o prefixo data URI se vier só o base64 puro
-        if base64_str.startswith("data:image"):
-            data_uri = base64_str
-            # extrai a parte base64 pura para o /sendImage
-            try:
-                base64_puro = base64_str.split(",", 1)[1]
-            except Exception:
-                base64_puro = base64_str
-        else:
-            data_uri = f"data:image/png;base64,{base64_str}"
-            base64_puro = base64_str
-
-        # 1) Tenta /api/sendFile (formato mais flexível nas versões recentes)
-        url_file = f"{self.__api_url}/api/sendFile"
-        payload_file = {
-            "chatId": chat_id,
-            "file": {
-                "name": filename,
-                "data": data_uri
-            }
-        }
-        if self.__session:
-            payload_file["session"] = self.__session
-        if caption:
-            payload_file["caption"] = caption
-
-        try:
-            resp = requests.post(url_file, json=payload_file, headers=self.__headers, timeout=15)
-            if 200 <= resp.status_code < 300:
-                return
-            else:
-                print("[WAHA] send_image_base64 (/sendFile) falhou:", resp.status_code, str(resp.text)[:300])
-        except Exception as e:
-            print("[WAHA] Exceção /sendFile:", repr(e))
-
-        # 2) Tenta /api/sendImage (algumas versões usam 'base64' diretamente)
-        url_img = f"{self.__api_url}/api/sendImage"
-        payload_img = {
-            "chatId": chat_id,
-            "base64": base64_puro
-        }
-        if self.__session:
-            payload_img["session"] = self.__session
-        if caption:
-            payload_img["caption"] = caption
-
-        try:
-            resp = requests.post(url_img, json=payload_img, headers=self.__headers, timeout=15)
-            if 200 <= resp.status_code < 300:
-                return
-            else:
-                print("[WAHA] send_image_base64 (/sendImage) falhou:", resp.status_code, str(resp.text)[:300])
-        except Exception as e:
-            print("[WAHA] Exceção /sendImage:", repr(e))
-
-        # 3) Fallback: texto
-        self.send_message(chat_id, "⚠️ Não consegui enviar a imagem agora. Tente novamente daqui a pouco.")
-
-    # ----------------------
-    # Utilidades
-    # ----------------------
-    def get_history_messages(self, chat_id: str, limit: int = 50):
-        # Rota comum (ajuste conforme sua versão do WAHA)
-        if self.__session:
-            url = f"{self.__api_url}/api/{self.__session}/chats/{chat_id}/messages"
-        else:
-            url = f"{self.__api_url}/api/chats/{chat_id}/messages"
-        try:
-            resp = requests.get(url, params={"limit": limit, "downloadMedia": "false"},
-                                headers=self.__headers, timeout=10)
-            if resp.status_code >= 400:
-                print("[WAHA] get_history_messages erro:", resp.status_code, str(resp.text)[:300])
-                return []
-            data = resp.json()
-            return data if isinstance(data, list) else []
-        except Exception as e:
-            print("[WAHA] Erro get_history_messages:", repr(e))
-            return []
-
-    def start_typing(self, chat_id: str):
-        url = f"{self.__api_url}/api/startTyping"
-        payload = {"chatId": chat_id}
-        if self.__session:
-            payload["session"] = self.__session
-
-        try:
-            requests.post(url, json=payload, headers=self.__headers, timeout=5)
-        except Exception as e:
-            print("[WAHA] Erro start_typing:", repr(e))
-
-    def stop_typing(self, chat_id: str):
-        url = f"{self.__api_url}/api/stopTyping"
-        payload = {"chatId": chat_id}
-        if self.__session:
-            payload["session"] = self.__session
-        
-        # *** CORREÇÃO DE LÓGICA E INDENTAÇÃO AQUI ***
-        # O 'try' deve ficar fora do 'if' e a linha 'requests.post' deve ser indentada
-        try:
-            requests.post(url, json=payload, headers=self.__headers, timeout=5)
-        except Exception as e:
+# services/waha.py
+import os
+import threading
+from functools import lru_cache
+import orjson
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import Optional, Union
+
+# Uma sessão HTTP para o processo inteiro: todas as instâncias de Waha reaproveitam
+# as conexões keep-alive com o WAHA (sem novo handshake TCP/TLS a cada envio).
+# O Retry só repete métodos idempotentes (GET/HEAD...): um sendText nunca sai duplicado.
+_HTTP = requests.Session()
+_adapter = HTTPAdapter(
+    pool_connections=8,
+    pool_maxsize=32,
+    max_retries=Retry(total=2, backoff_factor=0.2, status_forcelist=[502, 503, 504], raise_on_status=False),
+)
+_HTTP.mount("http://", _adapter)
+_HTTP.mount("https://", _adapter)
+
+def encode_text(text: str) -> bytes:
+    """
+    Serializa um texto fixo uma única vez (string JSON em UTF-8) para reaproveitar em send_message.
+    Ex.: MENU_BYTES = encode_text(MENU); waha.send_message(chat_id, MENU_BYTES)
+    """
+    return orjson.dumps(text)
+
+# Acentos do português -> ASCII, num único str.translate (só minúsculas: o texto já passa por lower())
+_SEM_ACENTOS = str.maketrans("áàâãäéèêëíìîïóòôõöúùûüç", "aaaaaeeeeiiiiooooouuuuc")
+
+def normalizar_texto(text: Optional[str]) -> str:
+    """Texto recebido -> chave de comparação: "  Não " e "nao" viram "nao"."""
+    return (text or "").strip().lower().translate(_SEM_ACENTOS)
+
+@lru_cache(maxsize=32)
+def _health_check(api_url: str, api_key: str) -> None:
+    def _check():
+        headers = {"WAHA-API-KEY": api_key} if api_key else {}
+        try:
+            r = _HTTP.get(f"{api_url}/api/version", headers=headers, timeout=5)
+            print("[WAHA] health:", r.status_code, str(r.text)[:200])
+        except Exception as e:
+            print("[WAHA] Erro ao verificar health:", repr(e))
+    threading.Thread(target=_check, name="waha-health", daemon=True).start()
+
+class Waha:
+    """
+    Cliente minimalista para WAHA.
+    - send_message(chat_id, text): envia texto (str ou bytes de encode_text).
+    - send_messages(chat_id, [t1, t2, ...]): junta os textos do mesmo turno num envio só.
+    - send_image_base64(chat_id, base64_str, filename='img.png', caption=None): envia imagem (ex.: QR em base64).
+    - get_history_messages(chat_id, limit=50): histórico.
+    - start_typing(chat_id) / stop_typing(chat_id): indicador de digitação.
+    """
+
+    def __init__(self, base_url: str, session: Optional[str] = "default", api_key: Optional[str] = None):
+        self.__api_url = (base_url or "").rstrip("/")
+        # Permite desabilitar o uso explícito de sessão caso o WAHA utilize apenas a sessão padrão
+        self.__session = (session or None)
+        self.__session_field = b',"session":' + orjson.dumps(self.__session) if self.__session else b""
+        self.__headers = {"Content-Type": "application/json"}
+
+        # Se você proteger o WAHA com WAHA_API_KEY, envie o header
+        self.__api_key = api_key or os.getenv("WAHA_API_KEY", "")
+        if self.__api_key:
+            self.__headers["WAHA-API-KEY"] = self.__api_key
+
+        # Health-check (não crítico): uma vez por URL no processo, numa thread, sem travar quem construiu
+        _health_check(self.__api_url, self.__api_key)
+
+    # ----------------------
+    # Envios básicos
+    # ----------------------
+    def send_message(self, chat_id: str, message: Union[str, bytes]):
+        url = f"{self.__api_url}/api/sendText"
+        # corpo montado em bytes: texto fixo pré-serializado (encode_text) entra sem novo encode
+        text_json = message if isinstance(message, bytes) else orjson.dumps(message)
+        body = b'{"chatId":' + orjson.dumps(chat_id) + b',"text":' + text_json
+        try:
+            if self.__session:
+                resp = _HTTP.post(url, data=body + self.__session_field + b"}", headers=self.__headers, timeout=10)
+                if resp.status_code >= 400:
+                    # fallback: tenta novamente sem enviar session para compatibilidade com instâncias single-session
+                    resp = _HTTP.post(url, data=body + b"}", headers=self.__headers, timeout=10)
+            else:
+                resp = _HTTP.post(url, data=body + b"}", headers=self.__headers, timeout=10)
+            if resp.status_code >= 400:
+                print("[WAHA] send_message erro:", resp.status_code, str(resp.text)[:300])
+        except Exception as e:
+            print("[WAHA] Erro send_message:", repr(e))
+
+    def send_messages(self, chat_id: str, messages, sep: str = "\n\n"):
+        # o WAHA não tem envio em lote: juntar os textos economiza uma ida à API por mensagem
+        partes = [m for m in messages if m]
+        if partes:
+            self.send_message(chat_id, sep.join(partes))
+
+    def send_image_base64(
+        self,
+        chat_id: str,
+        base64_str: str,
+        filename: str = "image.png",
+        caption: Optional[str] = None
+    ):
+        """
+        Envia uma imagem em base64.
+        - Tenta /api/sendFile com data URI (file: {name, data})
+        - Se falhar, tenta /api/sendImage com campo 'base64'
+        - Se ainda falhar, faz fallback para uma mensagem de texto
+        Obs.: Aceita tanto string "pura" base64 quanto "data:image/png;base64,XXXX..."
+        """
+        if not base64_str:
+            self.send_message(chat_id, "⚠️ Não foi possível anexar a imagem no momento.")
+            return
+
+        # Garante o prefixo data URI se vier só o base64 puro
+        if base64_str.startswith("data:image"):
+            data_uri = base64_str
+            # extrai a parte base64 pura para o /sendImage
+            try:
+                base64_puro = base64_str.split(",", 1)[1]
+            except Exception:
+                base64_puro = base64_str
+        else:
+            data_uri = f"data:image/png;base64,{base64_str}"
+            base64_puro = base64_str
+
+        # 1) Tenta /api/sendFile (formato mais flexível nas versões recentes)
+        url_file = f"{self.__api_url}/api/sendFile"
+        payload_file = {
+            "chatId": chat_id,
+            "file": {
+                "name": filename,
+                "data": data_uri
+            }
+        }
+        if self.__session:
+            payload_file["session"] = self.__session
+        if caption:
+            payload_file["caption"] = caption
+
+        try:
+            resp = _HTTP.post(url_file, json=payload_file, headers=self.__headers, timeout=15)
+            if 200 <= resp.status_code < 300:
+                return
+            else:
+                print("[WAHA] send_image_base64 (/sendFile) falhou:", resp.status_code, str(resp.text)[:300])
+        except Exception as e:
+            print("[WAHA] Exceção /sendFile:", repr(e))
+
+        # 2) Tenta /api/sendImage (algumas versões usam 'base64' diretamente)
+        url_img = f"{self.__api_url}/api/sendImage"
+        payload_img = {
+            "chatId": chat_id,
+            "base64": base64_puro
+        }
+        if self.__session:
+            payload_img["session"] = self.__session
+        if caption:
+            payload_img["caption"] = caption
+
+        try:
+            resp = _HTTP.post(url_img, json=payload_img, headers=self.__headers, timeout=15)
+            if 200 <= resp.status_code < 300:
+                return
+            else:
+                print("[WAHA] send_image_base64 (/sendImage) falhou:", resp.status_code, str(resp.text)[:300])
+        except Exception as e:
+            print("[WAHA] Exceção /sendImage:", repr(e))
+
+        # 3) Fallback: texto
+        self.send_message(chat_id, "⚠️ Não consegui enviar a imagem agora. Tente novamente daqui a pouco.")
+
+    # ----------------------
+    # Utilidades
+    # ----------------------
+    def get_history_messages(self, chat_id: str, limit: int = 50):
+        # Rota comum (ajuste conforme sua versão do WAHA)
+        if self.__session:
+            url = f"{self.__api_url}/api/{self.__session}/chats/{chat_id}/messages"
+        else:
+            url = f"{self.__api_url}/api/chats/{chat_id}/messages"
+        try:
+            resp = _HTTP.get(url, params={"limit": limit, "downloadMedia": "false"},
+                                headers=self.__headers, timeout=10)
+            if resp.status_code >= 400:
+                print("[WAHA] get_history_messages erro:", resp.status_code, str(resp.text)[:300])
+                return []
+            data = resp.json()
+            return data if isinstance(data, list) else []
+        except Exception as e:
+            print("[WAHA] Erro get_history_messages:", repr(e))
+            return []
+
+    def start_typing(self, chat_id: str):
+        url = f"{self.__api_url}/api/startTyping"
+        payload = {"chatId": chat_id}
+        if self.__session:
+            payload["session"] = self.__session
+
+        try:
+            _HTTP.post(url, json=payload, headers=self.__headers, timeout=5)
+        except Exception as e:
+            print("[WAHA] Erro start_typing:", repr(e))
+
+    def stop_typing(self, chat_id: str):
+        url = f"{self.__api_url}/api/stopTyping"
+        payload = {"chatId": chat_id}
+        if self.__session:
+            payload["session"] = self.__session
+        
+        # *** CORREÇÃO DE LÓGICA E INDENTAÇÃO AQUI ***
+        # O 'try' deve ficar fora do 'if' e a linha 'requests.post' deve ser indentada
+        try:
+            _HTTP.post(url, json=payload, headers=self.__headers, timeout=5)
+        except Exception as e:
             print("[WAHA] Erro stop_typing:", repr(e))
\ No newline at end of file